@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持仓服务基准测试
+
+在临时SQLite数据库中生成 N个策略 × M条持仓 的模拟数据（其中一部分为 ADJUSTMENT_ 调整策略），
+测量汇总计算、数据校验、序列化、RSA验签以及通过 Flask test client 的完整接口耗时。
+
+用法:
+    python benchmarks/run_benchmarks.py                                   # 默认规模
+    python benchmarks/run_benchmarks.py -n 200 -m 100 --output result.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json          # 与基线对比，退化超过阈值时返回1
+    python benchmarks/run_benchmarks.py --only aggregation,endpoint       # 只运行部分分组
+
+不会读取或修改 src/config.py，所有配置、密钥和数据库都在临时目录中生成。
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(PROJECT_ROOT, 'src')
+
+CONFIG_TEMPLATE = '''
+SQLALCHEMY_DATABASE_URI = {database_uri!r}
+API_HOST = '127.0.0.1'
+API_PORT = 5366
+CRYPTO_AUTH_CONFIG = {{
+    'ENABLED': True,
+    'PRIVATE_KEY_FILE': {private_key_file!r},
+    'PUBLIC_KEY_FILE': {public_key_file!r},
+    'TOKEN_MAX_AGE': 300,
+}}
+METRICS_CONFIG = {{
+    'DIRECTORY': {metrics_directory!r},
+}}
+'''
+
+
+class BenchmarkRunner:
+    """执行并记录单项基准测试"""
+
+    def __init__(self, repeat, warmup, only=None):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.only = only
+        self.results = {}
+        self.group = None
+
+    def enabled(self, name):
+        return not self.only or any(name.startswith(prefix) for prefix in self.only)
+
+    def measure(self, name, func, setup=None, repeat=None):
+        """多次执行 func 并记录耗时（毫秒），setup 的返回值作为 func 的参数且不计入耗时"""
+        if not self.enabled(name):
+            return None
+        if self.group:
+            print(f"\n[{self.group}]")
+            self.group = None
+        repeat = repeat or self.repeat
+        timings = []
+        for index in range(self.warmup + repeat):
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            elapsed = (time.perf_counter() - start) * 1000
+            if index >= self.warmup:
+                timings.append(elapsed)
+
+        timings.sort()
+        result = {
+            'repeat': repeat,
+            'min_ms': round(timings[0], 4),
+            'median_ms': round(statistics.median(timings), 4),
+            'mean_ms': round(statistics.fmean(timings), 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+            'max_ms': round(timings[-1], 4)
+        }
+        self.results[name] = result
+        print(f"  {name:<40} 中位数 {result['median_ms']:>10.3f} ms   p95 {result['p95_ms']:>10.3f} ms")
+        return result
+
+
+class BenchmarkContext:
+    """临时环境：配置文件、密钥、数据库和已加载的应用"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='jq2qmt-bench-')
+        self.random = random.Random(args.seed)
+        # 大批量上传数据使用单独的随机数序列，不影响其他分组生成的数据
+        self.upload_random = random.Random(args.seed + 1)
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._write_config()
+
+        sys.path.insert(0, SRC_DIR)
+        sys.path.insert(0, self.workdir)
+        import app as app_module
+        import models.models as models
+        import auth.simple_crypto_auth as auth_module
+        self.app_module = app_module
+        self.app = app_module.app
+        self.models = models
+        self.auth = auth_module
+        self.client = self.app.test_client()
+        self.strategy_names = []
+        self.sample_positions = []
+
+    def _write_config(self):
+        private_key_file = os.path.join(self.workdir, 'private.pem')
+        public_key_file = os.path.join(self.workdir, 'public.pem')
+        with open(private_key_file, 'wb') as f:
+            f.write(self.private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ))
+        with open(public_key_file, 'wb') as f:
+            f.write(self.private_key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo
+            ))
+
+        if self.args.database_uri:
+            database_uri = self.args.database_uri
+        elif self.args.database == 'memory':
+            database_uri = 'sqlite://'
+        else:
+            database_uri = 'sqlite:///' + os.path.join(self.workdir, 'bench.db')
+        with open(os.path.join(self.workdir, 'config.py'), 'w', encoding='utf-8') as f:
+            f.write(CONFIG_TEMPLATE.format(
+                database_uri=database_uri,
+                private_key_file=private_key_file,
+                public_key_file=public_key_file,
+                metrics_directory=os.path.join(self.workdir, 'metrics')
+            ))
+
+    def make_positions(self, count, allow_negative=False):
+        """生成 count 条不重复代码的模拟持仓"""
+        universe = self.args.universe
+        codes = self.random.sample(range(universe), min(count, universe))
+        positions = []
+        for code in codes:
+            volume = self.random.randrange(1, 100) * 100
+            if allow_negative and self.random.random() < 0.5:
+                volume = -volume
+            positions.append({
+                'code': f'{code:06d}.{"XSHG" if code % 2 else "XSHE"}',
+                'name': f'股票{code}',
+                'volume': volume,
+                'cost': round(self.random.uniform(1, 100), 2)
+            })
+        return positions
+
+    def populate(self):
+        """批量写入模拟数据，并重建汇总表"""
+        models = self.models
+        db = models.db
+        adjustment_count = int(self.args.strategies * self.args.adjustment_ratio)
+        with self.app.app_context():
+            for index in range(self.args.strategies):
+                is_adjustment = index < adjustment_count
+                name = f'ADJUSTMENT_BENCH_{index:05d}' if is_adjustment else f'BENCH_{index:05d}'
+                strategy = models.StrategyPosition(strategy_name=name, positions_blob=[])
+                db.session.add(strategy)
+                db.session.flush()
+                positions = self.make_positions(self.args.positions, allow_negative=is_adjustment)
+                db.session.bulk_insert_mappings(models.PositionItem, [
+                    dict(pos, strategy_id=strategy.id) for pos in positions
+                ])
+                self.strategy_names.append(name)
+            models.PositionAggregate.rebuild()
+            models.DataVersion.bump(models.DataVersion.POSITIONS)
+            db.session.commit()
+        self.sample_positions = self.make_positions(self.args.positions)
+
+    def make_upload_positions(self, count, allow_negative=False):
+        """生成 count 条代码连续、不受代码池大小限制的上传持仓，用于大批量上传测试"""
+        rng = self.upload_random
+        positions = []
+        for code in range(count):
+            volume = rng.randrange(1, 100) * 100
+            if allow_negative and rng.random() < 0.5:
+                volume = -volume
+            positions.append({
+                'code': f'{code:06d}.{"XSHG" if code % 2 else "XSHE"}',
+                'name': f'股票{code}',
+                'volume': volume,
+                'cost': round(rng.uniform(1, 100), 2)
+            })
+        return positions
+
+    def make_rsa_token(self, client_id='bench'):
+        """生成与 JQQMTAPI 相同格式的RSA认证令牌"""
+        auth_data = {'client_id': client_id, 'timestamp': int(time.time()), 'nonce': os.urandom(8).hex()}
+        signature = self.private_key.sign(
+            json.dumps(auth_data, sort_keys=True).encode('utf-8'),
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+            hashes.SHA256()
+        )
+        auth_info = {'auth_data': auth_data, 'signature': base64.b64encode(signature).decode('utf-8')}
+        return auth_data, auth_info['signature'], base64.b64encode(json.dumps(auth_info).encode('utf-8')).decode('utf-8')
+
+
+def bench_aggregation(ctx, runner):
+    models = ctx.models
+    filtered_names = ctx.strategy_names[-5:]
+    with ctx.app.app_context():
+        runner.measure('aggregation.compute_total_positions', lambda: models.StrategyPosition.compute_total_positions(None, True))
+        runner.measure('aggregation.aggregate_table', lambda: models.PositionAggregate.get_total_positions(True))
+        runner.measure('aggregation.filtered_5_strategies',
+                       lambda: models.StrategyPosition.get_total_positions(filtered_names, True))
+
+
+def assert_equivalent_totals(expected, actual, engine):
+    """数据库汇总的浮点求和顺序不固定，平均成本按相对误差比较，代码顺序、名称和数量必须相同"""
+    expected_codes = [pos['code'] for pos in expected]
+    actual_codes = [pos['code'] for pos in actual]
+    expected = {pos['code']: pos for pos in expected}
+    actual = {pos['code']: pos for pos in actual}
+    if expected.keys() != actual.keys():
+        raise AssertionError(f'汇总引擎 {engine} 的代码集合不一致: '
+                             f'缺少 {sorted(expected.keys() - actual.keys())[:5]}，多出 {sorted(actual.keys() - expected.keys())[:5]}')
+    if expected_codes != actual_codes:
+        raise AssertionError(f'汇总引擎 {engine} 的代码顺序不一致')
+    for code, pos in expected.items():
+        other = actual[code]
+        if (pos['name'] != other['name'] or not math.isclose(pos['total_volume'], other['total_volume'], rel_tol=1e-12)
+                or not math.isclose(pos['avg_cost'], other['avg_cost'], rel_tol=1e-9)):
+            raise AssertionError(f'汇总引擎 {engine} 的结果不一致: {pos} != {other}')
+
+
+def bench_aggregation_engines(ctx, runner):
+    """各汇总引擎的耗时和结果一致性
+
+    columns.* 只计算已加载到内存的持仓（结果必须与逐条计算逐位相同），
+    query.* 包含数据库查询和传输（sql 引擎在数据库中 GROUP BY）。
+    """
+    import models.aggregation as aggregation
+    models = ctx.models
+    with ctx.app.app_context():
+        dialect = models.db.engine.dialect.name
+        strategies = models.StrategyPosition.query.all()
+        columns = models.StrategyPosition.load_position_columns(strategies)
+
+        expected = aggregation.aggregate_python(*columns)
+        medians = {}
+        for engine in aggregation.available_engines():
+            result = aggregation.aggregate_positions(*columns, engine=engine)
+            if result != expected or any(type(a['total_volume']) is not type(b['total_volume'])
+                                         for a, b in zip(result, expected)):
+                raise AssertionError(f'汇总引擎 {engine} 的结果与逐条计算不一致')
+            measured = runner.measure(f'aggregation_engine.columns.{engine}',
+                                      lambda engine=engine: aggregation.aggregate_positions(*columns, engine=engine))
+            if measured:
+                medians[engine] = measured['median_ms']
+        if aggregation.NUMPY not in aggregation.available_engines():
+            if medians:
+                print('  未安装NumPy，只测试逐条计算')
+        elif len(medians) == 2 and medians[aggregation.NUMPY]:
+            print(f"  {len(columns[0])} 行持仓，NumPy 加速 {medians[aggregation.PYTHON] / medians[aggregation.NUMPY]:.1f} 倍")
+
+        # 与数据库方言相关的引擎，使用与接口相同的入口并检查各种过滤条件下的结果
+        compute = models.StrategyPosition.compute_total_positions
+        filters = [
+            (None, True, None),
+            (None, False, None),
+            (ctx.strategy_names[::3], True, None),
+            (None, True, set(columns[0][::7])),
+        ]
+        for engine in aggregation.available_engines(dialect):
+            for strategy_names, include_adjustments, codes in filters:
+                reference = compute(strategy_names, include_adjustments, codes, engine=aggregation.PYTHON)
+                result = compute(strategy_names, include_adjustments, codes, engine=engine)
+                assert_equivalent_totals(reference['positions'], result['positions'], engine)
+            runner.measure(f'aggregation_engine.query.{engine}', lambda engine=engine: compute(None, True, engine=engine))
+        if aggregation.SQL not in aggregation.available_engines(dialect) and medians:
+            print(f'  数据库 {dialect} 不支持在数据库中汇总')
+
+
+def bench_validation(ctx, runner):
+    import models.validation as validation
+    positions = ctx.sample_positions
+    runner.measure('validation.validate_positions',
+                   lambda: ctx.models.StrategyPosition.validate_positions('BENCH_VALIDATE', positions))
+
+    # 大批量上传：校验耗时与完整上传接口耗时对比
+    rows = ctx.args.upload_rows
+    uploads = [ctx.make_upload_positions(rows), ctx.make_upload_positions(rows)]
+    adjustments = ctx.make_upload_positions(rows, allow_negative=True)
+    as_strings = [dict(pos, volume=str(pos['volume']), cost=str(pos['cost'])) for pos in uploads[0]]
+    validate = validation.validate_positions
+    validated = runner.measure('validation.upload.validate', lambda: validate('BENCH_UPLOAD', uploads[0]))
+    runner.measure('validation.upload.validate_adjustment', lambda: validate('ADJUSTMENT_BENCH_UPLOAD', adjustments))
+    runner.measure('validation.upload.validate_normalize',
+                   lambda: validate('BENCH_UPLOAD', as_strings, normalize=True))
+    runner.measure('validation.upload.validate_reject_duplicates',
+                   lambda: validate('BENCH_UPLOAD', uploads[0], duplicates=validation.DUPLICATES_REJECT))
+
+    # 两组持仓交替上传，保证每次都是真实变更
+    bodies = [json.dumps({'strategy_name': 'BENCH_UPLOAD', 'positions': upload}) for upload in uploads]
+    state = {'index': 0}
+
+    def upload():
+        state['index'] += 1
+        response = ctx.client.post('/api/v1/positions/update/internal', data=bodies[state['index'] % 2],
+                                   headers={'Content-Type': 'application/json', 'X-Internal-Password': 'admin123'})
+        assert response.status_code == 200, f'upload: HTTP {response.status_code} {response.get_data(as_text=True)}'
+
+    try:
+        uploaded = runner.measure('validation.upload.endpoint', upload, repeat=min(runner.repeat, 5))
+    finally:
+        # 后面的分组（如 endpoint）在共享的数据库上测量，必须与单独运行时的数据一致
+        remove_strategy(ctx, 'BENCH_UPLOAD')
+    if validated and uploaded:
+        share = validated['median_ms'] / uploaded['median_ms'] * 100
+        print(f"  {rows} 行持仓上传，校验占接口耗时 {share:.1f}%")
+
+
+def remove_strategy(ctx, strategy_name):
+    """删除测试写入的策略：先清空持仓使汇总表减去其持仓，再删除策略及其历史和变更事件"""
+    models = ctx.models
+    with ctx.app.app_context():
+        if models.StrategyPosition.query.filter_by(strategy_name=strategy_name).first() is None:
+            return
+        models.StrategyPosition.update_positions(strategy_name, [])
+        for model in (models.StrategyPosition, models.PositionHistory, models.PositionEvent):
+            models.db.session.execute(models.db.delete(model).where(model.strategy_name == strategy_name))
+        models.db.session.commit()
+
+
+def bench_serialization(ctx, runner):
+    import serialization.position_formats as position_formats
+    with ctx.app.app_context():
+        total = ctx.models.StrategyPosition.get_total_positions()['positions']
+        strategies = ctx.models.StrategyPosition.get_all_strategy_positions()
+        for item in strategies:
+            item['update_time'] = item['update_time'].strftime('%Y-%m-%d %H:%M:%S')
+        columnar = position_formats.to_columns(total, position_formats.TOTAL_POSITION_COLUMNS)
+        dumps = ctx.app.json.dumps
+        runner.measure('serialization.total_json', lambda: dumps({'positions': total}))
+        runner.measure('serialization.total_columnar', lambda: dumps({'positions': columnar}))
+        runner.measure('serialization.all_json', lambda: dumps({'strategies': strategies}))
+        runner.measure('serialization.all_streamed', lambda: ''.join(
+            position_formats.iter_json_object('strategies', iter(strategies), {'version': 1})
+        ))
+
+
+def bench_auth(ctx, runner):
+    crypto_auth = ctx.auth.crypto_auth
+    auth_data, signature, _ = ctx.make_rsa_token()
+    runner.measure('auth.rsa_verify', lambda: crypto_auth.verify_auth_token(auth_data, signature))
+
+    session = crypto_auth.create_session('bench', 3600)
+    token = session['session_token']
+    payload = token.rsplit('.', 1)[0].encode('utf-8')
+    session_key = crypto_auth._session_key(payload)
+    parts = ctx.auth.session_message_parts('POST', '/api/v1/positions/update', '', b'{}')
+    timestamp = str(int(time.time()))
+    import hashlib
+    import hmac
+    signature = hmac.new(session_key, '\n'.join([timestamp] + parts).encode('utf-8'), hashlib.sha256).hexdigest()
+    runner.measure('auth.hmac_session_verify',
+                   lambda: crypto_auth.verify_session_request(token, timestamp, signature, parts))
+
+
+def bench_endpoints(ctx, runner):
+    client = ctx.client
+    app_module = ctx.app_module
+
+    def get(path, headers=None):
+        response = client.get(path, headers=headers or {})
+        response.get_data()
+        response.close()
+        assert response.status_code in (200, 304), f'{path}: HTTP {response.status_code}'
+
+    runner.measure('endpoint.total_cached', lambda: get('/api/v1/positions/total'))
+    runner.measure('endpoint.total_uncached', lambda: get('/api/v1/positions/total'),
+                   setup=lambda: app_module.totals_cache.clear() or ())
+    etag = client.get('/api/v1/positions/total').headers['ETag']
+    runner.measure('endpoint.total_not_modified', lambda: get('/api/v1/positions/total', {'If-None-Match': etag}))
+    runner.measure('endpoint.total_filtered', lambda: get(
+        '/api/v1/positions/total?strategies=' + ','.join(ctx.strategy_names[-5:])
+    ), setup=lambda: app_module.totals_cache.clear() or ())
+    runner.measure('endpoint.all', lambda: get('/api/v1/positions/all'))
+    runner.measure('endpoint.all_gzip', lambda: get('/api/v1/positions/all', {'Accept-Encoding': 'gzip'}))
+    runner.measure('endpoint.strategy', lambda: get(f'/api/v1/positions/strategy/{ctx.strategy_names[-1]}'))
+
+    # 写入接口：两组持仓交替写入，保证每次都是真实变更
+    position_sets = [ctx.sample_positions, ctx.make_positions(ctx.args.positions)]
+    state = {'index': 0}
+
+    def next_positions():
+        state['index'] += 1
+        return position_sets[state['index'] % 2]
+
+    def post(path, body, headers):
+        response = client.post(path, data=body, headers=dict(headers, **{'Content-Type': 'application/json'}))
+        assert response.status_code == 200, f'{path}: HTTP {response.status_code} {response.get_data(as_text=True)}'
+
+    def rsa_update_setup():
+        body = json.dumps({'strategy_name': 'BENCH_WRITE', 'positions': next_positions()})
+        return body, {'X-Auth-Token': ctx.make_rsa_token()[2]}
+
+    runner.measure('endpoint.update_rsa_token', lambda body, headers: post('/api/v1/positions/update', body, headers),
+                   setup=rsa_update_setup)
+    runner.measure('endpoint.update_internal', lambda body: post(
+        '/api/v1/positions/update/internal', body, {'X-Internal-Password': 'admin123'}
+    ), setup=lambda: (json.dumps({'strategy_name': 'BENCH_WRITE', 'positions': next_positions()}),))
+
+
+BENCHMARK_GROUPS = [
+    bench_aggregation,
+    bench_aggregation_engines,
+    bench_validation,
+    bench_serialization,
+    bench_auth,
+    bench_endpoints,
+]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """按中位数与基线对比，返回退化的测试项"""
+    regressions = []
+    print(f"\n与基线对比（阈值 {threshold:.0%}）:")
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('median_ms'):
+            print(f"  {name:<40} 基线中无此项")
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  <-- 退化'
+            regressions.append({'name': name, 'baseline_ms': base['median_ms'],
+                                'current_ms': result['median_ms'], 'change': round(change, 4)})
+        print(f"  {name:<40} {base['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms  ({change:+.1%}){flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='持仓服务基准测试')
+    parser.add_argument('-n', '--strategies', type=int, default=50, help='策略数量')
+    parser.add_argument('-m', '--positions', type=int, default=200, help='每个策略的持仓数量')
+    parser.add_argument('--adjustment-ratio', type=float, default=0.1, help='ADJUSTMENT_ 调整策略所占比例')
+    parser.add_argument('--universe', type=int, default=4000, help='股票代码池大小，决定不同策略之间的重叠程度')
+    parser.add_argument('--upload-rows', type=int, default=10000, help='大批量上传测试的持仓行数')
+    parser.add_argument('--repeat', type=int, default=20, help='每项测试的重复次数')
+    parser.add_argument('--warmup', type=int, default=3, help='每项测试的预热次数（不计入结果）')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子，保证数据可复现')
+    parser.add_argument('--database', choices=['file', 'memory'], default='file', help='SQLite临时文件或内存数据库')
+    parser.add_argument('--database-uri', help='使用指定的数据库（如MySQL测试库），必须是空库，会写入模拟数据')
+    parser.add_argument('--only', help='只运行指定前缀的测试，逗号分隔，如 aggregation,auth.rsa')
+    parser.add_argument('--output', help='结果JSON的保存路径')
+    parser.add_argument('--baseline', help='基线结果JSON，提供时对比并在退化超过阈值时返回1')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定退化的中位数增幅，默认0.2即20%%')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ctx = BenchmarkContext(args)
+    print(f"生成模拟数据: {args.strategies} 个策略 × {args.positions} 条持仓 ...")
+    ctx.populate()
+
+    runner = BenchmarkRunner(args.repeat, args.warmup, args.only.split(',') if args.only else None)
+    for group in BENCHMARK_GROUPS:
+        runner.group = group.__name__[len('bench_'):]
+        group(ctx, runner)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+        },
+        'results': runner.results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('params', {}).get('strategies') != args.strategies or \
+                baseline.get('meta', {}).get('params', {}).get('positions') != args.positions:
+            print("\n警告: 基线的数据规模与本次不同，对比结果仅供参考")
+        regressions = compare_with_baseline(runner.results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项测试退化超过 {args.threshold:.0%}")
+            return 1
+        print("\n没有超过阈值的退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -222,10 +222,86 @@ CRYPTO_AUTH_CONFIG = {{
     'PUBLIC_KEY_FILE': 'quant_id_rsa_public.pem',   # X.509格式公钥文件
     
     'TOKEN_MAX_AGE': 300,  # 令牌有效期（秒）
+    'TOKEN_CACHE_SIZE': 10000,  # 已验证令牌缓存条数，有效期内重复使用的令牌跳过验签
+    'SINGLE_USE_TOKENS': False,  # 是否要求令牌只能使用一次（客户端需设置 single_use_tokens=True），启用后不接受会话签名
+    'SESSION_TTL': 3600,  # HMAC会话有效期（秒）
+    'SESSION_MAX_SKEW': 300,  # 会话签名请求允许的时间偏差（秒）
     
     # 当加密禁用时的简单API密钥（可选）
     'SIMPLE_API_KEY': '{self.api_config["simple_api_key"]}'
 }}
+
+# 持仓变更推送配置（/api/v1/positions/stream）
+STREAM_CONFIG = {{
+    'MAX_CONNECTIONS': None,   # 每个进程最多的推送连接数，每个连接在 MAX_DURATION 内一直占用一个uwsgi线程；
+                               # None 表示按 uwsgi.ini 的 threads 减去 RESERVED_THREADS 计算，
+                               # 可同时订阅的QMT终端数 = processes × 该值（默认 4 × (8 - 2) = 24）
+    'RESERVED_THREADS': 2,     # 每个进程保留给普通请求的线程数，推送连接不会占用
+    'POLL_INTERVAL': 0.5,      # 检查数据版本的时间间隔（秒）
+    'HEARTBEAT_INTERVAL': 15,  # 心跳间隔（秒）
+    'MAX_DURATION': 300,       # 单个连接最长保持时间（秒），到期后客户端自动重连
+    'EVENT_RETENTION': 1000,   # 保留最近多少个数据版本的变更事件
+}}
+
+# 汇总持仓响应缓存配置（每个进程独立缓存，通过共享数据版本号失效）
+CACHE_CONFIG = {{
+    'ENABLED': True,
+    'MAX_ENTRIES': 128,        # 最多缓存的（策略组合, 是否包含调整策略）数量
+}}
+
+# 流式输出配置（/api/v1/positions/all 未分页时流式输出）
+STREAMING_CONFIG = {{
+    'BATCH_SIZE': 1000,        # 服务端游标每次读取的行数
+    'CHUNK_SIZE': 64 * 1024,   # 每次输出的字符数
+}}
+
+# 内部密码配置
+INTERNAL_PASSWORD_CONFIG = {{
+    'KDF_ITERATIONS': 200000,      # PBKDF2迭代次数，只影响之后设置的密码
+    'VERSION_CHECK_INTERVAL': 1.0, # 各进程检查密码是否被修改的间隔（秒）
+}}
+
+# 压缩配置
+COMPRESSION_CONFIG = {{
+    'ENABLED': True,                       # 是否压缩响应（gzip/deflate，安装brotli后支持br）
+    'MIN_SIZE': 1024,                      # 响应体达到多少字节才压缩
+    'LEVEL': 6,                            # 压缩级别
+    'CACHE_ENTRIES': 64,                   # 每个进程缓存的压缩结果数量
+    'MAX_REQUEST_SIZE': 64 * 1024 * 1024,  # gzip上传的请求体解压后的最大字节数
+}}
+
+# 指标配置（GET /metrics，Prometheus文本格式）
+METRICS_CONFIG = {{
+    'ENABLED': True,
+    'DIRECTORY': None,         # 各进程指标快照的共享目录，默认为系统临时目录下的 jq2qmt_metrics_<端口>
+    'FLUSH_INTERVAL': 1.0,     # 各进程写入快照的间隔（秒）
+}}
+
+# 汇总持仓计算配置（指定策略组合的汇总需要从持仓明细重新计算）
+AGGREGATION_CONFIG = {{
+    'ENGINE': 'auto',          # auto: MySQL/SQLite/PostgreSQL在数据库中GROUP BY汇总，其他数据库安装了NumPy时向量化计算；也可指定 sql/numpy/python
+}}
+
+# 持仓上传校验配置
+VALIDATION_CONFIG = {{
+    'DUPLICATE_CODES': 'merge',  # merge: 同一次上传中重复的代码合并（数量相加、成本按数量加权）；reject: 作为错误返回
+    'NORMALIZE_NUMBERS': False,  # True 时接受数字字符串，整数值的浮点数量还原为整数
+}}
+
+# 持仓历史配置（/api/v1/positions/strategy 和 /api/v1/positions/total 的 as_of 查询）
+HISTORY_CONFIG = {{
+    'CHECKPOINT_INTERVAL': 50,  # 每隔多少条变更保存一次完整持仓，越小查询越快、占用空间越大
+    'RETENTION_DAYS': 90,       # prune-history 命令默认保留的天数
+}}
+
+# 性能分析配置（请求头 X-Profile: 1 加内部密码分析单个请求，或按比例抽样）
+PROFILER_CONFIG = {{
+    'ENABLED': True,
+    'DIRECTORY': None,         # 分析结果保存目录，默认为系统临时目录下的 jq2qmt_profiles_<端口>
+    'SAMPLE_RATE': 0.0,        # 抽样比例，0表示只分析带请求头的请求，例如0.01为抽样1%
+    'PATHS': None,             # 只抽样这些路径前缀，例如 ['/api/v1/positions/total']
+    'MAX_PROFILES': 50,        # 最多保留的分析结果数量
+}}
 '''
         
         config_file = self.src_dir / 'config.py'
@@ -289,8 +365,8 @@ PRIVATE_KEY_FILE = "quant_id_rsa_pkcs8.pem"
         print("\n下一步操作:")
         print("  1. 安装依赖: pip install -r requirements.txt")
         print("  2. 创建数据库和表结构")
-        print("  3. 将 src/api/jq_config.py 和私钥文件复制到聚宽研究环境")
-        print("  4. 将 src/api/qmt_jq_trade.py 复制到QMT策略中使用")
+        print("  3. 将 src/api/jq_config.py、src/api/http_transport.py 和私钥文件复制到聚宽研究环境")
+        print("  4. 将 src/api/qmt_jq_trade.py 复制到QMT策略中使用，src/api/http_transport.py 放入QMT的Python路径")
         print("  5. 启动服务: python src/app.py")
         
         api_url = f"http://{self.api_config['external_host']}:{self.api_config['external_port']}"
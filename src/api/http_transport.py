@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""聚宽端和QMT端共用的HTTP传输层
+
+使用带连接池的 requests.Session 复用TCP连接（keep-alive），统一设置连接/读取超时，
+幂等请求在网络错误或网关错误时按带随机抖动的指数退避重试，较大的请求体使用gzip压缩上传。
+"""
+import gzip
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpTransport:
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+    RETRY_STATUS_CODES = frozenset([502, 503, 504])
+
+    def __init__(self, connect_timeout=5, read_timeout=30, max_retries=3, backoff_base=0.5, backoff_max=8,
+                 pool_size=4, compress_threshold=2048, compress_level=6):
+        """
+        Args:
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应的超时时间（秒）
+            max_retries: 幂等请求失败后的最大重试次数
+            backoff_base: 第一次重试的最大等待时间（秒），之后每次翻倍
+            backoff_max: 单次重试的最大等待时间（秒）
+            pool_size: 每个主机保持的连接数
+            compress_threshold: 请求体达到多少字节时使用gzip压缩，为None时不压缩
+            compress_level: gzip压缩级别
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def _backoff(self, attempt):
+        """第 attempt 次重试前的等待时间（full jitter），避免多个客户端同时重试"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def compress(self, data, headers):
+        """请求体超过阈值时gzip压缩并设置 Content-Encoding"""
+        if self.compress_threshold is None or data is None or len(data) < self.compress_threshold:
+            return data
+        headers['Content-Encoding'] = 'gzip'
+        return gzip.compress(data, self.compress_level)
+
+    def request(self, method, url, data=None, headers=None, timeout=None, idempotent=None, compress=False, **kwargs):
+        """发送请求
+
+        Args:
+            data: 请求体（bytes），compress=True 时按阈值压缩
+            timeout: 覆盖默认的 (连接超时, 读取超时)
+            idempotent: 是否允许重试，默认按HTTP方法判断（POST不重试）
+        """
+        headers = dict(headers or {})
+        if compress:
+            data = self.compress(data, headers)
+        if idempotent is None:
+            idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        attempts = self.max_retries + 1 if idempotent else 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            try:
+                response = self.session.request(method, url, data=data, headers=headers,
+                                                timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt:
+                    raise
+                print(f'请求失败，准备重试 ({attempt + 1}/{self.max_retries}): {e}')
+            else:
+                if response.status_code not in self.RETRY_STATUS_CODES or last_attempt:
+                    return response
+                print(f'服务暂不可用 HTTP {response.status_code}，准备重试 ({attempt + 1}/{self.max_retries})')
+                response.close()
+            time.sleep(self._backoff(attempt))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def close(self):
+        self.session.close()
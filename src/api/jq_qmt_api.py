@@ -2,18 +2,118 @@ import json
 import base64
 import time
 import os
+import uuid
+import hashlib
+import hmac
+import datetime
+import random
+import threading
+from collections import OrderedDict
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.backends import default_backend
-import requests
 from kuanke.user_space_api import *
 try:
     import jq_config
 except:
     import src.api.jq_config as jq_config
+try:
+    from http_transport import HttpTransport
+except:
+    from src.api.http_transport import HttpTransport
+
+class StaleVersionError(Exception):
+    """增量更新的基准版本已过期（服务端持仓已被其他请求修改）"""
+
+
+class APIError(Exception):
+    """服务端返回了非200响应，status_code 为HTTP状态码"""
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StockNameCache:
+    """股票名称缓存，默认由所有 JQQMTAPI 实例共享
+
+    每天首次使用时批量加载一次：优先读取当天保存的缓存文件，否则调用一次 get_all_securities
+    并写回文件；缓存中没有的代码（如当天新上市的股票）再单独调用 get_security_info。
+    """
+    
+    def __init__(self, cache_file='jq2qmt_stock_names.json', security_types=('stock', 'fund', 'index')):
+        """
+        Args:
+            cache_file: 通过 write_file/read_file 保存的缓存文件路径，为空时不使用文件
+            security_types: 调用 get_all_securities 批量获取的证券类型
+        """
+        self.cache_file = cache_file
+        self.security_types = list(security_types)
+        self._names = {}
+        self._date = None
+    
+    def refresh(self, force=False):
+        """每天刷新一次名称，force=True 时忽略缓存文件重新获取"""
+        today = datetime.date.today().isoformat()
+        if self._date == today and not force:
+            return
+        
+        names = None if force else self._load_file(today)
+        if names is None:
+            names = self._load_all_securities()
+            if names:
+                self._save_file(today, names)
+        if names:
+            self._names = names
+        self._date = today
+    
+    def _load_file(self, today):
+        if not self.cache_file:
+            return None
+        try:
+            data = json.loads(read_file(self.cache_file))
+        except Exception:
+            return None
+        if data.get('date') != today:
+            return None
+        return data.get('names') or None
+    
+    def _save_file(self, today, names):
+        if not self.cache_file:
+            return
+        try:
+            write_file(self.cache_file, json.dumps({'date': today, 'names': names}, ensure_ascii=False))
+        except Exception as e:
+            print(f"保存股票名称缓存失败: {e}")
+    
+    def _load_all_securities(self):
+        try:
+            securities = get_all_securities(types=self.security_types)
+            return {code: name for code, name in securities['display_name'].items()}
+        except Exception as e:
+            print(f"批量获取股票名称失败: {e}")
+            return None
+    
+    def get(self, code: str) -> str:
+        """获取股票名称，获取失败时返回股票代码"""
+        self.refresh()
+        name = self._names.get(code)
+        if name is None:
+            try:
+                name = get_security_info(code).display_name
+            except Exception as e:
+                print(f"获取股票名称失败 {code}: {e}")
+                return code
+            self._names[code] = name
+        return name
+
+
+stock_name_cache = StockNameCache()
 
 class JQQMTAPI:
-    def __init__(self, api_url=jq_config.API_URL, private_key_file=jq_config.PRIVATE_KEY_FILE, client_id="default_client", use_crypto_auth=jq_config.USE_CRYPTO_AUTH, simple_api_key=None):
+    def __init__(self, api_url=jq_config.API_URL, private_key_file=jq_config.PRIVATE_KEY_FILE, client_id="default_client", use_crypto_auth=jq_config.USE_CRYPTO_AUTH, simple_api_key=None,
+                 token_reuse_seconds=60, single_use_tokens=False, use_session=True, session_refresh_margin=60,
+                 name_cache=None, send_known_names=True, transport=None,
+                 skip_unchanged=True, delta_upload=True, delta_max_ratio=0.5, on_upload_error=None):
         """初始化API客户端
         
         Args:
@@ -22,11 +122,42 @@ class JQQMTAPI:
             client_id: 客户端ID
             use_crypto_auth: 是否使用加密认证
             simple_api_key: 简单API密钥（当不使用加密认证时）
+            token_reuse_seconds: 认证令牌的复用时间（秒），期间不重复签名，服务端也会跳过验签；需小于服务端 TOKEN_MAX_AGE
+            single_use_tokens: 服务端启用一次性令牌（SINGLE_USE_TOKENS）时设为True，每次请求生成带nonce的新令牌
+            use_session: 是否使用会话密钥（HMAC）签名请求，只在建立会话时做一次RSA签名；single_use_tokens 为True时不使用会话
+            session_refresh_margin: 会话到期前多少秒自动重新建立会话
+            name_cache: 股票名称缓存，默认使用模块级共享的 stock_name_cache
+            send_known_names: 为False时，服务端已确认过的代码不再上传名称（服务端保留原有名称）
+            transport: 共享的 HttpTransport（连接池、超时、重试和gzip上传），默认自动创建
+            skip_unchanged: 持仓与上次服务端确认的完全相同时不发送请求
+            delta_upload: 只有少量代码变化时只上传变化的代码（基于上次确认的版本号）
+            delta_max_ratio: 变化的代码数不超过持仓数的该比例时使用增量上传
+            on_upload_error: 后台上传放弃某份持仓时的回调 on_upload_error(策略名称, 持仓列表, 异常)
         """
         self.api_url = api_url
         self.client_id = client_id
         self.use_crypto_auth = use_crypto_auth
         self.simple_api_key = simple_api_key
+        self.token_reuse_seconds = 0 if single_use_tokens else token_reuse_seconds
+        self.single_use_tokens = single_use_tokens
+        self._auth_token = None
+        self._auth_token_time = 0
+        # 会话签名可以重放，一次性令牌模式下服务端不接受会话
+        self.use_session = use_session and use_crypto_auth and not single_use_tokens
+        self.session_refresh_margin = session_refresh_margin
+        self._session = None
+        self.name_cache = name_cache or stock_name_cache
+        self.send_known_names = send_known_names
+        # 各策略服务端已保存名称的代码
+        self._named_codes = {}
+        self.http = transport or HttpTransport()
+        self.skip_unchanged = skip_unchanged
+        self.delta_upload = delta_upload
+        self.delta_max_ratio = delta_max_ratio
+        # 各策略上次服务端确认的持仓快照 {策略名称: {'version': 版本号, 'positions': {代码: (数量, 成本)}}}
+        self._acked = {}
+        self._uploader = None
+        self.on_upload_error = on_upload_error
         
         if use_crypto_auth:
             self.private_key = serialization.load_pem_private_key(
@@ -35,20 +166,71 @@ class JQQMTAPI:
                 backend=default_backend()
             )
     
-    def _create_auth_header(self):
-        """创建认证头"""
+    def _ensure_session(self):
+        """确保持有未过期的会话，快到期时用RSA令牌重新建立"""
+        if self._session and time.time() < self._session['expires_at'] - self.session_refresh_margin:
+            return self._session
+        
+        headers = self._create_rsa_auth_header()
+        response = self.http.post(f'{self.api_url}/api/v1/auth/session', headers=headers,
+                                  idempotent=not self.single_use_tokens)
+        if response.status_code != 200:
+            raise Exception(f'建立会话失败: {response.text}')
+        data = response.json()
+        
+        # 会话密钥由服务端用公钥加密，只有私钥能解密
+        session_key = self.private_key.decrypt(
+            base64.b64decode(data['encrypted_session_key']),
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+        self._session = {
+            'token': data['session_token'],
+            'key': session_key,
+            'expires_at': data['expires_at']
+        }
+        return self._session
+    
+    def _create_auth_header(self, method='POST', path='', body=b''):
+        """创建认证头，启用会话时使用HMAC签名，否则使用RSA令牌"""
         if not self.use_crypto_auth:
             # 简单API密钥认证
             return {'X-API-Key': 'your-simple-api-key-here'}
         
+        if not self.use_session:
+            return self._create_rsa_auth_header()
+        
+        session = self._ensure_session()
+        path, _, query_string = path.partition('?')
+        timestamp = str(int(time.time()))
+        message = '\n'.join([
+            timestamp, method.upper(), path, query_string, hashlib.sha256(body).hexdigest()
+        ]).encode('utf-8')
+        return {
+            'X-Auth-Session': session['token'],
+            'X-Auth-Timestamp': timestamp,
+            'X-Auth-Signature': hmac.new(session['key'], message, hashlib.sha256).hexdigest()
+        }
+    
+    def _create_rsa_auth_header(self):
+        """创建RSA签名的认证令牌"""
         if not self.private_key:
             raise Exception("使用加密认证时必须提供私钥")
         
+        now = int(time.time())
+        if self._auth_token and now - self._auth_token_time < self.token_reuse_seconds:
+            return {'X-Auth-Token': self._auth_token}
+        
         # 创建认证数据
         auth_data = {
             'client_id': self.client_id,
-            'timestamp': int(time.time())
+            'timestamp': now
         }
+        if self.single_use_tokens:
+            auth_data['nonce'] = uuid.uuid4().hex
         
         # 创建签名
         message = json.dumps(auth_data, sort_keys=True)
@@ -70,12 +252,14 @@ class JQQMTAPI:
         auth_token = base64.b64encode(
             json.dumps(auth_info).encode('utf-8')
         ).decode('utf-8')
+        self._auth_token = auth_token
+        self._auth_token_time = now
         
         return {'X-Auth-Token': auth_token}
     
     def get_stock_name(self, code: str) -> str:
         """
-        使用聚宽API获取股票名称
+        使用聚宽API获取股票名称（带缓存）
         
         Args:
             code: 股票代码，如 '000001.XSHE'
@@ -83,17 +267,63 @@ class JQQMTAPI:
         Returns:
             股票名称，如果获取失败则返回股票代码
         """
-        try:
-            security_info = get_security_info(code)
-            return security_info.display_name
-        except Exception as e:
-            print(f"获取股票名称失败 {code}: {e}")
-            return code
+        return self.name_cache.get(code)
+    
+    def _enrich_positions(self, positions: list, strategy_name: str = None) -> list:
+        """为每个持仓添加股票名称，已提供名称或服务端已有名称的代码不再查询"""
+        known_codes = set() if self.send_known_names else self._named_codes.get(strategy_name, set())
+        enriched_positions = []
+        for pos in positions:
+            enriched_pos = pos.copy()
+            if pos['code'] in known_codes:
+                enriched_pos.pop('name', None)
+            elif not pos.get('name'):
+                enriched_pos['name'] = self.get_stock_name(pos['code'])
+            enriched_positions.append(enriched_pos)
+        return enriched_positions
+    
+    def _post_json(self, path: str, data: dict, error_message: str):
+        """发送带认证的JSON请求，会话失效时重新建立会话后重试一次
+
+        持仓写入接口按绝对值写入，重复提交结果相同，因此网络错误时允许传输层重试；
+        一次性令牌模式下同一令牌不能重复使用，不做重试。签名基于压缩前的请求体。
+        """
+        body = json.dumps(data).encode('utf-8')
+        for attempt in range(2):
+            headers = self._create_auth_header('POST', path, body)
+            headers['Content-Type'] = 'application/json'
+            
+            response = self.http.post(f'{self.api_url}{path}', data=body, headers=headers, compress=True,
+                                      idempotent=not self.single_use_tokens)
+            if response.status_code == 401 and self._session and attempt == 0:
+                self._session = None
+                continue
+            if response.status_code == 409:
+                raise StaleVersionError(response.json().get('error'))
+            if response.status_code != 200:
+                raise APIError(f'{error_message}: {response.text}', response.status_code)
+            return response.json()
+    
+    @staticmethod
+    def _position_snapshot(positions: list):
+        """持仓快照 {代码: (数量, 成本)}，有重复代码时返回None（由服务端合并，不做增量）"""
+        snapshot = {pos['code']: (pos['volume'], pos['cost']) for pos in positions}
+        return snapshot if len(snapshot) == len(positions) else None
+    
+    def _acknowledge(self, strategy_name: str, positions: list, version):
+        snapshot = self._position_snapshot(positions)
+        if snapshot is None or version is None:
+            self._acked.pop(strategy_name, None)
+        else:
+            self._acked[strategy_name] = {'version': version, 'positions': snapshot}
     
     def update_positions(self, strategy_name: str, positions: list):
         """
         更新策略持仓到数据库
         
+        与上次服务端确认的持仓相同时直接跳过；只有少量代码变化时只上传变化的代码，
+        服务端发现基准版本已过期时自动改为全量上传。
+        
         Args:
             strategy_name: 策略名称
             positions: 持仓列表，格式如：
@@ -105,25 +335,283 @@ class JQQMTAPI:
                     }
                 ]
         """
-        # 为每个持仓添加股票名称
-        enriched_positions = []
-        for pos in positions:
-            enriched_pos = pos.copy()
-            enriched_pos['name'] = self.get_stock_name(pos['code'])
-            enriched_positions.append(enriched_pos)
+        snapshot = self._position_snapshot(positions)
+        acked = self._acked.get(strategy_name)
+        if snapshot is not None and acked is not None:
+            if self.skip_unchanged and snapshot == acked['positions']:
+                return {'message': '持仓未变化，跳过上传', 'skipped': True, 'version': acked['version']}
+            
+            upserts = [pos for pos in positions if acked['positions'].get(pos['code']) != snapshot[pos['code']]]
+            deletes = [code for code in acked['positions'] if code not in snapshot]
+            if self.delta_upload and len(upserts) + len(deletes) <= self.delta_max_ratio * max(len(positions), 1):
+                try:
+                    return self._upload_delta(strategy_name, positions, acked['version'], upserts, deletes)
+                except StaleVersionError as e:
+                    print(f"增量更新被拒绝，改为全量上传: {e}")
         
-        url = f'{self.api_url}/api/v1/positions/update'
+        self._acked.pop(strategy_name, None)
         data = {
             'strategy_name': strategy_name,
-            'positions': enriched_positions
+            'positions': self._enrich_positions(positions, strategy_name)
         }
+        result = self._post_json('/api/v1/positions/update', data, '更新持仓失败')
+        self._named_codes[strategy_name] = {pos['code'] for pos in positions}
+        self._acknowledge(strategy_name, positions, result.get('version'))
+        return result
+    
+    def _upload_delta(self, strategy_name: str, positions: list, base_version, upserts: list, deletes: list):
+        """基于 base_version 只上传变化的代码"""
+        self._acked.pop(strategy_name, None)
+        data = {
+            'strategy_name': strategy_name,
+            'base_version': base_version,
+            'upserts': self._enrich_positions(upserts, strategy_name),
+            'deletes': deletes
+        }
+        result = self._post_json('/api/v1/positions/update/delta', data, '增量更新持仓失败')
+        self._named_codes[strategy_name] = {pos['code'] for pos in positions}
+        self._acknowledge(strategy_name, positions, result.get('version'))
+        return result
+    
+    def update_positions_batch(self, updates: dict):
+        """
+        在一次请求、一个事务内更新多个策略的持仓
         
-        # 添加认证头
-        headers = self._create_auth_header()
-        headers['Content-Type'] = 'application/json'
+        Args:
+            updates: {策略名称: 持仓列表}，持仓列表格式同 update_positions
+        """
+        data = {'updates': [{
+            'strategy_name': strategy_name,
+            'positions': self._enrich_positions(positions, strategy_name)
+        } for strategy_name, positions in updates.items()]}
+        for strategy_name in updates:
+            self._acked.pop(strategy_name, None)
+        result = self._post_json('/api/v1/positions/update/batch', data, '批量更新持仓失败')
+        for strategy_name, positions in updates.items():
+            self._named_codes[strategy_name] = {pos['code'] for pos in positions}
+            self._acknowledge(strategy_name, positions, result.get('version'))
+        return result
+    
+    def patch_positions(self, strategy_name: str, upserts: list = None, deletes: list = None):
+        """
+        部分更新策略持仓，只新增/修改或删除指定的代码
         
-        response = requests.post(url, json=data, headers=headers)
-        if response.status_code != 200:
-            raise Exception(f'更新持仓失败: {response.text}')
+        Args:
+            strategy_name: 策略名称
+            upserts: 需要新增或修改的持仓列表，格式同 update_positions
+            deletes: 需要删除的股票代码列表
+        """
+        data = {
+            'strategy_name': strategy_name,
+            'upserts': self._enrich_positions(upserts or [], strategy_name),
+            'deletes': deletes or []
+        }
+        # 部分更新后不再持有完整快照，下次 update_positions 全量上传
+        self._acked.pop(strategy_name, None)
+        result = self._post_json('/api/v1/positions/update/partial', data, '部分更新持仓失败')
+        named_codes = self._named_codes.setdefault(strategy_name, set())
+        named_codes.difference_update(deletes or [])
+        named_codes.update(pos['code'] for pos in upserts or [])
+        return result
+    
+    def update_positions_async(self, strategy_name: str, positions: list):
+        """
+        将持仓更新交给后台线程发送，立即返回，不阻塞策略的交易逻辑
+        
+        同一策略尚未发送的多次更新只发送最新的一次。使用异步上传后，
+        请不要在策略线程中同时调用同步的 update_positions 等方法。
+        """
+        if self._uploader is None:
+            self._uploader = BackgroundUploader(self, on_error=self.on_upload_error)
+        self._uploader.submit(strategy_name, positions)
+    
+    @property
+    def uploader(self):
+        """后台上传器（首次调用 update_positions_async 时创建）"""
+        return self._uploader
+
+
+class BackgroundUploader:
+    """后台持仓上传器
+
+    submit 只把持仓放入队列后立即返回，由后台线程调用 JQQMTAPI.update_positions 发送。
+    同一策略在发送前又提交了新持仓时只保留最新的一份；发送失败后移到队尾，按策略各自指数退避重试，
+    一个策略持续失败不影响其他策略发送；重试期间提交了新持仓则改为发送新持仓。
+    服务端拒绝的请求（除408、429以外的4xx）重试也不会成功，直接放弃并通过 on_error 回调通知。
+    """
+    
+    # 可以重试的4xx状态码
+    RETRYABLE_CLIENT_ERRORS = (408, 429)
+    
+    def __init__(self, api, retry_interval=1, retry_max_interval=30, max_retries=10, on_error=None):
+        """
+        Args:
+            api: 用于发送的 JQQMTAPI 实例
+            retry_interval: 第一次重试前的等待时间（秒），之后每次翻倍
+            retry_max_interval: 重试的最大等待时间（秒）
+            max_retries: 同一份持仓的最大重试次数，超过后放弃；为None时一直重试直到成功或被新持仓替换
+            on_error: 放弃某份持仓时的回调 on_error(策略名称, 持仓列表, 异常)
+        """
+        self.api = api
+        self.retry_interval = retry_interval
+        self.retry_max_interval = retry_max_interval
+        self.max_retries = max_retries
+        self.on_error = on_error
         
-        return response.json()
\ No newline at end of file
+        # {策略名称: (持仓列表, 首次提交时间, 已重试次数, 下次可以发送的时间)}，按提交顺序发送
+        self._pending = OrderedDict()
+        self._in_flight = None
+        self._condition = threading.Condition()
+        self._closed = False
+        
+        self.submitted = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.failures = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_lag = None
+        
+        self._thread = threading.Thread(target=self._run, name='jq2qmt-uploader', daemon=True)
+        self._thread.start()
+    
+    def submit(self, strategy_name: str, positions: list):
+        """提交策略持仓，立即返回"""
+        positions = [dict(pos) for pos in positions]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('后台上传器已关闭')
+            self.submitted += 1
+            pending = self._pending.pop(strategy_name, None)
+            if pending is not None:
+                # 合并为最新的持仓，保留最早的提交时间以便统计延迟，退避中的策略仍等到退避结束
+                self.coalesced += 1
+                self._pending[strategy_name] = (positions, pending[1], 0, pending[3])
+            else:
+                self._pending[strategy_name] = (positions, time.time(), 0, 0)
+            self._condition.notify_all()
+    
+    def flush(self, timeout=None) -> bool:
+        """等待已提交的持仓全部发送完成（或放弃），超时返回False"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending or self._in_flight is not None:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+    
+    def close(self, timeout=None) -> bool:
+        """发送完剩余持仓后停止后台线程"""
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        return flushed
+    
+    def stats(self) -> dict:
+        """队列长度、延迟和失败统计"""
+        with self._condition:
+            oldest = min((item[1] for item in self._pending.values()), default=None)
+            if self._in_flight is not None:
+                oldest = min(oldest or self._in_flight[1], self._in_flight[1])
+            return {
+                'queue_depth': len(self._pending),
+                'in_flight': self._in_flight[0] if self._in_flight else None,
+                'lag': round(time.time() - oldest, 3) if oldest is not None else 0,
+                'last_lag': self.last_lag,
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'sent': self.sent,
+                'failures': self.failures,
+                'consecutive_failures': self.consecutive_failures,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+                'last_error': self.last_error
+            }
+    
+    def _retry_delay(self, retries):
+        delay = min(self.retry_max_interval, self.retry_interval * (2 ** (retries - 1)))
+        return random.uniform(delay / 2, delay)
+    
+    def _next_ready(self):
+        """队列中第一个不在退避期间的策略，都在退避时返回 (None, 最早可以发送的时间)"""
+        now = time.time()
+        earliest = None
+        for strategy_name, item in self._pending.items():
+            if item[3] <= now:
+                return strategy_name, None
+            earliest = item[3] if earliest is None else min(earliest, item[3])
+        return None, earliest
+    
+    def _is_retryable(self, error):
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            return True
+        return not (400 <= status_code < 500) or status_code in self.RETRYABLE_CLIENT_ERRORS
+    
+    def _give_up(self, strategy_name, positions, error):
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(strategy_name, positions, error)
+        except Exception as e:
+            print(f"后台上传错误回调执行失败: {e}")
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                # 队列为空或所有策略都处于失败退避期间时等待
+                while not self._closed:
+                    strategy_name, resume_at = self._next_ready()
+                    if strategy_name is not None:
+                        break
+                    self._condition.wait(None if resume_at is None else resume_at - time.time())
+                if self._closed:
+                    return
+                positions, submitted_at, retries, _ = self._pending.pop(strategy_name)
+                self._in_flight = (strategy_name, submitted_at)
+            
+            try:
+                self.api.update_positions(strategy_name, positions)
+                error = None
+            except Exception as e:
+                error = e
+            
+            abandoned = False
+            with self._condition:
+                if error is None:
+                    self.sent += 1
+                    self.consecutive_failures = 0
+                    self.last_lag = round(time.time() - submitted_at, 3)
+                else:
+                    self.failures += 1
+                    self.consecutive_failures += 1
+                    self.last_error = f'{strategy_name}: {error}'
+                    print(f"后台上传持仓失败 {self.last_error}")
+                    retries += 1
+                    # 已有更新的持仓等待发送时放弃旧的
+                    if strategy_name not in self._pending:
+                        if not self._is_retryable(error):
+                            self.rejected += 1
+                            abandoned = True
+                        elif self.max_retries is not None and retries > self.max_retries:
+                            self.dropped += 1
+                            abandoned = True
+                        else:
+                            # 放到队尾，不阻塞其他策略
+                            self._pending[strategy_name] = (
+                                positions, submitted_at, retries, time.time() + self._retry_delay(retries)
+                            )
+                if not abandoned:
+                    self._in_flight = None
+                    self._condition.notify_all()
+            if abandoned:
+                # 回调执行完之前仍算作发送中，flush 返回时回调已经执行
+                self._give_up(strategy_name, positions, error)
+                with self._condition:
+                    self._in_flight = None
+                    self._condition.notify_all()
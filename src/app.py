@@ -1,12 +1,91 @@
 import os
+import hashlib
+import itertools
+import json
+import tempfile
+import threading
+import time
 
-from flask import Flask, request, jsonify, render_template
-from models.models import db, StrategyPosition, InternalPassword
+from flask import (Flask, request, jsonify, render_template, make_response, g, Response, stream_with_context,
+                   send_file)
+from models.models import (db, StrategyPosition, InternalPassword, PositionAggregate, DataVersion,
+                           PositionEvent, PositionItem, PositionHistory, AuthNonce, password_verifier,
+                           StaleVersionError, HistoryUnavailableError)
 from config import SQLALCHEMY_DATABASE_URI, API_HOST, API_PORT, CRYPTO_AUTH_CONFIG
+try:
+    from config import STREAM_CONFIG
+except ImportError:
+    STREAM_CONFIG = {}
+try:
+    from config import CACHE_CONFIG
+except ImportError:
+    CACHE_CONFIG = {}
+try:
+    from config import INTERNAL_PASSWORD_CONFIG
+except ImportError:
+    INTERNAL_PASSWORD_CONFIG = {}
+try:
+    from config import COMPRESSION_CONFIG
+except ImportError:
+    COMPRESSION_CONFIG = {}
+try:
+    from config import STREAMING_CONFIG
+except ImportError:
+    STREAMING_CONFIG = {}
+try:
+    from config import METRICS_CONFIG
+except ImportError:
+    METRICS_CONFIG = {}
+try:
+    from config import PROFILER_CONFIG
+except ImportError:
+    PROFILER_CONFIG = {}
+try:
+    from config import AGGREGATION_CONFIG
+except ImportError:
+    AGGREGATION_CONFIG = {}
+try:
+    from config import HISTORY_CONFIG
+except ImportError:
+    HISTORY_CONFIG = {}
+try:
+    from config import VALIDATION_CONFIG
+except ImportError:
+    VALIDATION_CONFIG = {}
 from auth.simple_crypto_auth import SimpleCryptoAuth, require_auth
+from cache.versioned_cache import VersionedLRUCache
+from middleware.compression import RequestDecompressionMiddleware, ResponseCompressor
+from middleware.metrics import MetricsRegistry, RequestMetrics, record_phase
+from middleware.profiler import RequestProfiler
+import serialization.position_formats as position_formats
+import models.aggregation as aggregation
+import models.validation as validation
 import auth.simple_crypto_auth as auth_module
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
+import click
+
+# 压缩结果按ETag缓存，ETag包含数据版本号，数据变化后自动失效
+response_compressor = ResponseCompressor(
+    min_size=COMPRESSION_CONFIG.get('MIN_SIZE', 1024),
+    level=COMPRESSION_CONFIG.get('LEVEL', 6),
+    cache=VersionedLRUCache(COMPRESSION_CONFIG.get('CACHE_ENTRIES', 64))
+)
+
+# 各uwsgi进程的指标写入同一目录，/metrics 合并所有进程的数据
+metrics_registry = MetricsRegistry(
+    directory=METRICS_CONFIG.get('DIRECTORY') or os.path.join(tempfile.gettempdir(), f'jq2qmt_metrics_{API_PORT}'),
+    flush_interval=METRICS_CONFIG.get('FLUSH_INTERVAL', 1.0)
+)
+request_metrics = RequestMetrics(metrics_registry)
+
+# 按需性能分析：请求头 X-Profile（需内部密码）或按比例抽样
+request_profiler = RequestProfiler(
+    directory=PROFILER_CONFIG.get('DIRECTORY') or os.path.join(tempfile.gettempdir(), f'jq2qmt_profiles_{API_PORT}'),
+    sample_rate=PROFILER_CONFIG.get('SAMPLE_RATE', 0.0),
+    max_profiles=PROFILER_CONFIG.get('MAX_PROFILES', 50),
+    paths=PROFILER_CONFIG.get('PATHS')
+)
 
 def create_app():
     app = Flask(__name__)
@@ -14,18 +93,124 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     db.init_app(app)
+    # 透明解压客户端gzip压缩上传的请求体
+    app.wsgi_app = RequestDecompressionMiddleware(
+        app.wsgi_app, max_size=COMPRESSION_CONFIG.get('MAX_REQUEST_SIZE', 64 * 1024 * 1024)
+    )
+    # 按 Accept-Encoding 压缩较大的响应
+    if COMPRESSION_CONFIG.get('ENABLED', True):
+        response_compressor.init_app(app)
+    if PROFILER_CONFIG.get('ENABLED', True):
+        request_profiler.init_app(app, check_internal_password)
+    # 请求耗时、SQL和缓存指标（放在最外层，统计包括解压和流式输出在内的完整耗时）
+    if METRICS_CONFIG.get('ENABLED', True):
+        metrics_registry.cleanup()
+        metrics_registry.add_collector(collect_cache_metrics)
+        request_metrics.init_app(app)
+    PositionEvent.RETENTION = STREAM_CONFIG.get('EVENT_RETENTION', PositionEvent.RETENTION)
+    aggregation.default_engine = AGGREGATION_CONFIG.get('ENGINE', aggregation.AUTO)
+    validation.default_normalize = VALIDATION_CONFIG.get('NORMALIZE_NUMBERS', False)
+    validation.default_duplicates = VALIDATION_CONFIG.get('DUPLICATE_CODES', validation.DUPLICATES_MERGE)
+    PositionHistory.CHECKPOINT_INTERVAL = HISTORY_CONFIG.get('CHECKPOINT_INTERVAL', PositionHistory.CHECKPOINT_INTERVAL)
+    InternalPassword.KDF_ITERATIONS = INTERNAL_PASSWORD_CONFIG.get('KDF_ITERATIONS', InternalPassword.KDF_ITERATIONS)
+    password_verifier.check_interval = INTERNAL_PASSWORD_CONFIG.get('VERSION_CHECK_INTERVAL', password_verifier.check_interval)
     
     # 初始化认证系统
     init_auth_system()
     
     with app.app_context():
         db.create_all()
+        migrate_schema()
+        migrate_position_storage()
+        init_position_aggregates()
+        print(f"汇总持仓计算引擎: {aggregation.resolve_engine(dialect=db.engine.dialect.name)}")
+    
+    register_commands(app)
     
     return app
 
+def collect_cache_metrics():
+    """把各缓存的命中统计导出为指标"""
+    samples = []
+    caches = [('totals', totals_cache.stats())]
+    if response_compressor.cache is not None:
+        caches.append(('compressed_responses', response_compressor.cache.stats()))
+    for cache, stats in caches:
+        samples.append(('jq2qmt_cache_requests_total', {'cache': cache, 'result': 'hit'}, stats['hits']))
+        samples.append(('jq2qmt_cache_requests_total', {'cache': cache, 'result': 'miss'}, stats['misses']))
+    
+    # 令牌缓存命中即省去一次RSA验签
+    token_stats = auth_module.token_cache.stats()
+    samples.append(('jq2qmt_cache_requests_total', {'cache': 'auth_token', 'result': 'hit'},
+                    token_stats['avoided_verifications']))
+    samples.append(('jq2qmt_cache_requests_total', {'cache': 'auth_token', 'result': 'miss'},
+                    token_stats['verifications']))
+    return samples
+
+def migrate_schema():
+    """为旧版本创建的表补充或调整列"""
+    if StrategyPosition.migrate_schema():
+        print("已为 strategy_positions 表添加 version 列")
+    if InternalPassword.migrate_schema():
+        print("已将 internal_passwords.password_hash 列扩展为 VARCHAR(255)")
+
+def migrate_position_storage():
+    """将旧版整块JSON存储的持仓迁移为按代码存储的行"""
+    count = PositionItem.migrate_from_blobs()
+    if count:
+        print(f"已将 {count} 个策略的持仓迁移为按代码存储")
+
+def init_position_aggregates():
+    """首次启用汇总表时从持仓明细构建"""
+    try:
+        PositionAggregate.ensure_initialized()
+    except Exception as e:
+        # 多个uwsgi进程同时启动时可能并发重建，失败的进程直接使用其他进程的结果
+        db.session.rollback()
+        print(f"汇总持仓表初始化跳过: {e}")
+
+def register_commands(app):
+    """注册维护命令（flask --app app <command>）"""
+    @app.cli.command('migrate-positions')
+    def migrate_positions_command():
+        """将旧版整块JSON存储的持仓迁移为按代码存储的行"""
+        count = PositionItem.migrate_from_blobs()
+        print(f"迁移完成，共迁移 {count} 个策略")
+
+    @app.cli.command('rebuild-aggregates')
+    def rebuild_aggregates_command():
+        """根据各策略持仓明细重建汇总持仓表"""
+        count = PositionAggregate.rebuild()
+        print(f"汇总持仓表已重建，共 {count} 条记录")
+
+    @app.cli.command('check-aggregates')
+    def check_aggregates_command():
+        """检查汇总持仓表与持仓明细是否一致"""
+        mismatches = PositionAggregate.check_consistency()
+        if not mismatches:
+            print("汇总持仓表与持仓明细一致")
+            return
+        print(f"发现 {len(mismatches)} 条不一致记录:")
+        for item in mismatches:
+            scope = '调整策略' if item['is_adjustment'] else '普通策略'
+            print(f"  {item['code']} [{scope}] 期望: {item['expected']} 实际: {item['actual']}")
+        print("可执行 rebuild-aggregates 命令重建汇总表")
+
+    @app.cli.command('prune-history')
+    @click.option('--days', type=int, default=None, help='保留最近多少天的持仓历史')
+    def prune_history_command(days):
+        """删除超过保留天数的持仓历史"""
+        days = days if days is not None else HISTORY_CONFIG.get('RETENTION_DAYS', 90)
+        count = PositionHistory.prune(datetime.now() - timedelta(days=days))
+        print(f"持仓历史清理完成，保留最近 {days} 天，共删除 {count} 条记录")
+
 def init_auth_system():
     """初始化认证系统"""
     if CRYPTO_AUTH_CONFIG.get('ENABLED', True):
+        # 已验证令牌缓存和一次性令牌的跨进程登记
+        auth_module.token_cache.max_entries = CRYPTO_AUTH_CONFIG.get('TOKEN_CACHE_SIZE', 10000)
+        auth_module.nonce_store = AuthNonce.claim
+        
         # 启用加密认证
         try:
             # 优先使用文件路径配置
@@ -62,42 +247,86 @@ def init_auth_system():
         if not CRYPTO_AUTH_CONFIG.get('SIMPLE_API_KEY'):
             print("警告: 未配置简单API密钥，API将不安全！")
 
+def check_internal_password():
+    """校验请求中的内部密码，通过时返回None，否则返回401响应"""
+    password = None
+    
+    # 尝试从请求头获取密码
+    if 'X-Internal-Password' in request.headers:
+        password = request.headers['X-Internal-Password']
+    # 尝试从请求体获取密码
+    elif request.is_json and request.get_json():
+        data = request.get_json()
+        password = data.get('internal_password')
+    # 尝试从表单数据获取密码
+    elif request.form:
+        password = request.form.get('internal_password')
+    
+    if not password:
+        return jsonify({
+            'error': '缺少内部密码',
+            'message': '请在请求头X-Internal-Password或请求体internal_password字段中提供密码'
+        }), 401
+    
+    # 验证密码
+    if not InternalPassword.verify_password(password):
+        return jsonify({
+            'error': '密码验证失败',
+            'message': '内部密码不正确'
+        }), 401
+    return None
+
 def require_internal_password(f):
     """内部API密码验证装饰器"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 获取密码
-        password = None
-        
-        # 尝试从请求头获取密码
-        if 'X-Internal-Password' in request.headers:
-            password = request.headers['X-Internal-Password']
-        # 尝试从请求体获取密码
-        elif request.is_json and request.get_json():
-            data = request.get_json()
-            password = data.get('internal_password')
-        # 尝试从表单数据获取密码
-        elif request.form:
-            password = request.form.get('internal_password')
-        
-        if not password:
-            return jsonify({
-                'error': '缺少内部密码',
-                'message': '请在请求头X-Internal-Password或请求体internal_password字段中提供密码'
-            }), 401
-        
-        # 验证密码
-        if not InternalPassword.verify_password(password):
-            return jsonify({
-                'error': '密码验证失败',
-                'message': '内部密码不正确'
-            }), 401
+        started = time.perf_counter()
+        error = check_internal_password()
+        record_phase('auth', time.perf_counter() - started)
+        if error is not None:
+            return error
         
         return f(*args, **kwargs)
     return decorated_function
 
+def conditional_positions(f):
+    """持仓读取接口的条件请求支持（ETag / If-None-Match）
+
+    ETag 由全局持仓数据版本号和请求参数组成，版本号在计算响应之前读取，
+    因此 ETag 不会比响应内容更新。命中时直接返回304，不做任何汇总和序列化。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.response_format = position_formats.negotiate_format()
+        if g.response_format is None:
+            return jsonify({'error': '不支持的响应格式'}), 400
+        
+        g.data_version = DataVersion.get(DataVersion.POSITIONS)
+        variant = hashlib.sha1(f'{request.full_path}|{g.response_format}'.encode('utf-8')).hexdigest()[:16]
+        etag = f'{g.data_version}-{variant}'
+        
+        # 客户端缓存的可能是压缩后的表示（ETag 带编码后缀）
+        matched = next((tag for tag in response_compressor.etag_variants(etag)
+                        if request.if_none_match.contains(tag)), None)
+        if matched:
+            response = app.response_class(status=304)
+            response.set_etag(matched)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response.set_etag(etag)
+        
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+        return response
+    return decorated_function
+
 app = create_app()
 
+# 汇总持仓响应缓存，键为 (排序后的策略列表, 是否包含调整策略)，值为序列化后的响应体
+totals_cache = VersionedLRUCache(CACHE_CONFIG.get('MAX_ENTRIES', 128))
+
 @app.route('/api/v1/positions/update', methods=['POST'])
 @require_auth  # 使用统一认证装饰器
 def update_positions():
@@ -106,12 +335,95 @@ def update_positions():
         if not data or 'strategy_name' not in data or 'positions' not in data:
             return jsonify({'error': '无效的数据格式'}), 400
             
-        StrategyPosition.update_positions(data['strategy_name'], data['positions'])
+        version = StrategyPosition.update_positions(data['strategy_name'], data['positions'])
         return jsonify({
             'message': '持仓更新成功',
+            'version': version,
             'client_id': getattr(request, 'client_id', 'unknown'),
             'auth_type': getattr(request, 'auth_type', 'unknown')
         })
+    except validation.PositionValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v1/positions/update/batch', methods=['POST'])
+@require_auth
+def update_positions_batch():
+    """在一个事务内批量更新多个策略的持仓"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('updates'), list):
+            return jsonify({'error': '无效的数据格式'}), 400
+        
+        version = StrategyPosition.update_positions_batch(data['updates'])
+        return jsonify({
+            'message': '批量持仓更新成功',
+            'strategies_count': len(data['updates']),
+            'version': version,
+            'client_id': getattr(request, 'client_id', 'unknown'),
+            'auth_type': getattr(request, 'auth_type', 'unknown')
+        })
+    except validation.PositionValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v1/positions/update/partial', methods=['POST', 'PATCH'])
+@require_auth
+def patch_positions():
+    """部分更新持仓：只新增/修改 upserts 中的代码、删除 deletes 中的代码"""
+    try:
+        data = request.get_json()
+        if not data or 'strategy_name' not in data or ('upserts' not in data and 'deletes' not in data):
+            return jsonify({'error': '无效的数据格式'}), 400
+        
+        upserts = data.get('upserts', [])
+        deletes = data.get('deletes', [])
+        version = StrategyPosition.patch_positions(data['strategy_name'], upserts, deletes)
+        return jsonify({
+            'message': '持仓部分更新成功',
+            'upserts_count': len(upserts),
+            'deletes_count': len(deletes),
+            'version': version,
+            'client_id': getattr(request, 'client_id', 'unknown'),
+            'auth_type': getattr(request, 'auth_type', 'unknown')
+        })
+    except validation.PositionValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v1/positions/update/delta', methods=['POST'])
+@require_auth
+def update_positions_delta():
+    """基于指定版本的增量更新，策略持仓在此之后被修改过时返回409，客户端需改为全量上传"""
+    try:
+        data = request.get_json()
+        if not data or 'strategy_name' not in data or 'base_version' not in data:
+            return jsonify({'error': '无效的数据格式'}), 400
+        
+        upserts = data.get('upserts', [])
+        deletes = data.get('deletes', [])
+        version = StrategyPosition.patch_positions(
+            data['strategy_name'], upserts, deletes, base_version=data['base_version']
+        )
+        return jsonify({
+            'message': '持仓增量更新成功',
+            'upserts_count': len(upserts),
+            'deletes_count': len(deletes),
+            'version': version,
+            'client_id': getattr(request, 'client_id', 'unknown'),
+            'auth_type': getattr(request, 'auth_type', 'unknown')
+        })
+    except validation.PositionValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    except StaleVersionError as e:
+        return jsonify({
+            'error': str(e),
+            'base_version': e.base_version,
+            'current_version': e.current_version
+        }), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -131,6 +443,8 @@ def update_positions_internal():
             'positions_count': len(data['positions']),
             'auth_type': 'internal_password'
         })
+    except validation.PositionValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -145,6 +459,25 @@ def get_auth_info():
         'internal_password_info': InternalPassword.get_current_password_info()
     })
 
+@app.route('/api/v1/auth/session', methods=['POST'])
+@require_auth
+def create_auth_session():
+    """使用RSA令牌换取短期会话，之后的请求使用会话密钥做HMAC签名"""
+    if not CRYPTO_AUTH_CONFIG.get('ENABLED', True) or not auth_module.crypto_auth:
+        return jsonify({'error': '未启用加密认证，无法创建会话'}), 400
+    if CRYPTO_AUTH_CONFIG.get('SINGLE_USE_TOKENS', False):
+        # 会话签名可以在允许的时间偏差内重放，一次性令牌模式下不签发会话
+        return jsonify({'error': '已启用一次性令牌，无法创建会话'}), 400
+    if request.auth_type != 'crypto':
+        # 会话只能通过RSA令牌创建，不能用旧会话续期
+        return jsonify({'error': '创建会话需要使用RSA认证令牌'}), 401
+    
+    session = auth_module.crypto_auth.create_session(
+        request.client_id, CRYPTO_AUTH_CONFIG.get('SESSION_TTL', 3600)
+    )
+    session['client_id'] = request.client_id
+    return jsonify(session)
+
 @app.route('/api/v1/internal/password/info', methods=['GET'])
 def get_internal_password_info():
     """获取内部密码信息"""
@@ -172,9 +505,32 @@ def set_internal_password():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/positions/strategy/<strategy_name>', methods=['GET'])
+@conditional_positions
 def get_strategy_positions(strategy_name):
     try:
+        try:
+            as_of = parse_time_arg(request.args, 'as_of')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         strategy = StrategyPosition.query.filter_by(strategy_name=strategy_name).first()
+        if strategy and as_of is not None:
+            # 从持仓历史重建该时间点的持仓
+            state = PositionHistory.positions_as_of([strategy], as_of)[strategy_name]
+            if state is None:
+                raise HistoryUnavailableError([strategy_name], as_of)
+            return jsonify({
+                'positions': [{
+                    'code': position['code'],
+                    'name': position.get('name', ""),
+                    'volume': position['volume'],
+                    'cost': position['cost']
+                } for position in state['positions']],
+                'update_time': state['update_time'].strftime('%Y-%m-%d %H:%M:%S') if state['update_time'] else None,
+                'as_of': as_of.strftime('%Y-%m-%d %H:%M:%S'),
+                'version': g.data_version,
+                'strategy_version': state['version']
+            })
         if strategy:
             return jsonify({
                 'positions': [{
@@ -183,17 +539,24 @@ def get_strategy_positions(strategy_name):
                     'volume': position['volume'],
                     'cost': position['cost']
                 } for position in strategy.positions],
-                'update_time': strategy.update_time.strftime('%Y-%m-%d %H:%M:%S') if strategy.update_time else None
+                'update_time': strategy.update_time.strftime('%Y-%m-%d %H:%M:%S') if strategy.update_time else None,
+                'version': g.data_version,
+                'strategy_version': strategy.version
             })
         else:
             return jsonify({
                 'positions': [],
-                'update_time': None
+                'update_time': None,
+                'version': g.data_version,
+                'strategy_version': 0
             })
+    except HistoryUnavailableError as e:
+        return jsonify({'error': str(e), 'strategies': e.strategy_names}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/positions/total', methods=['GET'])
+@conditional_positions
 def get_total_positions():
     try:
         strategy_names_str = request.args.get('strategies')
@@ -202,33 +565,370 @@ def get_total_positions():
         # 是否包含调整策略，默认包含
         include_adjustments = request.args.get('include_adjustments', 'true').lower() == 'true'
         
-        result = StrategyPosition.get_total_positions(strategy_names, include_adjustments)
+        try:
+            as_of = parse_time_arg(request.args, 'as_of')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        fmt = g.response_format
+        if as_of is not None:
+            # 历史时间点的汇总由持仓历史重建，不经过汇总表和响应缓存
+            result = StrategyPosition.get_total_positions_as_of(as_of, strategy_names, include_adjustments)
+            payload = {
+                'positions': result['positions'],
+                'update_time': result['update_time'].strftime('%Y-%m-%d %H:%M:%S') if result['update_time'] else None,
+                'as_of': as_of.strftime('%Y-%m-%d %H:%M:%S'),
+                'version': g.data_version
+            }
+            if fmt != position_formats.JSON:
+                payload['format'] = position_formats.COLUMNAR
+                payload['positions'] = position_formats.to_columns(
+                    payload['positions'], position_formats.TOTAL_POSITION_COLUMNS
+                )
+            body, mimetype = position_formats.dumps(payload, fmt)
+            return app.response_class(body, mimetype=mimetype)
+        
+        cache_key = (tuple(sorted(set(strategy_names))) if strategy_names else None, include_adjustments, fmt)
+        use_cache = CACHE_CONFIG.get('ENABLED', True)
+        cached = totals_cache.get(cache_key, g.data_version) if use_cache else None
+        if cached is None:
+            result = StrategyPosition.get_total_positions(strategy_names, include_adjustments)
+            payload = {
+                'positions': result['positions'],
+                'update_time': result['update_time'].strftime('%Y-%m-%d %H:%M:%S') if result['update_time'] else None,
+                'version': g.data_version
+            }
+            if fmt != position_formats.JSON:
+                payload['format'] = position_formats.COLUMNAR
+                payload['positions'] = position_formats.to_columns(
+                    payload['positions'], position_formats.TOTAL_POSITION_COLUMNS
+                )
+            cached = position_formats.dumps(payload, fmt)
+            if use_cache:
+                totals_cache.set(cache_key, g.data_version, cached)
+        body, mimetype = cached
+        return app.response_class(body, mimetype=mimetype)
+    except HistoryUnavailableError as e:
+        return jsonify({'error': str(e), 'strategies': e.strategy_names}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v1/positions/total/changes', methods=['GET'])
+def get_total_position_changes():
+    """获取某数据版本之后汇总持仓发生变化的代码，落后太多时返回全量数据"""
+    try:
+        try:
+            since_version = int(request.args.get('since', ''))
+        except ValueError:
+            return jsonify({'error': '缺少或无效的since参数'}), 400
+        
+        strategy_names_str = request.args.get('strategies')
+        strategy_names = strategy_names_str.split(',') if strategy_names_str else None
+        include_adjustments = request.args.get('include_adjustments', 'true').lower() == 'true'
+        
+        result = StrategyPosition.get_total_position_changes(
+            since_version, strategy_names, include_adjustments
+        )
         return jsonify({
             'positions': result['positions'],
+            'removed': result['removed'],
+            'full': result['full'],
+            'version': result['version'],
             'update_time': result['update_time'].strftime('%Y-%m-%d %H:%M:%S') if result['update_time'] else None
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# /api/v1/positions/all 可选择返回的字段
+ALL_POSITIONS_FIELDS = ('strategy_name', 'update_time', 'strategy_version', 'positions')
+ALL_POSITIONS_DEFAULT_FIELDS = ('strategy_name', 'positions', 'update_time')
+ALL_POSITIONS_MAX_LIMIT = 1000
+
+def parse_time_arg(args, name):
+    """解析时间参数（YYYY-MM-DD HH:MM:SS 或 YYYY-MM-DD），未提供时返回None，格式无效时抛出ValueError"""
+    value = args.get(name)
+    if not value:
+        return None
+    for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+    raise ValueError(f"{name} 格式应为 YYYY-MM-DD HH:MM:SS 或 YYYY-MM-DD")
+
+def parse_all_positions_args(args):
+    """解析 /api/v1/positions/all 的分页、过滤和字段参数，参数无效时抛出ValueError"""
+    fields = args.get('fields')
+    fields = [field for field in fields.split(',') if field] if fields else list(ALL_POSITIONS_DEFAULT_FIELDS)
+    unknown = set(fields) - set(ALL_POSITIONS_FIELDS)
+    if unknown:
+        raise ValueError(f"不支持的字段: {','.join(sorted(unknown))}，可选: {','.join(ALL_POSITIONS_FIELDS)}")
+    
+    limit = args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= ALL_POSITIONS_MAX_LIMIT:
+            raise ValueError(f"limit 必须为 1-{ALL_POSITIONS_MAX_LIMIT} 的整数")
+        limit = int(limit)
+    
+    cursor = args.get('cursor')
+    if cursor is not None:
+        if not cursor.isdigit():
+            raise ValueError("无效的cursor参数")
+        cursor = int(cursor)
+    
+    updated_since = parse_time_arg(args, 'updated_since')
+    
+    codes = args.get('codes') or args.get('code')
+    return {
+        'fields': fields,
+        'prefix': args.get('prefix') or None,
+        'codes': [code for code in codes.split(',') if code] if codes else None,
+        'updated_since': updated_since or None,
+        'after_id': cursor,
+        'limit': limit
+    }
+
+def format_strategy_item(item, fields, columnar=False):
+    """按选择的字段输出单个策略"""
+    strategy = {}
+    for field in fields:
+        if field == 'positions':
+            positions = [{
+                'code': pos['code'],
+                'name': pos.get('name', ""),
+                'volume': pos['volume'],
+                'cost': pos['cost']
+            } for pos in item['positions']]
+            if columnar:
+                positions = position_formats.to_columns(positions, position_formats.STRATEGY_POSITION_COLUMNS)
+            strategy['positions'] = positions
+        elif field == 'update_time':
+            strategy['update_time'] = item['update_time'].strftime('%Y-%m-%d %H:%M:%S') if item['update_time'] else None
+        else:
+            strategy[field] = item[field]
+    return strategy
+
 @app.route('/api/v1/positions/all', methods=['GET'])
+@conditional_positions
 def get_all_positions():
+    """所有策略持仓，支持游标分页（limit、cursor）、过滤（prefix、codes、updated_since）和字段选择（fields）"""
     try:
-        positions = StrategyPosition.get_all_strategy_positions()
-        return jsonify({
-            'strategies': [{
-                'strategy_name': item['strategy_name'],
-                'positions': [{
-                    'code': pos['code'],
-                    'name': pos.get('name', ""),
-                    'volume': pos['volume'],
-                    'cost': pos['cost']
-                } for pos in item['positions']],
-                'update_time': item['update_time'].strftime('%Y-%m-%d %H:%M:%S')
-            } for item in positions]
-        })
+        try:
+            params = parse_all_positions_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        fields = params.pop('fields')
+        columnar = g.response_format != position_formats.JSON
+        
+        # 未分页的JSON导出流式输出，内存占用不随策略数量增长
+        if params['limit'] is None and g.response_format != position_formats.MSGPACK:
+            params.pop('limit')
+            params.pop('after_id')
+            items = StrategyPosition.iter_strategy_positions(
+                with_positions='positions' in fields,
+                batch_size=STREAMING_CONFIG.get('BATCH_SIZE', 1000),
+                **params
+            )
+            extra = {'version': g.data_version}
+            if columnar:
+                extra['format'] = position_formats.COLUMNAR
+            chunks = position_formats.iter_json_object(
+                'strategies', (format_strategy_item(item, fields, columnar) for item in items), extra,
+                chunk_size=STREAMING_CONFIG.get('CHUNK_SIZE', 64 * 1024)
+            )
+            # 先生成第一块，查询出错时仍能返回500
+            first_chunk = next(chunks)
+            return Response(stream_with_context(itertools.chain([first_chunk], chunks)),
+                            mimetype=position_formats.mimetype_for(g.response_format))
+        
+        items, next_cursor = StrategyPosition.query_strategy_positions(
+            with_positions='positions' in fields, **params
+        )
+        strategies = [format_strategy_item(item, fields, columnar) for item in items]
+        
+        payload = {'strategies': strategies, 'version': g.data_version}
+        if params['limit']:
+            payload['next_cursor'] = str(next_cursor) if next_cursor is not None else None
+        if columnar:
+            payload['format'] = position_formats.COLUMNAR
+        body, mimetype = position_formats.dumps(payload, g.response_format)
+        return app.response_class(body, mimetype=mimetype)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 当前进程中打开的推送连接数（每个连接占用一个uwsgi线程）
+_stream_connections = 0
+_stream_lock = threading.Lock()
+
+def stream_connection_limit():
+    """每个进程允许的推送连接数
+
+    未配置 MAX_CONNECTIONS 时按uwsgi的线程数计算，每个进程保留 RESERVED_THREADS 个线程处理普通请求，
+    线程不够时不接受推送连接（客户端回退到轮询）；不在uwsgi中运行时（开发服务器每个请求一个线程）默认为8。
+    """
+    if STREAM_CONFIG.get('MAX_CONNECTIONS') is not None:
+        return STREAM_CONFIG['MAX_CONNECTIONS']
+    try:
+        import uwsgi
+    except ImportError:
+        return 8
+    threads = uwsgi.opt.get('threads', b'1')
+    if isinstance(threads, list):
+        threads = threads[-1]
+    if isinstance(threads, bytes):
+        threads = threads.decode()
+    return max(int(threads) - STREAM_CONFIG.get('RESERVED_THREADS', 2), 0)
+
+def _format_sse(event, data, event_id=None):
+    """格式化一条Server-Sent Events消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/api/v1/positions/stream', methods=['GET'])
+def stream_positions():
+    """目标持仓变更推送（Server-Sent Events）
+
+    每个连接定期读取共享的数据版本号，因此任意uwsgi进程写入的变更都能被推送出去。
+    事件ID即数据版本号，断线重连时通过 Last-Event-ID 从断点继续。
+    """
+    global _stream_connections
+    
+    strategy_names_str = request.args.get('strategies')
+    strategy_names = strategy_names_str.split(',') if strategy_names_str else None
+    include_adjustments = request.args.get('include_adjustments', 'true').lower() == 'true'
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_version = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': '无效的Last-Event-ID'}), 400
+    
+    max_connections = stream_connection_limit()
+    with _stream_lock:
+        if _stream_connections >= max_connections:
+            # 连接数已满，客户端应回退到轮询
+            return jsonify({'error': '推送连接数已满，请使用轮询'}), 503
+        _stream_connections += 1
+    
+    poll_interval = STREAM_CONFIG.get('POLL_INTERVAL', 0.5)
+    heartbeat_interval = STREAM_CONFIG.get('HEARTBEAT_INTERVAL', 15)
+    max_duration = STREAM_CONFIG.get('MAX_DURATION', 300)
+    
+    def generate():
+        try:
+            current_version = DataVersion.get(DataVersion.POSITIONS)
+            yield f'retry: {STREAM_CONFIG.get("RETRY_MS", 3000)}\n\n'
+            
+            if last_version is None:
+                # 新连接先告知当前版本，客户端据此做一次全量同步
+                yield _format_sse('positions', {'version': current_version, 'initial': True}, current_version)
+                seen_version = current_version
+            else:
+                seen_version = last_version
+            
+            started = last_sent = time.time()
+            while time.time() - started < max_duration:
+                current_version = DataVersion.get(DataVersion.POSITIONS)
+                if current_version > seen_version:
+                    events, complete = PositionEvent.get_events_since(
+                        seen_version, strategy_names, include_adjustments
+                    )
+                    if events or not complete:
+                        yield _format_sse('positions', {
+                            'version': current_version,
+                            'strategies': sorted({event.strategy_name for event in events}),
+                            'codes': sorted({code for event in events for code in event.codes}),
+                            'resync': not complete
+                        }, current_version)
+                        last_sent = time.time()
+                    seen_version = current_version
+                
+                # 结束本次读取的事务并归还连接，下次轮询才能读到其他进程提交的数据
+                db.session.remove()
+                
+                if time.time() - last_sent >= heartbeat_interval:
+                    yield ': heartbeat\n\n'
+                    last_sent = time.time()
+                time.sleep(poll_interval)
+        finally:
+            db.session.remove()
+    
+    def release_connection():
+        global _stream_connections
+        with _stream_lock:
+            _stream_connections -= 1
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 无论生成器是否开始执行，连接关闭时都释放计数
+    response.call_on_close(release_connection)
+    return response
+
+@app.route('/api/v1/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """当前进程的缓存命中统计（每个uwsgi进程独立统计）"""
+    return jsonify({
+        'pid': os.getpid(),
+        'totals_cache': totals_cache.stats(),
+        'auth_token_cache': auth_module.token_cache.stats(),
+        'response_compression': response_compressor.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 指标（合并所有uwsgi进程）"""
+    if not METRICS_CONFIG.get('ENABLED', True):
+        return jsonify({'error': '未启用指标统计'}), 404
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/v1/profiles', methods=['GET'])
+@require_internal_password
+def list_profiles():
+    """最近的性能分析结果（所有进程共享同一目录）"""
+    return jsonify({
+        'profiles': request_profiler.list_profiles(),
+        'sample_rate': request_profiler.sample_rate,
+        'max_profiles': request_profiler.max_profiles
+    })
+
+@app.route('/api/v1/profiles/<profile_id>', methods=['GET'])
+@require_internal_password
+def get_profile(profile_id):
+    """性能分析结果摘要，sort 为 pstats 排序键（cumulative/tottime/calls），limit 为输出的函数数"""
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls', 'ncalls', 'time'):
+        return jsonify({'error': '不支持的排序方式'}), 400
+    limit = request.args.get('limit', '30')
+    if not limit.isdigit():
+        return jsonify({'error': '无效的limit参数'}), 400
+    
+    summary = request_profiler.summary(profile_id, int(limit), sort)
+    meta_path = request_profiler.path_for(profile_id, '.json')
+    if summary is None or meta_path is None:
+        return jsonify({'error': '性能分析结果不存在'}), 404
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['summary'] = summary
+    return jsonify(meta)
+
+@app.route('/api/v1/profiles/<profile_id>/<kind>', methods=['GET'])
+@require_internal_password
+def download_profile(profile_id, kind):
+    """下载原始结果：prof（pstats/snakeviz）或 collapsed（折叠栈，可用 flamegraph.pl、speedscope 生成火焰图）"""
+    if kind not in ('prof', 'collapsed'):
+        return jsonify({'error': '不支持的文件类型，可选: prof, collapsed'}), 400
+    path = request_profiler.path_for(profile_id, f'.{kind}')
+    if path is None:
+        return jsonify({'error': '性能分析结果不存在'}), 404
+    mimetype = 'text/plain' if kind == 'collapsed' else 'application/octet-stream'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=f'{profile_id}.{kind}')
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -3,11 +3,17 @@ import json
 import base64
 import time
 import os
+import hashlib
+import hmac
+import secrets
+import threading
+from collections import OrderedDict
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.exceptions import InvalidSignature
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
+from middleware.metrics import record_phase
 
 class SimpleCryptoAuth:
     def __init__(self, private_key_pem=None, public_key_pem=None, private_key_file=None, public_key_file=None):
@@ -96,20 +102,203 @@ class SimpleCryptoAuth:
         except Exception as e:
             return False, f"验证错误: {str(e)}"
 
+    @property
+    def session_secret(self):
+        """会话签发密钥，由服务端私钥派生，所有uwsgi进程一致且无需额外存储"""
+        if not hasattr(self, '_session_secret'):
+            private_der = self.private_key.private_bytes(
+                serialization.Encoding.DER,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            )
+            self._session_secret = hashlib.sha256(b'jq2qmt-session:' + private_der).digest()
+        return self._session_secret
+
+    def _session_key(self, session_payload):
+        return hmac.new(self.session_secret, b'key:' + session_payload, hashlib.sha256).digest()
+
+    def create_session(self, client_id, ttl=3600):
+        """签发会话
+
+        会话令牌本身携带客户端ID和过期时间并由服务端签名，会话密钥可由令牌重新派生，
+        因此服务端不保存任何会话状态。会话密钥使用公钥加密后返回，只有持有私钥的客户端能解密。
+
+        Returns:
+            dict: session_token、encrypted_session_key（Base64）、expires_at
+        """
+        expires_at = int(time.time()) + ttl
+        payload = base64.urlsafe_b64encode(json.dumps({
+            'client_id': client_id,
+            'expires_at': expires_at,
+            'nonce': secrets.token_hex(8)
+        }, sort_keys=True).encode('utf-8'))
+        tag = hmac.new(self.session_secret, b'token:' + payload, hashlib.sha256).hexdigest()
+        
+        encrypted_key = self.public_key.encrypt(
+            self._session_key(payload),
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+        return {
+            'session_token': f"{payload.decode('utf-8')}.{tag}",
+            'encrypted_session_key': base64.b64encode(encrypted_key).decode('utf-8'),
+            'expires_at': expires_at
+        }
+
+    def verify_session_request(self, session_token, timestamp, signature, message_parts, max_skew=300):
+        """验证使用会话密钥签名的请求
+
+        Args:
+            message_parts: 参与签名的请求要素（方法、路径、查询字符串、请求体SHA256）
+
+        Returns:
+            tuple: (是否通过, 客户端ID或错误信息)
+        """
+        try:
+            payload, tag = session_token.encode('utf-8').rsplit(b'.', 1)
+            expected_tag = hmac.new(self.session_secret, b'token:' + payload, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(tag.decode('utf-8'), expected_tag):
+                return False, "会话令牌无效"
+            
+            session = json.loads(base64.urlsafe_b64decode(payload))
+            current_time = int(time.time())
+            if current_time >= session['expires_at']:
+                return False, "会话已过期"
+            if abs(current_time - int(timestamp)) > max_skew:
+                return False, "请求时间戳超出允许范围"
+            
+            message = '\n'.join([str(timestamp)] + list(message_parts)).encode('utf-8')
+            expected_signature = hmac.new(self._session_key(payload), message, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(signature, expected_signature):
+                return False, "请求签名验证失败"
+            
+            return True, session['client_id']
+        except Exception as e:
+            return False, f"验证错误: {str(e)}"
+
+class VerifiedTokenCache:
+    """已验证令牌的缓存，按令牌摘要存储，到期自动淘汰
+
+    同一令牌在有效期内重复使用时直接命中缓存，跳过RSA验签；
+    启用一次性令牌时，同一结构用于识别重放。
+    """
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.verifications = 0  # 实际执行的RSA验签次数
+        self.avoided = 0  # 命中缓存而省去的验签次数
+        self.replays = 0  # 拒绝的重放次数
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _evict_expired(self, now):
+        # 条目按写入顺序排列、令牌有效期相同，因此大致按过期时间排序；
+        # 未及时淘汰的过期条目在读取时同样视为不存在
+        while self._entries:
+            key, (expire_at, _) = next(iter(self._entries.items()))
+            if expire_at > now:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, digest):
+        """返回缓存的认证数据，不存在或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] <= now:
+                return None
+            self.avoided += 1
+            return entry[1]
+
+    def is_replay(self, digest):
+        """一次性令牌模式下判断令牌是否已在当前进程使用过"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            return entry is not None and entry[0] > now
+
+    def record_verification(self):
+        with self._lock:
+            self.verifications += 1
+
+    def record_replay(self):
+        with self._lock:
+            self.replays += 1
+
+    def add(self, digest, auth_data, expire_at):
+        """记录验证通过的令牌，已存在时返回False（用于识别重放）"""
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            if digest in self._entries and self._entries[digest][0] > now:
+                return False
+            self._entries[digest] = (expire_at, auth_data)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'verifications': self.verifications,
+                'avoided_verifications': self.avoided,
+                'rejected_replays': self.replays
+            }
+
 # 全局认证实例（在app.py中初始化）
 crypto_auth = None
 
+# 已验证令牌缓存
+token_cache = VerifiedTokenCache()
+
+# 跨进程的一次性令牌登记函数 nonce_store(digest, expire_at) -> bool（在app.py中设置），
+# 令牌已被其他进程使用过时返回False；未设置时只在当前进程内识别重放
+nonce_store = None
+
+# 认证配置，首次使用时从config加载，避免每个请求重复导入
+_auth_config = None
+
+def _get_auth_config():
+    global _auth_config
+    if _auth_config is None:
+        from config import CRYPTO_AUTH_CONFIG
+        _auth_config = CRYPTO_AUTH_CONFIG
+    return _auth_config
+
 def require_auth(f):
     """统一认证装饰器（支持加密和简单API密钥两种模式）"""
+    @wraps(f)
+    def authenticated(*args, **kwargs):
+        # 认证通过，记录认证耗时后进入视图函数
+        record_phase('auth', time.perf_counter() - g.auth_started)
+        g.auth_started = None
+        return f(*args, **kwargs)
+    
+    crypto_function = _require_crypto_auth(authenticated)
+    simple_function = _require_simple_auth(authenticated)
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        from config import CRYPTO_AUTH_CONFIG
-        
-        # 检查是否启用加密认证
-        if CRYPTO_AUTH_CONFIG.get('ENABLED', True):
-            return _require_crypto_auth(f)(*args, **kwargs)
-        else:
-            return _require_simple_auth(f)(*args, **kwargs)
+        g.auth_started = time.perf_counter()
+        try:
+            # 检查是否启用加密认证
+            if _get_auth_config().get('ENABLED', True):
+                return crypto_function(*args, **kwargs)
+            else:
+                return simple_function(*args, **kwargs)
+        finally:
+            # 认证失败时没有进入视图函数，整个过程都计入认证耗时
+            if g.auth_started is not None:
+                record_phase('auth', time.perf_counter() - g.auth_started)
     
     return decorated_function
 
@@ -121,29 +310,54 @@ def _require_crypto_auth(f):
             return jsonify({'error': '认证系统未初始化'}), 500
         
         try:
+            auth_config = _get_auth_config()
+            single_use = auth_config.get('SINGLE_USE_TOKENS', False)
+            
+            # 携带会话令牌的请求使用HMAC签名验证。会话签名在 SESSION_MAX_SKEW 内可以重放，
+            # 启用一次性令牌时不接受会话签名
+            if request.headers.get('X-Auth-Session'):
+                if single_use:
+                    return jsonify({'error': '认证失败: 已启用一次性令牌，不接受会话签名'}), 401
+                return _verify_session_request(f, *args, **kwargs)
+            
             # 从请求头获取认证信息
             auth_header = request.headers.get('X-Auth-Token')
             if not auth_header:
                 return jsonify({'error': '缺少认证令牌'}), 401
             
-            # 解析认证数据
-            auth_info = json.loads(base64.b64decode(auth_header).decode('utf-8'))
-            auth_data = auth_info.get('auth_data')
-            signature = auth_info.get('signature')
+            digest = VerifiedTokenCache.digest(auth_header)
             
-            if not auth_data or not signature:
-                return jsonify({'error': '认证令牌格式错误'}), 401
-            
-            # 从配置获取参数
-            from config import CRYPTO_AUTH_CONFIG
-            max_age = CRYPTO_AUTH_CONFIG.get('TOKEN_MAX_AGE', 300)
-            
-            # 验证令牌
-            is_valid, message = crypto_auth.verify_auth_token(
-                auth_data, signature, max_age
-            )
-            if not is_valid:
-                return jsonify({'error': f'认证失败: {message}'}), 401
+            # 同一令牌在有效期内重复使用时跳过验签，一次性令牌模式下重复使用即为重放
+            if single_use and token_cache.is_replay(digest):
+                token_cache.record_replay()
+                return jsonify({'error': '认证失败: 令牌已被使用'}), 401
+            auth_data = None if single_use else token_cache.get(digest)
+            if auth_data is None:
+                # 解析认证数据
+                auth_info = json.loads(base64.b64decode(auth_header).decode('utf-8'))
+                auth_data = auth_info.get('auth_data')
+                signature = auth_info.get('signature')
+                
+                if not auth_data or not signature:
+                    return jsonify({'error': '认证令牌格式错误'}), 401
+                if single_use and not auth_data.get('nonce'):
+                    return jsonify({'error': '认证令牌缺少nonce'}), 401
+                
+                max_age = auth_config.get('TOKEN_MAX_AGE', 300)
+                
+                # 验证令牌
+                token_cache.record_verification()
+                is_valid, message = crypto_auth.verify_auth_token(
+                    auth_data, signature, max_age
+                )
+                if not is_valid:
+                    return jsonify({'error': f'认证失败: {message}'}), 401
+                
+                expire_at = auth_data['timestamp'] + max_age
+                is_new = token_cache.add(digest, auth_data, expire_at)
+                if single_use and (not is_new or (nonce_store is not None and not nonce_store(digest, expire_at))):
+                    token_cache.record_replay()
+                    return jsonify({'error': '认证失败: 令牌已被使用'}), 401
             
             # 将客户端ID添加到请求上下文
             request.client_id = auth_data.get('client_id')
@@ -155,20 +369,48 @@ def _require_crypto_auth(f):
     
     return decorated_function
 
+def session_message_parts(method, path, query_string, body):
+    """会话签名覆盖的请求要素，客户端和服务端须保持一致"""
+    return [method.upper(), path, query_string, hashlib.sha256(body).hexdigest()]
+
+def _verify_session_request(f, *args, **kwargs):
+    """验证会话HMAC签名（请求头 X-Auth-Session / X-Auth-Timestamp / X-Auth-Signature）"""
+    timestamp = request.headers.get('X-Auth-Timestamp')
+    signature = request.headers.get('X-Auth-Signature')
+    if not timestamp or not signature:
+        return jsonify({'error': '缺少会话签名'}), 401
+    
+    is_valid, result = crypto_auth.verify_session_request(
+        request.headers['X-Auth-Session'],
+        timestamp,
+        signature,
+        session_message_parts(
+            request.method,
+            request.path,
+            request.query_string.decode('utf-8'),
+            request.get_data(cache=True)
+        ),
+        _get_auth_config().get('SESSION_MAX_SKEW', 300)
+    )
+    if not is_valid:
+        return jsonify({'error': f'认证失败: {result}'}), 401
+    
+    request.client_id = result
+    request.auth_type = 'session'
+    return f(*args, **kwargs)
+
 def _require_simple_auth(f):
     """简单API密钥认证装饰器"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
-            from config import CRYPTO_AUTH_CONFIG
-            
             # 从请求头或查询参数获取API密钥
             api_key = request.headers.get('X-API-Key')
             if not api_key:
                 api_key = request.args.get('api_key')
             
             # 验证API密钥
-            expected_key = CRYPTO_AUTH_CONFIG.get('SIMPLE_API_KEY')
+            expected_key = _get_auth_config().get('SIMPLE_API_KEY')
             if not api_key or api_key != expected_key:
                 return jsonify({'error': '无效的API密钥或缺少API密钥'}), 401
             
@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """带数据版本号的进程内LRU缓存
+
+    每个缓存项记录写入时的数据版本号，读取时传入当前版本号，版本不一致即视为失效。
+    当前版本号来自数据库中共享的 data_versions 表，因此任意进程写入持仓后，
+    所有进程在下一次读取时都会自动失效旧缓存，不需要跨进程通知。
+    """
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """读取缓存，不存在或版本号不一致时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """命中统计（仅当前进程）"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,179 @@
+import gzip
+import io
+import json
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+from middleware.metrics import record_phase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class RequestDecompressionMiddleware:
+    """WSGI中间件：透明解压 Content-Encoding 为 gzip/deflate 的请求体
+
+    解压后替换 wsgi.input 并更新 Content-Length，视图函数和认证模块读取到的都是原始请求体。
+    解压后的大小超过 max_size 时直接返回413，防止压缩炸弹。
+    """
+    DECODERS = {
+        'gzip': 16 + zlib.MAX_WBITS,
+        'deflate': zlib.MAX_WBITS,
+    }
+
+    def __init__(self, app, max_size=64 * 1024 * 1024):
+        self.app = app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding not in self.DECODERS:
+            return self.app(environ, start_response)
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        compressed = environ['wsgi.input'].read(length) if length else environ['wsgi.input'].read()
+
+        try:
+            decompressor = zlib.decompressobj(self.DECODERS[encoding])
+            body = decompressor.decompress(compressed, self.max_size + 1)
+            if decompressor.unconsumed_tail or len(body) > self.max_size:
+                return self._error(start_response, '413 Request Entity Too Large', '解压后的请求体过大')
+        except zlib.error as e:
+            return self._error(start_response, '400 Bad Request', f'请求体解压失败: {e}')
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
+
+    @staticmethod
+    def _error(start_response, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+
+class ResponseCompressor:
+    """按 Accept-Encoding 协商压缩响应（brotli 需要安装 brotli 包，否则只支持 gzip/deflate）
+
+    只压缩状态码200、类型为文本/JSON且不小于 min_size 的响应。带 ETag 的响应内容由数据版本号决定，
+    压缩结果按 (请求路径, 编码) 缓存，ETag 不变时直接复用，避免每次轮询都重新压缩。
+    压缩后的 ETag 追加编码后缀，与未压缩的表示区分。
+    """
+    COMPRESSIBLE_TYPES = frozenset([
+        'application/json', 'application/vnd.jq2qmt.columnar+json', 'text/html', 'text/plain', 'text/css',
+        'application/javascript', 'text/javascript', 'application/x-msgpack'
+    ])
+
+    def __init__(self, min_size=1024, level=6, cache=None):
+        """
+        Args:
+            min_size: 响应体达到多少字节才压缩
+            level: 压缩级别（gzip/deflate 1-9）
+            cache: 缓存压缩结果的 VersionedLRUCache，为None时不缓存
+        """
+        self.min_size = min_size
+        self.level = level
+        self.cache = cache
+        self.encoders = OrderedDict()
+        if brotli is not None:
+            self.encoders['br'] = lambda data: brotli.compress(data, quality=min(self.level, 11))
+        self.encoders['gzip'] = lambda data: gzip.compress(data, self.level)
+        self.encoders['deflate'] = lambda data: zlib.compress(data, self.level)
+        self.compressed = 0
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def etag_variants(self, etag):
+        """同一内容各个编码表示的 ETag，用于匹配 If-None-Match"""
+        return [etag] + [f'{etag}-{encoding}' for encoding in self.encoders]
+
+    def compress_response(self, response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if 'Accept-Encoding' not in request.headers:
+            return response
+        encoding = request.accept_encodings.best_match(list(self.encoders))
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            return self._compress_stream(response, encoding)
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        cache_key = (request.full_path, encoding)
+        compressed = self.cache.get(cache_key, etag) if self.cache is not None and etag else None
+        if compressed is None:
+            started = time.perf_counter()
+            compressed = self.encoders[encoding](data)
+            record_phase('compression', time.perf_counter() - started)
+            self.compressed += 1
+            if self.cache is not None and etag:
+                self.cache.set(cache_key, etag, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+
+    def _stream_compressor(self, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=min(self.level, 11))
+            return compressor.process, compressor.finish
+        wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+        return compressor.compress, compressor.flush
+
+    def _compress_stream(self, response, encoding):
+        """流式响应逐块压缩，不缓存"""
+        process, finish = self._stream_compressor(encoding)
+        chunks = response.response
+        environ = request.environ
+
+        def generate():
+            try:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    started = time.perf_counter()
+                    data = process(chunk)
+                    record_phase('compression', time.perf_counter() - started, environ)
+                    if data:
+                        yield data
+                yield finish()
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+
+        response.response = generate()
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        etag, _ = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}')
+        self.compressed += 1
+        return response
+
+    def stats(self):
+        stats = {'encodings': list(self.encoders), 'compressed': self.compressed}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
@@ -0,0 +1,353 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 请求级统计存放在 WSGI environ 中，流式响应在视图函数返回后继续生成时仍能记录
+ENVIRON_ROUTE = 'jq2qmt.metrics.route'
+ENVIRON_PHASES = 'jq2qmt.metrics.phases'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+DB_OPERATIONS = frozenset(['SELECT', 'INSERT', 'UPDATE', 'DELETE'])
+
+
+def record_phase(phase, seconds, environ=None):
+    """累加当前请求某个阶段（auth/db/serialization/compression）的耗时，不在请求中时忽略
+
+    请求上下文结束后（如流式响应的后续输出）需传入该请求的 environ。
+    """
+    if environ is None:
+        if not has_request_context():
+            return
+        environ = request.environ
+    phases = environ.get(ENVIRON_PHASES)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class MetricsRegistry:
+    """进程内的计数器和直方图，按进程写入共享目录，抓取时合并所有进程的数据
+
+    uwsgi 的每个工作进程各自统计，后台线程每隔 flush_interval 秒把本进程的快照写到
+    directory/<pid>.json，/metrics 读取目录下所有快照求和，因此无论请求落在哪个进程，
+    返回的都是全部进程的总量。已退出进程的快照保留到下次服务启动，计数器不会因进程回收而倒退。
+    directory 为None时只统计当前进程。
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.definitions = OrderedDict()  # 名称 -> (类型, 说明, 桶边界)
+        self.collectors = []
+        self.pid = None
+        self._check_pid()
+
+    def _check_pid(self):
+        """首次使用或 fork 之后重置本进程的统计，避免子进程重复计入父进程的数据"""
+        pid = os.getpid()
+        if pid == self.pid:
+            return
+        self.pid = pid
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._dirty = False
+        self._flusher = None
+
+    def _mark_dirty(self):
+        """记录有新数据，首次记录时启动本进程的后台写快照线程（调用方持有锁）"""
+        self._dirty = True
+        if self.directory and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def counter(self, name, help_text):
+        self.definitions[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets):
+        self.definitions[name] = ('histogram', help_text, tuple(buckets))
+
+    def add_collector(self, collector):
+        """注册在写快照时调用的函数，返回 [(计数器名称, 标签dict, 累计值), ...]，用于导出已有的统计"""
+        self.collectors.append(collector)
+
+    @staticmethod
+    def _label_key(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, labels, value=1):
+        self._check_pid()
+        key = (name, self._label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._mark_dirty()
+
+    def observe(self, name, labels, value):
+        self._check_pid()
+        buckets = self.definitions[name][2]
+        key = (name, self._label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram[0][index] += 1
+            histogram[1] += value
+            self._mark_dirty()
+
+    def snapshot(self):
+        """本进程的当前数据（包括各收集函数导出的计数器）"""
+        self._check_pid()
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: [list(counts), total] for key, (counts, total) in self._histograms.items()}
+            self._dirty = False
+        for collector in self.collectors:
+            try:
+                for name, labels, value in collector():
+                    key = (name, self._label_key(labels))
+                    counters[key] = counters.get(key, 0) + value
+            except Exception as e:
+                print(f"指标收集失败: {e}")
+        return counters, histograms
+
+    def flush(self):
+        """把本进程的快照写入共享目录（先写临时文件再替换，读取方不会读到一半的文件）"""
+        if not self.directory:
+            return
+        counters, histograms = self.snapshot()
+        data = {
+            'pid': self.pid,
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), counts, total] for (name, labels), (counts, total) in histograms.items()]
+        }
+        path = os.path.join(self.directory, f'{self.pid}.json')
+        temp_path = f'{path}.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"写入指标快照失败: {e}")
+
+    def _flush_loop(self):
+        pid = self.pid
+        while pid == os.getpid():
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def cleanup(self):
+        """服务启动时删除已退出进程留下的快照"""
+        if not self.directory or not os.path.isdir(self.directory) or os.name == 'nt':
+            return
+        for filename in os.listdir(self.directory):
+            pid = filename.split('.', 1)[0]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+
+    def collect(self):
+        """合并所有进程的数据
+
+        Returns:
+            tuple: (counters, histograms, 进程数)
+        """
+        counters, histograms = self.snapshot()
+        processes = 1
+        if self.directory and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json') or filename == f'{self.pid}.json':
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                processes += 1
+                for name, labels, value in data['counters']:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    counters[key] = counters.get(key, 0) + value
+                for name, labels, counts, total in data['histograms']:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    merged = histograms.get(key)
+                    if merged is None:
+                        histograms[key] = [counts, total]
+                    elif len(merged[0]) == len(counts):
+                        merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                        merged[1] += total
+        return counters, histograms, processes
+
+    @staticmethod
+    def _format_labels(labels, extra=None):
+        items = list(labels) + list(extra or [])
+        if not items:
+            return ''
+        escaped = [
+            '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in items
+        ]
+        return '{' + ','.join(escaped) + '}'
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return repr(value) if isinstance(value, float) else str(value)
+
+    def render(self):
+        """Prometheus 文本格式"""
+        counters, histograms, processes = self.collect()
+        lines = [
+            '# HELP jq2qmt_metrics_processes Number of worker processes reporting metrics',
+            '# TYPE jq2qmt_metrics_processes gauge',
+            f'jq2qmt_metrics_processes {processes}'
+        ]
+        for name, (metric_type, help_text, buckets) in self.definitions.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{self._format_labels(labels)} {self._format_value(value)}')
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else self._format_value(float(bound))
+                    lines.append(f'{name}_bucket{self._format_labels(labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {self._format_value(total)}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """统计JSON序列化耗时的 JSON provider，jsonify 和 app.json.dumps 都会经过这里"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record_phase('serialization', time.perf_counter() - started)
+
+
+class _MeteredBody:
+    """包装响应体，统计实际发送的字节数，在服务器关闭响应时记录本次请求"""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close(self.size)
+
+
+class RequestMetrics:
+    """HTTP请求和数据库查询指标
+
+    - 请求耗时直方图，按路由模板、方法和状态码区分，从收到请求一直统计到响应发送完毕（含流式响应）
+    - 请求各阶段耗时：auth（认证）、db（SQL执行）、serialization（序列化）、compression（压缩），
+      handler 为总耗时扣除以上阶段后剩余的部分
+    - 响应字节数直方图（压缩后实际发送的大小）
+    - SQL语句数量和耗时，通过 SQLAlchemy 引擎事件统计
+    """
+    PHASES = ('auth', 'db', 'serialization', 'compression')
+
+    def __init__(self, registry):
+        self.registry = registry
+        registry.histogram('jq2qmt_http_request_duration_seconds',
+                           'HTTP request latency by route, method and status', LATENCY_BUCKETS)
+        registry.histogram('jq2qmt_http_request_phase_seconds',
+                           'Time spent in auth, handler, db, serialization and compression per request', LATENCY_BUCKETS)
+        registry.histogram('jq2qmt_http_response_size_bytes',
+                           'Response body bytes sent by route', SIZE_BUCKETS)
+        registry.histogram('jq2qmt_db_query_duration_seconds',
+                           'SQL statement execution time by operation', DB_BUCKETS)
+        registry.counter('jq2qmt_cache_requests_total', 'Cache lookups by cache and result')
+
+    def init_app(self, app):
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._set_route)
+        app.wsgi_app = self._wrap_wsgi_app(app.wsgi_app)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    @staticmethod
+    def _set_route():
+        # 使用路由模板而不是实际路径，避免策略名等参数造成标签数量膨胀
+        request.environ[ENVIRON_ROUTE] = request.url_rule.rule if request.url_rule else '<unmatched>'
+
+    def _wrap_wsgi_app(self, wsgi_app):
+        def metered_app(environ, start_response):
+            started = time.perf_counter()
+            environ[ENVIRON_PHASES] = {}
+            status = {}
+
+            def metered_start_response(status_line, headers, exc_info=None):
+                status['code'] = status_line.split(' ', 1)[0]
+                return start_response(status_line, headers, exc_info)
+
+            def on_close(size):
+                self._observe_request(environ, status.get('code', '500'), time.perf_counter() - started, size)
+
+            return _MeteredBody(wsgi_app(environ, metered_start_response), on_close)
+        return metered_app
+
+    def _observe_request(self, environ, status, elapsed, size):
+        route = environ.get(ENVIRON_ROUTE, '<unmatched>')
+        method = environ.get('REQUEST_METHOD', 'GET')
+        registry = self.registry
+        registry.observe('jq2qmt_http_request_duration_seconds',
+                         {'route': route, 'method': method, 'status': status}, elapsed)
+        registry.observe('jq2qmt_http_response_size_bytes', {'route': route}, size)
+
+        phases = environ.get(ENVIRON_PHASES) or {}
+        for phase in self.PHASES:
+            if phase in phases:
+                registry.observe('jq2qmt_http_request_phase_seconds', {'route': route, 'phase': phase}, phases[phase])
+        handler = max(0.0, elapsed - sum(phases.values()))
+        registry.observe('jq2qmt_http_request_phase_seconds', {'route': route, 'phase': 'handler'}, handler)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('jq2qmt_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('jq2qmt_query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+        if operation not in DB_OPERATIONS:
+            operation = 'OTHER'
+        self.registry.observe('jq2qmt_db_query_duration_seconds', {'operation': operation}, elapsed)
+        record_phase('db', elapsed)
@@ -0,0 +1,251 @@
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import request
+
+ENVIRON_PROFILE = 'jq2qmt.profile'
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9]+$')
+
+
+def collapse_stacks(stats, min_fraction=0.0005, max_depth=64):
+    """把 cProfile 统计转换为火焰图工具（flamegraph.pl、speedscope）使用的折叠栈格式
+
+    cProfile 只记录调用者到被调用者的边，没有完整调用栈，这里从入口函数沿调用边展开，
+    按每条边的累计耗时占被调用函数总累计耗时的比例分摊，得到的是近似的调用栈耗时。
+
+    Returns:
+        str: 每行 "入口;调用者;函数 微秒数"
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    def label(func):
+        filename, line, name = func
+        if filename == '~':
+            return name
+        return f'{os.path.basename(filename)}:{line}:{name}'
+
+    roots = [func for func, value in raw.items() if not any(caller in raw for caller in value[4])]
+    total = sum(raw[func][3] for func in roots) or 1.0
+    lines = {}
+
+    def walk(func, scale, path, depth):
+        cc, nc, tt, ct, _ = raw[func]
+        frames = path + [label(func)]
+        self_time = tt * scale
+        if self_time > 0:
+            key = ';'.join(frames)
+            lines[key] = lines.get(key, 0.0) + self_time
+        if depth >= max_depth:
+            return
+        for callee, edge_ct in callees.get(func, []):
+            if callee not in raw or ct <= 0:
+                continue
+            callee_ct = raw[callee][3]
+            share = scale * edge_ct
+            if share / total < min_fraction or callee_ct <= 0:
+                continue
+            # 递归调用不再展开，避免调用环无限循环
+            if label(callee) in frames:
+                continue
+            walk(callee, share / callee_ct, frames, depth + 1)
+
+    for root in roots:
+        walk(root, 1.0, [], 0)
+    return ''.join(
+        f'{stack} {int(seconds * 1e6)}\n'
+        for stack, seconds in sorted(lines.items())
+        if int(seconds * 1e6) > 0
+    )
+
+
+class _ProfiledBody:
+    """包装响应体，响应发送完毕后停止分析并保存结果（流式输出的耗时也会计入）"""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+class RequestProfiler:
+    """按需对请求做 cProfile 分析
+
+    两种触发方式：
+    - 请求头 X-Profile: 1，同时需要通过内部密码验证，用于分析某一个具体请求
+    - 按 sample_rate 随机抽样（可用 paths 限定路径前缀），用于长期在线采集
+
+    每个进程同时只分析一个请求（cProfile 不能嵌套），正在分析时新的请求直接放行。
+    每次分析在 directory 下保存 <id>.prof（pstats/snakeviz 可读）、<id>.collapsed（折叠栈，可生成火焰图）
+    和 <id>.json（请求信息），超过 max_profiles 时删除最早的记录。
+    """
+
+    def __init__(self, directory, sample_rate=0.0, max_profiles=50, paths=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.paths = tuple(paths) if paths else None
+        self.authorize = None
+        self._busy = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def init_app(self, app, authorize):
+        """
+        Args:
+            authorize: 请求头触发时调用的鉴权函数，通过时返回None，否则返回错误响应
+        """
+        self.authorize = authorize
+        app.before_request(self._authorize_request)
+        app.wsgi_app = self._wrap_wsgi_app(app.wsgi_app)
+
+    def _should_sample(self, environ):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return False
+        return self.paths is None or environ.get('PATH_INFO', '').startswith(self.paths)
+
+    def _authorize_request(self):
+        state = request.environ.get(ENVIRON_PROFILE)
+        if state is None or state['trigger'] != 'header':
+            return None
+        error = self.authorize()
+        if error is not None:
+            state['discard'] = True
+            return error
+        return None
+
+    def _next_id(self):
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._sequence)}"
+
+    def _wrap_wsgi_app(self, wsgi_app):
+        def profiled_app(environ, start_response):
+            if environ.get('HTTP_X_PROFILE', '').lower() in ('1', 'true', 'yes'):
+                trigger = 'header'
+            elif self._should_sample(environ):
+                trigger = 'sample'
+            else:
+                return wsgi_app(environ, start_response)
+
+            # 每个进程同时只允许一个分析器运行，忙时直接放行
+            if not self._busy.acquire(blocking=False):
+                if trigger == 'header':
+                    def busy_start_response(status, headers, exc_info=None):
+                        return start_response(status, headers + [('X-Profile-Status', 'busy')], exc_info)
+                    return wsgi_app(environ, busy_start_response)
+                return wsgi_app(environ, start_response)
+            profile_id = self._next_id()
+
+            state = environ[ENVIRON_PROFILE] = {'trigger': trigger, 'discard': False}
+            response_status = {}
+
+            def profiled_start_response(status, headers, exc_info=None):
+                response_status['code'] = int(status.split(' ', 1)[0])
+                if trigger == 'header' and not state['discard']:
+                    headers = headers + [('X-Profile-Id', profile_id)]
+                return start_response(status, headers, exc_info)
+
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+
+            def finish():
+                profile.disable()
+                elapsed = time.perf_counter() - started
+                self._busy.release()
+                if state['discard']:
+                    return
+                try:
+                    self.save(profile_id, profile, {
+                        'id': profile_id,
+                        'trigger': trigger,
+                        'method': environ.get('REQUEST_METHOD'),
+                        'path': environ.get('PATH_INFO'),
+                        'query_string': environ.get('QUERY_STRING', ''),
+                        'status': response_status.get('code'),
+                        'duration_ms': round(elapsed * 1000, 3),
+                        'pid': os.getpid(),
+                        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        'timestamp': time.time()
+                    })
+                except Exception as e:
+                    print(f"保存性能分析结果失败: {e}")
+
+            profile.enable()
+            try:
+                body = wsgi_app(environ, profiled_start_response)
+            except Exception:
+                finish()
+                raise
+            return _ProfiledBody(body, finish)
+        return profiled_app
+
+    def save(self, profile_id, profile, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile_id)
+        profile.dump_stats(base + '.prof')
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            f.write(collapse_stacks(pstats.Stats(profile)))
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        print(f"已保存性能分析结果 {profile_id}: {meta['method']} {meta['path']} {meta['duration_ms']}ms")
+        self.prune()
+
+    def prune(self):
+        """只保留最近的 max_profiles 个分析结果"""
+        for meta in self.list_profiles()[self.max_profiles:]:
+            for suffix in ('.json', '.prof', '.collapsed'):
+                try:
+                    os.remove(os.path.join(self.directory, meta['id'] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self):
+        """所有已保存的分析结果，最新的在前"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda meta: meta.get('timestamp', 0), reverse=True)
+        return profiles
+
+    def path_for(self, profile_id, suffix):
+        """分析结果文件路径，ID无效或文件不存在时返回None"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + suffix)
+        return path if os.path.isfile(path) else None
+
+    def summary(self, profile_id, limit=30, sort='cumulative'):
+        """按累计耗时排序的函数列表（pstats 文本输出）"""
+        path = self.path_for(profile_id, '.prof')
+        if path is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
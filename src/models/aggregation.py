@@ -0,0 +1,146 @@
+"""汇总持仓的计算引擎
+
+输入为按策略、持仓顺序排列的平行列表（代码、名称、数量、成本），输出与逐条累加的结果完全一致：
+代码按首次出现的顺序排列，名称取首次出现的值，全部由整数持仓组成的数量保持为整数，
+汇总数量为0的代码被过滤。
+
+- python : 逐条累加，不依赖第三方库
+- numpy  : 代码映射为整数下标后用 np.bincount 分组求和，数量/金额/平均成本都按数组计算。
+           bincount 按输入顺序逐个累加，浮点结果与逐条累加逐位相同
+- sql    : 由数据库 GROUP BY 汇总（见 StrategyPosition.compute_total_positions_sql），只传回每个代码一行。
+           排序和名称与上面相同；数据库求和顺序不固定，浮点结果可能在末位不同，
+           汇总数量为整数时一律返回整数
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PYTHON = 'python'
+NUMPY = 'numpy'
+SQL = 'sql'
+AUTO = 'auto'
+
+# 支持在数据库中汇总的方言
+SQL_DIALECTS = frozenset(['mysql', 'sqlite', 'postgresql'])
+
+# 默认引擎（在app.py中按配置设置），auto 表示数据库支持时在数据库中汇总，否则安装了NumPy时使用NumPy
+default_engine = AUTO
+
+
+def available_engines(dialect=None):
+    engines = [PYTHON]
+    if np is not None:
+        engines.append(NUMPY)
+    if dialect in SQL_DIALECTS:
+        engines.append(SQL)
+    return engines
+
+
+def resolve_engine(engine=None, dialect=None):
+    """确定实际使用的引擎，dialect 为数据库方言名称（如 mysql、sqlite）"""
+    engine = engine or default_engine
+    if engine == AUTO:
+        if dialect in SQL_DIALECTS:
+            return SQL
+        return NUMPY if np is not None else PYTHON
+    if engine not in available_engines(dialect):
+        raise ValueError(f"不支持的汇总引擎: {engine}，可用: {', '.join(available_engines(dialect))}")
+    return engine
+
+
+def _normalize_volume(volume):
+    # 与 models.normalize_volume 相同，整数持仓还原为整数
+    if isinstance(volume, float) and volume.is_integer():
+        return int(volume)
+    return volume
+
+
+def aggregate_python(codes, names, volumes, costs):
+    totals = {}
+    for code, name, volume, cost in zip(codes, names, volumes, costs):
+        volume = _normalize_volume(volume)
+        total = totals.get(code)
+        if total is None:
+            total = totals[code] = {
+                'code': code,
+                'name': code if name is None else name,
+                'total_volume': 0,
+                'total_cost': 0
+            }
+        total['total_volume'] += volume
+        total['total_cost'] += volume * cost
+
+    positions = []
+    for total in totals.values():
+        if total['total_volume'] != 0:
+            total['avg_cost'] = total.pop('total_cost') / total['total_volume']
+            positions.append(total)
+    return positions
+
+
+def aggregate_numpy(codes, names, volumes, costs):
+    if not codes:
+        return []
+    # 代码映射为整数下标，下标按首次出现的顺序分配
+    code_index = {}
+    index = np.fromiter(
+        (code_index.setdefault(code, len(code_index)) for code in codes),
+        dtype=np.intp, count=len(codes)
+    )
+    group_count = len(code_index)
+    volume_array = np.asarray(volumes, dtype=np.float64)
+    cost_array = np.asarray(costs, dtype=np.float64)
+
+    total_volume = np.bincount(index, weights=volume_array, minlength=group_count)
+    total_cost = np.bincount(index, weights=volume_array * cost_array, minlength=group_count)
+    # 含有非整数数量的代码，汇总数量保持为浮点数
+    fractional = np.bincount(index, weights=(volume_array != np.floor(volume_array)), minlength=group_count) > 0
+
+    nonzero = total_volume != 0
+    avg_cost = np.divide(total_cost, total_volume, out=np.zeros(group_count), where=nonzero)
+    first_row = np.full(group_count, len(codes), dtype=np.intp)
+    np.minimum.at(first_row, index, np.arange(len(codes), dtype=np.intp))
+
+    group_codes = list(code_index)
+    keep = np.flatnonzero(nonzero).tolist()
+    volume_list = total_volume.tolist()
+    avg_list = avg_cost.tolist()
+    fractional_list = fractional.tolist()
+    first_list = first_row.tolist()
+    positions = []
+    for group in keep:
+        code = group_codes[group]
+        name = names[first_list[group]]
+        volume = volume_list[group]
+        positions.append({
+            'code': code,
+            'name': code if name is None else name,
+            'total_volume': volume if fractional_list[group] else int(volume),
+            'avg_cost': avg_list[group]
+        })
+    return positions
+
+
+ENGINES = {
+    PYTHON: aggregate_python,
+    NUMPY: aggregate_numpy,
+}
+
+
+def aggregate_positions(codes, names, volumes, costs, engine=None):
+    """按代码汇总持仓
+
+    Args:
+        codes, names, volumes, costs: 按累加顺序排列的平行列表，名称可以为None
+        engine: python/numpy/auto，为None时使用 default_engine（sql 引擎不经过这里）
+
+    Returns:
+        list: [{'code', 'name', 'total_volume', 'avg_cost'}, ...]
+    """
+    engine = engine or default_engine
+    if engine in (AUTO, SQL):
+        engine = NUMPY if np is not None else PYTHON
+    elif engine not in available_engines():
+        raise ValueError(f"不支持的汇总引擎: {engine}，可用: {', '.join(available_engines())}")
+    return ENGINES[engine](codes, names, volumes, costs)
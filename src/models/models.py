@@ -2,72 +2,267 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
+import models.aggregation as aggregation
+import models.validation as validation
 import hashlib
+import hmac
+import secrets
+import threading
+import time
 
 db = SQLAlchemy()
 
+
+class StaleVersionError(Exception):
+    """增量更新的基准版本号与策略当前版本号不一致"""
+    def __init__(self, strategy_name, base_version, current_version):
+        super().__init__(f"策略 {strategy_name} 的持仓已变化（基准版本 {base_version}，当前版本 {current_version}），请全量上传")
+        self.base_version = base_version
+        self.current_version = current_version
+
+
+class HistoryUnavailableError(Exception):
+    """请求的时间点早于策略持仓历史的起点"""
+    def __init__(self, strategy_names, as_of):
+        super().__init__(f"策略 {', '.join(strategy_names)} 没有 {as_of.strftime('%Y-%m-%d %H:%M:%S')} 时的持仓历史")
+        self.strategy_names = strategy_names
+        self.as_of = as_of
+
+
 class StrategyPosition(db.Model):
     __tablename__ = 'strategy_positions'
     
     id = db.Column(db.Integer, primary_key=True)
     strategy_name = db.Column(db.String(100), index=True, nullable=False, unique=True)
-    positions = db.Column(db.JSON, nullable=False)
+    # 旧版整块存储的持仓JSON，迁移到 position_items 后清空，仅为兼容保留
+    positions_blob = db.Column('positions', db.JSON, nullable=False, default=list)
     update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    # 最近一次修改该策略持仓时的数据版本号，用于增量更新的基准校验
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    # 列表查询只读取的策略字段（不含旧版持仓JSON）
+    SUMMARY_COLUMNS = (id, strategy_name, update_time, version)
+
+    @property
+    def positions(self):
+        """策略持仓列表（按写入顺序）"""
+        return StrategyPosition.load_positions([self]).get(self.id, [])
+
+    @staticmethod
+    def load_positions(strategies, codes=None):
+        """一次查询批量加载多个策略的持仓
+
+        Returns:
+            dict: {strategy_id: [持仓字典, ...]}
+        """
+        strategy_ids = [strategy.id for strategy in strategies if strategy.id is not None]
+        positions = {strategy_id: [] for strategy_id in strategy_ids}
+        if not strategy_ids:
+            return positions
+        
+        query = PositionItem.query.filter(PositionItem.strategy_id.in_(strategy_ids))
+        if codes is not None:
+            query = query.filter(PositionItem.code.in_(codes))
+        for item in query.order_by(PositionItem.strategy_id, PositionItem.id):
+            positions[item.strategy_id].append(item.to_dict())
+        return positions
+
+    @staticmethod
+    def load_position_columns(strategies, codes=None):
+        """一次查询加载多个策略的持仓，按策略顺序、策略内按写入顺序排列
+
+        Returns:
+            tuple: (代码列表, 名称列表, 数量列表, 成本列表)
+        """
+        strategy_ids = [strategy.id for strategy in strategies if strategy.id is not None]
+        rows = {strategy_id: [] for strategy_id in strategy_ids}
+        if strategy_ids:
+            query = db.session.query(
+                PositionItem.strategy_id, PositionItem.code, PositionItem.name,
+                PositionItem.volume, PositionItem.cost
+            ).filter(PositionItem.strategy_id.in_(strategy_ids))
+            if codes is not None:
+                query = query.filter(PositionItem.code.in_(codes))
+            for row in query.order_by(PositionItem.strategy_id, PositionItem.id):
+                rows[row[0]].append(row)
+        
+        ordered = [row for strategy_id in strategy_ids for row in rows[strategy_id]]
+        return ([row[1] for row in ordered], [row[2] for row in ordered],
+                [row[3] for row in ordered], [row[4] for row in ordered])
+
+    @staticmethod
+    def validate_positions(strategy_name, positions):
+        """校验策略名称和持仓数据，返回（按配置规范化后的）持仓列表
+
+        Raises:
+            PositionValidationError: 包含全部错误及其行号
+        """
+        return validation.validate_positions(strategy_name, positions)
 
     @staticmethod
     def update_positions(strategy_name, positions):
-        # 校验策略名称
-        if not strategy_name or not isinstance(strategy_name, str):
-            raise ValueError("策略名称不能为空且必须为字符串类型")
+        """全量替换策略持仓，只写入与现有持仓不同的行，返回本次写入后的数据版本号"""
+        positions = StrategyPosition.validate_positions(strategy_name, positions)
+        version = StrategyPosition.apply_position_changes(strategy_name, positions, replace=True)
+        db.session.commit()
+        return version
 
-        # 校验持仓数据
-        if not isinstance(positions, list):
-            raise ValueError("持仓数据必须为列表类型")
+    @staticmethod
+    def update_positions_batch(updates):
+        """在一个事务内全量更新多个策略的持仓，数据版本号只增加一次
 
-        for pos in positions:
-            if not isinstance(pos, dict):
-                raise ValueError("持仓数据的每个元素必须为字典类型")
-            
-            # 检查必需字段
-            required_fields = {'code', 'volume', 'cost'}
-            if not all(field in pos for field in required_fields):
-                raise ValueError(f"持仓数据缺少必需字段: {required_fields}")
-            
-            # 校验字段类型和值
-            if not isinstance(pos['code'], str) or not pos['code']:
-                raise ValueError("股票代码必须为非空字符串")
-            
-            # 对于调整策略，允许负数持仓
-            if strategy_name.startswith('ADJUSTMENT_'):
-                if not isinstance(pos['volume'], (int, float)):
-                    raise ValueError("持仓数量必须为数字")
-                # 调整策略允许负数持仓和负成本
-                if not isinstance(pos['cost'], (int, float)):
-                    raise ValueError("成本价必须为数字")
-            else:
-                if not isinstance(pos['volume'], (int, float)) or pos['volume'] < 0:
-                    raise ValueError("持仓数量必须为非负数")
-                
-                if not isinstance(pos['cost'], (int, float)) or pos['cost'] <= 0:
-                    raise ValueError("成本价必须为正数")
-            
-            # 校验股票名称字段（可选）
-            if 'name' in pos and not isinstance(pos['name'], str):
-                raise ValueError("股票名称必须为字符串类型")
+        Args:
+            updates: [{'strategy_name': 策略名称, 'positions': 持仓列表}, ...]
 
-        # 执行更新
-        strategy = StrategyPosition.query.filter_by(strategy_name=strategy_name).first()
+        Returns:
+            int: 本次写入后的数据版本号
+        """
+        if not isinstance(updates, list) or not updates:
+            raise ValueError("批量更新数据必须为非空列表")
         
-        if strategy:
-            strategy.positions = positions
-        else:
-            strategy = StrategyPosition(
-                strategy_name=strategy_name,
-                positions=positions
-            )
-            db.session.add(strategy)
+        # 先校验全部数据，任何一项不合法都不写入；错误带上所在的批量项序号（item，从0开始）
+        strategy_names = set()
+        validated = []
+        errors = []
+        for index, update in enumerate(updates):
+            if not isinstance(update, dict) or 'strategy_name' not in update or 'positions' not in update:
+                errors.append({'item': index, 'strategy_name': None, 'index': None, 'field': None,
+                               'message': "缺少 strategy_name 或 positions 字段"})
+                continue
+            strategy_name = update['strategy_name']
+            try:
+                validated.append((strategy_name, StrategyPosition.validate_positions(strategy_name, update['positions'])))
+            except validation.PositionValidationError as e:
+                errors.extend(dict(error, item=index, strategy_name=strategy_name) for error in e.errors)
+                continue
+            if strategy_name in strategy_names:
+                errors.append({'item': index, 'strategy_name': strategy_name, 'index': None, 'field': 'strategy_name',
+                               'message': f"策略 {strategy_name} 在批量更新中重复出现"})
+            strategy_names.add(strategy_name)
+        if errors:
+            raise validation.PositionValidationError(errors)
         
+        version = DataVersion.bump(DataVersion.POSITIONS)
+        for strategy_name, positions in validated:
+            StrategyPosition.apply_position_changes(strategy_name, positions, replace=True, version=version)
         db.session.commit()
+        return version
+
+    @staticmethod
+    def patch_positions(strategy_name, upserts, deletes=None, base_version=None):
+        """部分更新策略持仓：新增或修改 upserts 中的代码，删除 deletes 中的代码
+
+        Args:
+            base_version: 客户端计算差异时所依据的策略版本号，与当前版本不一致时抛出 StaleVersionError
+
+        Returns:
+            int: 本次写入后的数据版本号
+        """
+        deletes = deletes or []
+        upserts = StrategyPosition.validate_positions(strategy_name, upserts)
+        if not isinstance(deletes, list) or not all(isinstance(code, str) and code for code in deletes):
+            raise ValueError("删除的股票代码必须为非空字符串列表")
+        
+        if base_version is not None:
+            if not isinstance(base_version, int) or isinstance(base_version, bool) or base_version < 0:
+                raise ValueError("基准版本号必须为非负整数")
+            # 锁定策略行，避免两个基于同一版本的增量同时通过校验
+            current_version = db.session.query(StrategyPosition.version) \
+                .filter_by(strategy_name=strategy_name).with_for_update().scalar() or 0
+            if current_version != base_version:
+                db.session.rollback()
+                raise StaleVersionError(strategy_name, base_version, current_version)
+        
+        version = StrategyPosition.apply_position_changes(strategy_name, upserts, deletes)
+        db.session.commit()
+        return version
+
+    @staticmethod
+    def apply_position_changes(strategy_name, upserts, deletes=(), replace=False, version=None):
+        """将已校验的持仓变更写入数据库（不提交事务）
+
+        Args:
+            upserts: 需要新增或修改的持仓列表
+            deletes: 需要删除的股票代码
+            replace: 为 True 时 upserts 即完整持仓，不在其中的代码都会被删除
+            version: 批量写入时共用的数据版本号，为空时自动加一
+
+        Returns:
+            int: 本次写入后的数据版本号
+        """
+        strategy = StrategyPosition.query.filter_by(strategy_name=strategy_name).first()
+        created = strategy is None
+        if created:
+            strategy = StrategyPosition(strategy_name=strategy_name, positions_blob=[])
+            db.session.add(strategy)
+            db.session.flush()
+        elif strategy.positions_blob:
+            # 尚未迁移的旧数据先转换为按代码存储
+            PositionItem.migrate_strategy(strategy)
+        last_history = PositionHistory.prepare(strategy, created)
+        
+        new_items = PositionItem.merge_positions(upserts)
+        deletes = set(deletes) - new_items.keys()
+        
+        # 全量替换需要对比全部现有行，部分更新只读取涉及的代码
+        query = PositionItem.query.filter_by(strategy_id=strategy.id)
+        if not replace:
+            query = query.filter(PositionItem.code.in_(new_items.keys() | deletes))
+        existing = {item.code: item for item in query}
+        if replace:
+            deletes = existing.keys() - new_items.keys()
+        
+        old_positions = []
+        new_positions = list(new_items.values())
+        # 实际发生变化的代码，记入持仓历史
+        changed_positions = []
+        deleted_codes = []
+        for code in deletes:
+            item = existing.get(code)
+            if item is not None:
+                old_positions.append(item.to_dict())
+                db.session.delete(item)
+                deleted_codes.append(code)
+        for code, pos in new_items.items():
+            item = existing.get(code)
+            if item is None:
+                db.session.add(PositionItem(strategy_id=strategy.id, **pos))
+                changed_positions.append(dict(pos))
+            else:
+                old_positions.append(item.to_dict())
+                # 未上传名称时保留已有名称
+                if pos['name'] is None:
+                    pos['name'] = item.name
+                if (item.name, item.volume, item.cost) != (pos['name'], pos['volume'], pos['cost']):
+                    changed_positions.append(dict(pos))
+                item.update_from(pos)
+        
+        strategy.update_time = datetime.now()
+        
+        # 在同一事务内按新旧持仓差额更新汇总表
+        changed_codes = PositionAggregate.apply_strategy_change(
+            strategy_name.startswith('ADJUSTMENT_'), old_positions, new_positions
+        )
+        if version is None:
+            version = DataVersion.bump(DataVersion.POSITIONS)
+        strategy.version = version
+        PositionEvent.record(version, strategy_name, changed_codes)
+        PositionHistory.record(strategy, last_history, changed_positions, deleted_codes)
+        return version
+
+    @staticmethod
+    def migrate_schema():
+        """旧版本的 strategy_positions 表没有 version 列，启动时补充"""
+        inspector = db.inspect(db.engine)
+        columns = {column['name'] for column in inspector.get_columns(StrategyPosition.__tablename__)}
+        if 'version' in columns:
+            return False
+        with db.engine.begin() as connection:
+            connection.execute(db.text(
+                'ALTER TABLE strategy_positions ADD COLUMN version BIGINT NOT NULL DEFAULT 0'
+            ))
+        return True
 
     @staticmethod
     def get_strategy_positions(strategy_name):
@@ -76,92 +271,1001 @@ class StrategyPosition(db.Model):
 
     @staticmethod
     def get_all_strategy_positions():
-        strategies = StrategyPosition.query.all()
+        return StrategyPosition.query_strategy_positions()[0]
+
+    @staticmethod
+    def filter_strategies(query, prefix=None, updated_since=None):
+        """按策略名称前缀和更新时间过滤"""
+        if prefix:
+            query = query.filter(StrategyPosition.strategy_name.startswith(prefix, autoescape=True))
+        if updated_since is not None:
+            query = query.filter(StrategyPosition.update_time >= updated_since)
+        return query
+
+    @staticmethod
+    def query_strategy_positions(prefix=None, codes=None, updated_since=None, after_id=None, limit=None,
+                                 with_positions=True):
+        """按条件分页查询策略持仓，过滤条件都在SQL中执行
+
+        Args:
+            prefix: 策略名称前缀
+            codes: 只返回持有这些代码的策略，且持仓只包含这些代码
+            updated_since: 只返回此时间之后更新过的策略
+            after_id: 分页游标，只返回 id 大于该值的策略
+            limit: 最多返回的策略数，为空时返回全部
+            with_positions: 为False时不查询持仓明细
+
+        Returns:
+            tuple: (策略列表, 下一页游标)，没有下一页时游标为None
+        """
+        query = db.session.query(*StrategyPosition.SUMMARY_COLUMNS)
+        query = StrategyPosition.filter_strategies(query, prefix, updated_since)
+        if codes:
+            query = query.filter(db.exists().where(
+                PositionItem.strategy_id == StrategyPosition.id,
+                PositionItem.code.in_(codes)
+            ))
+        if after_id is not None:
+            query = query.filter(StrategyPosition.id > after_id)
+        query = query.order_by(StrategyPosition.id)
+        if limit:
+            query = query.limit(limit + 1)
+        
+        strategies = query.all()
+        next_cursor = None
+        if limit and len(strategies) > limit:
+            strategies = strategies[:limit]
+            next_cursor = strategies[-1].id
+        
+        positions = StrategyPosition.load_positions(strategies, codes or None) if with_positions else {}
         return [{
             'strategy_name': strategy.strategy_name,
-            'positions': strategy.positions,
-            'update_time': strategy.update_time
-        } for strategy in strategies]
+            'positions': positions.get(strategy.id, []),
+            'update_time': strategy.update_time,
+            'strategy_version': strategy.version
+        } for strategy in strategies], next_cursor
 
     @staticmethod
-    def get_total_positions(strategy_names=None, include_adjustments=True):
-        # 获取策略数据
-        if strategy_names:
-            all_strategies = StrategyPosition.query.filter(
-                StrategyPosition.strategy_name.in_(strategy_names)
-            ).all()
-        else:
-            # 获取所有策略，但可以选择是否包含调整策略
-            if include_adjustments:
-                all_strategies = StrategyPosition.query.all()
+    def iter_strategy_positions(prefix=None, codes=None, updated_since=None, with_positions=True, batch_size=1000):
+        """逐个生成策略持仓（结构同 query_strategy_positions），用于流式导出
+
+        策略和持仓明细通过一次按策略排序的连接查询读取，并以服务端游标每次取 batch_size 行，
+        同一时刻只在内存中保留当前批次的行，内存占用与策略总数无关。
+        """
+        columns = list(StrategyPosition.SUMMARY_COLUMNS)
+        if with_positions:
+            columns += [PositionItem.code, PositionItem.name.label('item_name'), PositionItem.volume, PositionItem.cost]
+        query = StrategyPosition.filter_strategies(db.session.query(*columns), prefix, updated_since)
+        
+        if with_positions:
+            condition = PositionItem.strategy_id == StrategyPosition.id
+            if codes:
+                # 内连接只保留持有这些代码的策略，且只返回这些代码
+                query = query.join(PositionItem, db.and_(condition, PositionItem.code.in_(codes)))
             else:
-                all_strategies = StrategyPosition.query.filter(
-                    ~StrategyPosition.strategy_name.like('ADJUSTMENT_%')
-                ).all()
+                query = query.outerjoin(PositionItem, condition)
+            query = query.order_by(StrategyPosition.id, PositionItem.id)
+        else:
+            if codes:
+                query = query.filter(db.exists().where(
+                    PositionItem.strategy_id == StrategyPosition.id,
+                    PositionItem.code.in_(codes)
+                ))
+            query = query.order_by(StrategyPosition.id)
+        
+        current = None
+        for row in query.execution_options(yield_per=batch_size):
+            if current is None or current['id'] != row.id:
+                if current is not None:
+                    yield current['item']
+                current = {'id': row.id, 'item': {
+                    'strategy_name': row.strategy_name,
+                    'positions': [],
+                    'update_time': row.update_time,
+                    'strategy_version': row.version
+                }}
+            if with_positions and row.code is not None:
+                pos = {'code': row.code, 'volume': normalize_volume(row.volume), 'cost': row.cost}
+                if row.item_name is not None:
+                    pos['name'] = row.item_name
+                current['item']['positions'].append(pos)
+        if current is not None:
+            yield current['item']
+
+    @staticmethod
+    def get_total_positions(strategy_names=None, include_adjustments=True, codes=None):
+        # 未指定策略时直接读取增量维护的汇总表
+        if not strategy_names:
+            return PositionAggregate.get_total_positions(include_adjustments, codes)
+        
+        return StrategyPosition.compute_total_positions(strategy_names, include_adjustments, codes)
+
+    @staticmethod
+    def get_total_position_changes(since_version, strategy_names=None, include_adjustments=True):
+        """获取某数据版本之后汇总持仓发生变化的代码
+
+        Returns:
+            dict: version 为当前数据版本；full 为 True 时 positions 是全量汇总持仓
+                （since_version 早于变更事件保留窗口），否则 positions 只包含变化的代码，
+                removed 为汇总持仓已变为0的代码
+        """
+        # 先读取版本号，保证返回的版本号不会比数据更新
+        version = DataVersion.get(DataVersion.POSITIONS)
+        events, complete = PositionEvent.get_events_since(
+            since_version, strategy_names, include_adjustments
+        )
+        if not complete:
+            result = StrategyPosition.get_total_positions(strategy_names, include_adjustments)
+            result.update({'version': version, 'full': True, 'removed': []})
+            return result
+        
+        changed_codes = {code for event in events for code in event.codes}
+        if changed_codes:
+            result = StrategyPosition.get_total_positions(
+                strategy_names, include_adjustments, changed_codes
+            )
+        else:
+            result = {'positions': [], 'update_time': None}
+        remaining_codes = {pos['code'] for pos in result['positions']}
+        result.update({
+            'version': version,
+            'full': False,
+            'removed': sorted(changed_codes - remaining_codes)
+        })
+        return result
+
+    @staticmethod
+    def filter_total_strategies(query, strategy_names=None, include_adjustments=True):
+        """汇总持仓的策略范围：指定策略列表时只汇总这些策略，否则按是否包含调整策略过滤"""
+        if strategy_names:
+            return query.filter(StrategyPosition.strategy_name.in_(strategy_names))
+        if not include_adjustments:
+            return query.filter(~StrategyPosition.strategy_name.like('ADJUSTMENT_%'))
+        return query
+
+    @staticmethod
+    def compute_total_positions(strategy_names=None, include_adjustments=True, codes=None, engine=None):
+        """从各策略持仓明细重新计算汇总持仓，codes 不为空时只计算这些代码
+
+        engine 为 python/numpy/sql/auto，为None时使用配置的默认引擎
+        """
+        engine = aggregation.resolve_engine(engine, db.engine.dialect.name)
+        if engine == aggregation.SQL:
+            return StrategyPosition.compute_total_positions_sql(strategy_names, include_adjustments, codes)
+        
+        # 获取策略数据
+        all_strategies = StrategyPosition.filter_total_strategies(
+            StrategyPosition.query, strategy_names, include_adjustments
+        ).order_by(StrategyPosition.id).all()
             
-        total_positions = {}
         # 设置默认的最早开始时间
         latest_update_time = datetime(1970, 1, 1)
-        
         for strategy in all_strategies:
             # 更新最新时间
             if latest_update_time is None or strategy.update_time > latest_update_time:
                 latest_update_time = strategy.update_time
-                
-            for pos in strategy.positions:
-                code = pos['code']
-                if code not in total_positions:
-                    total_positions[code] = {
-                        'code': code,
-                        'name': pos.get('name', code),  # 使用股票名称，如果没有则使用代码
-                        'total_volume': 0,
-                        'total_cost': 0
-                    }
-                
-                # 对于调整策略，直接加减持仓数量和成本
-                if strategy.strategy_name.startswith('ADJUSTMENT_'):
-                    total_positions[code]['total_volume'] += pos['volume']
-                    total_positions[code]['total_cost'] += pos['volume'] * pos['cost']
-                else:
-                    total_positions[code]['total_volume'] += pos['volume']
-                    total_positions[code]['total_cost'] += pos['volume'] * pos['cost']
-        
-        # 计算平均成本并过滤掉持仓为0的股票
-        filtered_positions = {}
-        for code in total_positions:
-            if total_positions[code]['total_volume'] != 0:
-                if total_positions[code]['total_volume'] > 0:
-                    total_positions[code]['avg_cost'] = (
-                        total_positions[code]['total_cost'] / 
-                        total_positions[code]['total_volume']
-                    )
-                else:
-                    # 负持仓的情况，显示平均成本
-                    total_positions[code]['avg_cost'] = (
-                        total_positions[code]['total_cost'] / 
-                        total_positions[code]['total_volume']
-                    )
-                del total_positions[code]['total_cost']
-                filtered_positions[code] = total_positions[code]
         
+        # 按策略顺序展开为平行列表，由汇总引擎按代码分组求和、计算平均成本并过滤持仓为0的股票
+        codes_column, names, volumes, costs = StrategyPosition.load_position_columns(all_strategies, codes)
         return {
-            'positions': list(filtered_positions.values()),
+            'positions': aggregation.aggregate_positions(codes_column, names, volumes, costs, engine),
             'update_time': latest_update_time
         }
 
+    @staticmethod
+    def get_total_positions_as_of(as_of, strategy_names=None, include_adjustments=True):
+        """某个时间点的汇总持仓，由各策略在该时间点的持仓历史重建，返回格式与 get_total_positions 一致
+
+        Raises:
+            HistoryUnavailableError: 有策略没有该时间点的历史记录
+        """
+        strategies = StrategyPosition.filter_total_strategies(
+            StrategyPosition.query, strategy_names, include_adjustments
+        ).order_by(StrategyPosition.id).all()
+        states = PositionHistory.positions_as_of(strategies, as_of)
+        missing = [strategy.strategy_name for strategy in strategies if states[strategy.strategy_name] is None]
+        if missing:
+            raise HistoryUnavailableError(missing, as_of)
+        
+        latest_update_time = datetime(1970, 1, 1)
+        codes, names, volumes, costs = [], [], [], []
+        for strategy in strategies:
+            state = states[strategy.strategy_name]
+            if state['update_time'] is not None and state['update_time'] > latest_update_time:
+                latest_update_time = state['update_time']
+            for pos in state['positions']:
+                codes.append(pos['code'])
+                names.append(pos.get('name'))
+                volumes.append(pos['volume'])
+                costs.append(pos['cost'])
+        return {
+            'positions': aggregation.aggregate_positions(codes, names, volumes, costs),
+            'update_time': latest_update_time
+        }
+
+    @staticmethod
+    def first_occurrences(strategy_names=None, include_adjustments=True, codes=None):
+        """各代码在逐条累加顺序（策略按id、策略内按写入顺序）中首次出现的位置和名称
+
+        同一策略内代码唯一，首次出现的行就是 strategy_id 最小的那一行。
+
+        Returns:
+            dict: {code: (strategy_id, item_id, name)}
+        """
+        first = db.session.query(
+            PositionItem.code.label('code'),
+            db.func.min(PositionItem.strategy_id).label('strategy_id')
+        ).join(StrategyPosition, StrategyPosition.id == PositionItem.strategy_id)
+        first = StrategyPosition.filter_total_strategies(first, strategy_names, include_adjustments)
+        if codes is not None:
+            first = first.filter(PositionItem.code.in_(codes))
+        first = first.group_by(PositionItem.code).subquery()
+        query = db.session.query(
+            PositionItem.code, PositionItem.strategy_id, PositionItem.id, PositionItem.name
+        ).join(first, db.and_(PositionItem.strategy_id == first.c.strategy_id, PositionItem.code == first.c.code))
+        return {code: (strategy_id, item_id, name) for code, strategy_id, item_id, name in query}
+
+    @staticmethod
+    def compute_total_positions_sql(strategy_names=None, include_adjustments=True, codes=None):
+        """在数据库中按代码 GROUP BY 汇总，只传回每个代码一行，返回格式与 compute_total_positions 一致
+
+        策略范围和代码过滤都在WHERE中执行。同一策略内代码唯一，所以代码首次出现的行就是 strategy_id
+        最小的那一行：分组时取 min(strategy_id)，再关联回这一行取名称和写入顺序，
+        排序和名称与逐条累加（策略按id、策略内按写入顺序）一致。
+        """
+        total_volume = db.func.sum(PositionItem.volume)
+        totals = db.session.query(
+            PositionItem.code.label('code'),
+            db.func.min(PositionItem.strategy_id).label('first_strategy_id'),
+            total_volume.label('total_volume'),
+            # HAVING 在 SELECT 之后才过滤掉汇总为0的代码，除数为0时取NULL，避免部分数据库报除零错误
+            (db.func.sum(PositionItem.volume * PositionItem.cost) / db.func.nullif(total_volume, 0)).label('avg_cost')
+        ).join(StrategyPosition, StrategyPosition.id == PositionItem.strategy_id)
+        totals = StrategyPosition.filter_total_strategies(totals, strategy_names, include_adjustments)
+        if codes is not None:
+            totals = totals.filter(PositionItem.code.in_(codes))
+        totals = totals.group_by(PositionItem.code).having(total_volume != 0).subquery()
+        
+        first_item = db.aliased(PositionItem)
+        query = db.session.query(
+            totals.c.code, first_item.name, totals.c.total_volume, totals.c.avg_cost
+        ).join(
+            first_item,
+            db.and_(first_item.strategy_id == totals.c.first_strategy_id, first_item.code == totals.c.code)
+        ).order_by(totals.c.first_strategy_id, first_item.id)
+        
+        positions = [{
+            'code': code,
+            'name': code if name is None else name,
+            'total_volume': normalize_volume(float(volume)),
+            'avg_cost': float(avg_cost)
+        } for code, name, volume, avg_cost in query]
+        
+        update_time = StrategyPosition.filter_total_strategies(
+            db.session.query(db.func.max(StrategyPosition.update_time)), strategy_names, include_adjustments
+        ).scalar()
+        return {
+            'positions': positions,
+            'update_time': update_time or datetime(1970, 1, 1)
+        }
+
+
+class DataVersion(db.Model):
+    """单调递增的数据版本号，每次写入持仓时加一，用于条件请求和跨进程缓存失效"""
+    __tablename__ = 'data_versions'
+    
+    POSITIONS = 'positions'
+    INTERNAL_PASSWORD = 'internal_password'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    @staticmethod
+    def get(name=POSITIONS):
+        """获取当前版本号，从未写入时为0"""
+        version = db.session.query(DataVersion.version).filter_by(name=name).scalar()
+        return version or 0
+
+    @staticmethod
+    def bump(name=POSITIONS):
+        """版本号加一（不提交事务），返回新的版本号"""
+        result = db.session.execute(
+            db.update(DataVersion)
+            .where(DataVersion.name == name)
+            .values(version=DataVersion.version + 1, update_time=datetime.now())
+        )
+        if result.rowcount == 0:
+            db.session.add(DataVersion(name=name, version=1))
+            db.session.flush()
+            return 1
+        return DataVersion.get(name)
+
+
+class PositionEvent(db.Model):
+    """持仓变更事件，记录每个数据版本修改了哪个策略的哪些代码，只保留最近的一段窗口"""
+    __tablename__ = 'position_events'
+    
+    # 保留最近多少个数据版本的事件，可由配置覆盖
+    RETENTION = 1000
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, index=True, nullable=False)
+    strategy_name = db.Column(db.String(100), index=True, nullable=False)
+    codes = db.Column(db.JSON, nullable=False)
+    created_time = db.Column(db.DateTime, default=datetime.now)
+
+    @staticmethod
+    def record(version, strategy_name, codes):
+        """记录一次变更并清理窗口外的旧事件（不提交事务）"""
+        db.session.add(PositionEvent(version=version, strategy_name=strategy_name, codes=list(codes)))
+        db.session.execute(
+            db.delete(PositionEvent).where(PositionEvent.version <= version - PositionEvent.RETENTION)
+        )
+
+    @staticmethod
+    def oldest_version():
+        """窗口内最早的事件版本号，没有事件时返回None"""
+        return db.session.query(db.func.min(PositionEvent.version)).scalar()
+
+    @staticmethod
+    def get_events_since(since_version, strategy_names=None, include_adjustments=True):
+        """获取某版本之后、与订阅策略相关的事件
+
+        Returns:
+            tuple: (events, complete)，since_version 早于保留窗口时 complete 为 False，
+                此时事件列表可能不完整，调用方应做全量同步
+        """
+        if since_version >= DataVersion.get(DataVersion.POSITIONS):
+            return [], True
+        oldest = PositionEvent.oldest_version()
+        complete = oldest is not None and since_version >= oldest - 1
+        
+        query = PositionEvent.query.filter(PositionEvent.version > since_version)
+        if strategy_names:
+            query = query.filter(PositionEvent.strategy_name.in_(strategy_names))
+        elif not include_adjustments:
+            query = query.filter(~PositionEvent.strategy_name.like('ADJUSTMENT_%'))
+        return query.order_by(PositionEvent.id).all(), complete
+
+
+class PositionHistory(db.Model):
+    """策略持仓的只追加历史
+
+    每次持仓实际发生变化时追加一条记录：通常只保存变化的代码（diff），每隔 CHECKPOINT_INTERVAL 条
+    保存一次完整持仓（checkpoint）。每条记录的 base_sequence 指向其所依据的检查点，
+    重建某时间点的持仓只需按索引找到该时间点之前的最后一条记录，再读取对应检查点到该记录之间的记录，
+    读取量不超过 CHECKPOINT_INTERVAL 条，与历史总长度无关。
+
+    启用历史之前就已存在的策略，第一次修改时先以修改前的持仓和更新时间写入 baseline，
+    baseline 之前的持仓未知；新建策略的第一条记录是 checkpoint，之前策略不存在（持仓为空）。
+    """
+    __tablename__ = 'position_history'
+    __table_args__ = (
+        db.UniqueConstraint('strategy_name', 'sequence', name='uq_position_history_strategy_sequence'),
+        db.Index('ix_position_history_strategy_time', 'strategy_name', 'created_time'),
+    )
+    
+    CHECKPOINT = 'checkpoint'
+    BASELINE = 'baseline'
+    DIFF = 'diff'
+    
+    # 每隔多少条记录保存一次完整持仓，可由配置覆盖
+    CHECKPOINT_INTERVAL = 50
+    
+    id = db.Column(db.Integer, primary_key=True)
+    strategy_name = db.Column(db.String(100), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)  # 策略内从1开始递增
+    base_sequence = db.Column(db.Integer, nullable=False)  # 所依据的检查点，检查点指向自身
+    kind = db.Column(db.String(16), nullable=False)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    created_time = db.Column(db.DateTime, nullable=False)
+    upserts = db.Column(db.JSON, nullable=False)  # 检查点为完整持仓，diff 为新增或修改的持仓
+    deletes = db.Column(db.JSON, nullable=False)  # diff 删除的代码
+
+    @staticmethod
+    def latest(strategy_name, as_of=None):
+        """策略在某时间点（为None时为当前）之前的最后一条历史记录"""
+        query = PositionHistory.query.filter_by(strategy_name=strategy_name)
+        if as_of is None:
+            return query.order_by(PositionHistory.sequence.desc()).first()
+        return query.filter(PositionHistory.created_time <= as_of) \
+            .order_by(PositionHistory.created_time.desc(), PositionHistory.sequence.desc()).first()
+
+    @staticmethod
+    def prepare(strategy, created):
+        """修改持仓前调用，返回最后一条历史记录；已有策略还没有历史时先写入 baseline（不提交事务）"""
+        last = PositionHistory.latest(strategy.strategy_name)
+        if last is None and not created:
+            last = PositionHistory(
+                strategy_name=strategy.strategy_name,
+                sequence=1,
+                base_sequence=1,
+                kind=PositionHistory.BASELINE,
+                version=strategy.version or 0,
+                created_time=strategy.update_time or datetime(1970, 1, 1),
+                upserts=strategy.positions,
+                deletes=[]
+            )
+            db.session.add(last)
+        return last
+
+    @staticmethod
+    def record(strategy, last, upserts, deletes):
+        """持仓修改后调用，记录实际变化的代码，需要时改为保存完整持仓（不提交事务）"""
+        if last is not None and not upserts and not deletes:
+            return
+        sequence = last.sequence + 1 if last is not None else 1
+        entry = PositionHistory(
+            strategy_name=strategy.strategy_name,
+            sequence=sequence,
+            version=strategy.version,
+            created_time=strategy.update_time
+        )
+        if last is None or sequence - last.base_sequence >= PositionHistory.CHECKPOINT_INTERVAL:
+            db.session.flush()
+            entry.kind = PositionHistory.CHECKPOINT
+            entry.base_sequence = sequence
+            entry.upserts = strategy.positions
+            entry.deletes = []
+        else:
+            entry.kind = PositionHistory.DIFF
+            entry.base_sequence = last.base_sequence
+            entry.upserts = upserts
+            entry.deletes = deletes
+        db.session.add(entry)
+
+    @staticmethod
+    def positions_as_of(strategies, as_of):
+        """重建多个策略在某时间点的持仓
+
+        查询次数与策略数量无关：一次查询读取各策略从检查点到该时间点最后一条记录之间的记录，
+        该时间点之前没有记录的策略再用一次查询判断历史起点的类型。
+
+        Returns:
+            dict: {策略名称: {'positions', 'update_time', 'version'}}，没有该时间点的历史时值为None
+        """
+        names = [strategy.strategy_name for strategy in strategies]
+        if not names:
+            return {}
+        
+        # 各策略在该时间点之前的最后一条记录，按 (strategy_name, sequence) 关联回记录本身取得检查点
+        latest = db.session.query(
+            PositionHistory.strategy_name.label('strategy_name'),
+            db.func.max(PositionHistory.sequence).label('sequence')
+        ).filter(
+            PositionHistory.strategy_name.in_(names),
+            PositionHistory.created_time <= as_of
+        ).group_by(PositionHistory.strategy_name).subquery()
+        target = db.aliased(PositionHistory)
+        query = db.session.query(
+            PositionHistory.strategy_name, PositionHistory.kind, PositionHistory.version,
+            PositionHistory.created_time, PositionHistory.upserts, PositionHistory.deletes
+        ).join(
+            latest, PositionHistory.strategy_name == latest.c.strategy_name
+        ).join(
+            target, db.and_(target.strategy_name == latest.c.strategy_name, target.sequence == latest.c.sequence)
+        ).filter(
+            PositionHistory.sequence.between(target.base_sequence, latest.c.sequence)
+        ).order_by(PositionHistory.strategy_name, PositionHistory.sequence)
+        
+        # 记录按序号排列，每个策略的最后一条就是目标记录
+        results = {}
+        states = {}
+        for name, kind, version, created_time, upserts, deletes in query:
+            if kind != PositionHistory.DIFF:
+                state = states[name] = {pos['code']: pos for pos in upserts}
+            else:
+                state = states[name]
+                for pos in upserts:
+                    state[pos['code']] = pos
+                for code in deletes:
+                    state.pop(code, None)
+            results[name] = {'update_time': created_time, 'version': version}
+        for name, result in results.items():
+            positions = []
+            for pos in states[name].values():
+                pos = {'code': pos['code'], 'name': pos.get('name'), 'volume': pos['volume'], 'cost': pos['cost']}
+                if pos['name'] is None:
+                    del pos['name']
+                positions.append(pos)
+            result['positions'] = positions
+        
+        missing = [name for name in names if name not in results]
+        if not missing:
+            return results
+        
+        # 该时间点之前没有记录：按历史的第一条记录判断
+        first = db.session.query(
+            PositionHistory.strategy_name.label('strategy_name'),
+            db.func.min(PositionHistory.sequence).label('sequence')
+        ).filter(PositionHistory.strategy_name.in_(missing)).group_by(PositionHistory.strategy_name).subquery()
+        first_kinds = dict(db.session.query(PositionHistory.strategy_name, PositionHistory.kind).join(
+            first, db.and_(PositionHistory.strategy_name == first.c.strategy_name,
+                           PositionHistory.sequence == first.c.sequence)
+        ))
+        
+        unchanged = []
+        for strategy in strategies:
+            name = strategy.strategy_name
+            if name in results:
+                continue
+            kind = first_kinds.get(name)
+            if kind is None:
+                # 从未记录过历史：最后一次修改早于该时间点时，当前持仓就是当时的持仓
+                if strategy.update_time is not None and strategy.update_time <= as_of:
+                    unchanged.append(strategy)
+                else:
+                    results[name] = None
+            elif kind == PositionHistory.BASELINE:
+                results[name] = None
+            else:
+                # 该时间点策略尚未创建
+                results[name] = {'positions': [], 'update_time': None, 'version': 0}
+        
+        if unchanged:
+            current = StrategyPosition.load_positions(unchanged)
+            for strategy in unchanged:
+                results[strategy.strategy_name] = {
+                    'positions': current[strategy.id],
+                    'update_time': strategy.update_time,
+                    'version': strategy.version
+                }
+        return results
+
+    @staticmethod
+    def prune(before):
+        """删除某时间点之前不再需要的历史记录
+
+        每个策略保留该时间点之前的最后一个检查点及其之后的记录，该检查点改为 baseline（更早的持仓不再可查）。
+
+        Returns:
+            int: 删除的记录数
+        """
+        deleted = 0
+        strategy_names = [row[0] for row in db.session.query(PositionHistory.strategy_name).distinct()]
+        for name in strategy_names:
+            checkpoint = PositionHistory.query.filter(
+                PositionHistory.strategy_name == name,
+                PositionHistory.kind != PositionHistory.DIFF,
+                PositionHistory.created_time <= before
+            ).order_by(PositionHistory.sequence.desc()).first()
+            if checkpoint is None:
+                continue
+            result = db.session.execute(
+                db.delete(PositionHistory).where(
+                    PositionHistory.strategy_name == name,
+                    PositionHistory.sequence < checkpoint.sequence
+                )
+            )
+            if result.rowcount:
+                checkpoint.kind = PositionHistory.BASELINE
+                deleted += result.rowcount
+        db.session.commit()
+        return deleted
+
+
+def normalize_volume(volume):
+    """数据库中持仓数量以浮点数存储，整数持仓还原为整数"""
+    if isinstance(volume, float) and volume.is_integer():
+        return int(volume)
+    return volume
+
+
+class PositionItem(db.Model):
+    """按 (策略, 股票代码) 存储的单条持仓"""
+    __tablename__ = 'position_items'
+    __table_args__ = (
+        db.UniqueConstraint('strategy_id', 'code', name='uq_position_items_strategy_code'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    strategy_id = db.Column(db.Integer, db.ForeignKey('strategy_positions.id'), nullable=False)
+    code = db.Column(db.String(32), index=True, nullable=False)
+    name = db.Column(db.String(100))
+    volume = db.Column(db.Double, nullable=False)
+    cost = db.Column(db.Double, nullable=False)
+
+    def to_dict(self):
+        pos = {
+            'code': self.code,
+            'volume': normalize_volume(self.volume),
+            'cost': self.cost
+        }
+        if self.name is not None:
+            pos['name'] = self.name
+        return pos
+
+    def update_from(self, pos):
+        """只在字段确有变化时赋值，避免产生无意义的UPDATE"""
+        for field in ('name', 'volume', 'cost'):
+            if getattr(self, field) != pos[field]:
+                setattr(self, field, pos[field])
+
+    @staticmethod
+    def merge_positions(positions):
+        """按代码合并持仓，同一代码出现多次时数量相加、成本按数量加权
+
+        Returns:
+            dict: {code: {'code', 'name', 'volume', 'cost'}}，保持首次出现的顺序
+        """
+        merged = {}
+        for pos in positions:
+            code = pos['code']
+            item = merged.get(code)
+            if item is None:
+                merged[code] = {
+                    'code': code,
+                    'name': pos.get('name'),
+                    'volume': pos['volume'],
+                    'cost': pos['cost']
+                }
+                continue
+            volume = item['volume'] + pos['volume']
+            notional = item['volume'] * item['cost'] + pos['volume'] * pos['cost']
+            item['cost'] = notional / volume if volume else pos['cost']
+            item['volume'] = volume
+            item['name'] = item['name'] or pos.get('name')
+        return merged
+
+    @staticmethod
+    def migrate_strategy(strategy):
+        """将单个策略的旧版JSON持仓转换为按代码存储的行（不提交事务）"""
+        for pos in PositionItem.merge_positions(strategy.positions_blob).values():
+            db.session.add(PositionItem(strategy_id=strategy.id, **pos))
+        # 迁移不是持仓变更，保留原更新时间
+        db.session.execute(
+            db.update(StrategyPosition)
+            .where(StrategyPosition.id == strategy.id)
+            .values({StrategyPosition.positions_blob: [], StrategyPosition.update_time: StrategyPosition.update_time})
+        )
+        db.session.expire(strategy, ['positions_blob'])
+        db.session.flush()
+
+    @staticmethod
+    def migrate_from_blobs():
+        """迁移所有仍使用旧版JSON存储的策略，可重复执行
+
+        Returns:
+            int: 本次迁移的策略数
+        """
+        count = 0
+        for strategy in StrategyPosition.query.all():
+            if not strategy.positions_blob:
+                continue
+            try:
+                PositionItem.migrate_strategy(strategy)
+                db.session.commit()
+                count += 1
+            except Exception as e:
+                # 其他进程可能已迁移同一策略
+                db.session.rollback()
+                print(f"迁移策略 {strategy.strategy_name} 持仓跳过: {e}")
+        return count
+
+
+def summarize_positions(positions):
+    """按股票代码汇总单个策略的持仓数量和持仓金额
+
+    Returns:
+        dict: {code: (volume, volume * cost, name)}
+    """
+    summary = {}
+    for pos in positions:
+        code = pos['code']
+        volume, cost, name = summary.get(code, (0, 0, None))
+        summary[code] = (
+            volume + pos['volume'],
+            cost + pos['volume'] * pos['cost'],
+            name or pos.get('name')
+        )
+    return summary
+
+
+class PositionAggregate(db.Model):
+    """按股票代码增量维护的汇总持仓，调整策略和普通策略分开存储"""
+    __tablename__ = 'position_aggregates'
+    __table_args__ = (
+        db.UniqueConstraint('is_adjustment', 'code', name='uq_position_aggregates_scope_code'),
+    )
+    
+    # 汇总持仓为0且持仓金额小于该值的记录会被清理
+    ZERO_COST_EPSILON = 1e-6
+    # IN 查询每批的代码数
+    QUERY_CHUNK_SIZE = 500
+    
+    id = db.Column(db.Integer, primary_key=True)
+    is_adjustment = db.Column(db.Boolean, nullable=False, default=False)
+    code = db.Column(db.String(32), nullable=False)
+    name = db.Column(db.String(100))
+    total_volume = db.Column(db.Double, nullable=False, default=0)
+    total_cost = db.Column(db.Double, nullable=False, default=0)
+
+    @staticmethod
+    def apply_strategy_change(is_adjustment, old_positions, new_positions):
+        """将单个策略新旧持仓的差额累加到汇总表（不提交事务）
+
+        Returns:
+            list: 汇总数量或金额发生变化的股票代码
+        """
+        old_summary = summarize_positions(old_positions)
+        new_summary = summarize_positions(new_positions)
+        
+        changes = []
+        for code in old_summary.keys() | new_summary.keys():
+            old_volume, old_cost, _ = old_summary.get(code, (0, 0, None))
+            new_volume, new_cost, name = new_summary.get(code, (0, 0, None))
+            delta_volume = new_volume - old_volume
+            delta_cost = new_cost - old_cost
+            if delta_volume == 0 and delta_cost == 0:
+                continue
+            changes.append({'b_code': code, 'b_name': name or None, 'dv': delta_volume, 'dc': delta_cost})
+        if not changes:
+            return []
+        changed_codes = [change['b_code'] for change in changes]
+        
+        # 汇总行以Core语句写入，不经过ORM对象和会话同步。不预先读取哪些代码已存在：
+        # 读取与写入之间其他事务可能删除了汇总为0的行，UPDATE 会匹配0行而丢失差额。
+        # 一条批量 upsert 在数据库中原子地累加到已有行或插入新行
+        table = PositionAggregate.__table__
+        rows = [{
+            'is_adjustment': is_adjustment,
+            'code': change['b_code'],
+            'name': change['b_name'],
+            'total_volume': change['dv'],
+            'total_cost': change['dc']
+        } for change in changes]
+        statement = PositionAggregate.upsert_statement()
+        if statement is not None:
+            db.session.execute(statement, rows)
+        else:
+            # 不支持 upsert 的数据库逐个代码原子加减，未匹配到行时插入
+            update = db.update(table).where(
+                table.c.is_adjustment == is_adjustment, table.c.code == db.bindparam('b_code')
+            ).values(
+                total_volume=table.c.total_volume + db.bindparam('dv'),
+                total_cost=table.c.total_cost + db.bindparam('dc'),
+                name=db.func.coalesce(db.bindparam('b_name'), table.c.name)
+            )
+            for change, row in zip(changes, rows):
+                result = db.session.execute(update, change)
+                if result.rowcount == 0:
+                    db.session.execute(db.insert(table), row)
+        
+        db.session.execute(
+            db.delete(table)
+            .where(table.c.is_adjustment == is_adjustment,
+                   table.c.code.in_(changed_codes),
+                   table.c.total_volume == 0,
+                   db.func.abs(table.c.total_cost) < PositionAggregate.ZERO_COST_EPSILON)
+        )
+        return changed_codes
+
+    @staticmethod
+    def upsert_statement():
+        """插入汇总行的语句，遇到已存在的代码时累加数量和金额；不支持 upsert 的数据库返回None"""
+        table = PositionAggregate.__table__
+        dialect = db.engine.dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            statement = insert(table)
+            return statement.on_duplicate_key_update(
+                total_volume=table.c.total_volume + statement.inserted.total_volume,
+                total_cost=table.c.total_cost + statement.inserted.total_cost,
+                name=db.func.coalesce(statement.inserted.name, table.c.name)
+            )
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(table)
+            return statement.on_conflict_do_update(
+                index_elements=[table.c.is_adjustment, table.c.code],
+                set_={
+                    'total_volume': table.c.total_volume + statement.excluded.total_volume,
+                    'total_cost': table.c.total_cost + statement.excluded.total_cost,
+                    'name': db.func.coalesce(statement.excluded.name, table.c.name)
+                }
+            )
+        return None
+
+    @staticmethod
+    def get_total_positions(include_adjustments=True, codes=None):
+        """读取汇总持仓，返回格式与 StrategyPosition.get_total_positions 一致
+
+        数量和金额来自汇总表；代码顺序和名称与按策略明细计算时相同（代码按首次出现的顺序，
+        名称取首次出现的值），由 StrategyPosition.first_occurrences 一次查询得到。
+        """
+        query = db.session.query(
+            PositionAggregate.code, PositionAggregate.name,
+            PositionAggregate.total_volume, PositionAggregate.total_cost
+        )
+        if codes is not None:
+            query = query.filter(PositionAggregate.code.in_(codes))
+        strategy_query = db.session.query(db.func.max(StrategyPosition.update_time))
+        if not include_adjustments:
+            query = query.filter(PositionAggregate.is_adjustment.is_(False))
+            strategy_query = strategy_query.filter(
+                ~StrategyPosition.strategy_name.like('ADJUSTMENT_%')
+            )
+        
+        total_positions = {}
+        for code, name, total_volume, total_cost in query:
+            if code not in total_positions:
+                total_positions[code] = {
+                    'code': code,
+                    'name': name or code,
+                    'total_volume': 0,
+                    'total_cost': 0
+                }
+            total_positions[code]['total_volume'] += total_volume
+            total_positions[code]['total_cost'] += total_cost
+        
+        positions = []
+        for pos in total_positions.values():
+            if pos['total_volume'] == 0:
+                continue
+            total_cost = pos.pop('total_cost')
+            pos['avg_cost'] = total_cost / pos['total_volume']
+            pos['total_volume'] = normalize_volume(pos['total_volume'])
+            positions.append(pos)
+        
+        if positions:
+            first = StrategyPosition.first_occurrences(None, include_adjustments, codes)
+            # 汇总表与明细不一致时（应执行 rebuild-aggregates）明细中没有的代码排在最后
+            missing = (float('inf'), 0)
+            for pos in positions:
+                occurrence = first.get(pos['code'])
+                if occurrence is not None:
+                    pos['name'] = occurrence[2] if occurrence[2] is not None else pos['code']
+            positions.sort(key=lambda pos: first.get(pos['code'], missing)[:2])
+        
+        return {
+            'positions': positions,
+            'update_time': strategy_query.scalar() or datetime(1970, 1, 1)
+        }
+
+    @staticmethod
+    def build_from_strategies():
+        """从各策略持仓明细计算汇总表应有的内容
+
+        Returns:
+            dict: {(is_adjustment, code): (volume, cost, name)}
+        """
+        expected = {}
+        strategies = StrategyPosition.query.all()
+        strategy_positions = StrategyPosition.load_positions(strategies)
+        for strategy in strategies:
+            is_adjustment = strategy.strategy_name.startswith('ADJUSTMENT_')
+            for code, (volume, cost, name) in summarize_positions(strategy_positions[strategy.id]).items():
+                old_volume, old_cost, old_name = expected.get((is_adjustment, code), (0, 0, None))
+                expected[(is_adjustment, code)] = (old_volume + volume, old_cost + cost, old_name or name)
+        return expected
+
+    @staticmethod
+    def rebuild():
+        """根据各策略持仓明细重建汇总表
+
+        Returns:
+            int: 重建后的记录数
+        """
+        expected = PositionAggregate.build_from_strategies()
+        db.session.execute(db.delete(PositionAggregate))
+        count = 0
+        for (is_adjustment, code), (volume, cost, name) in expected.items():
+            if volume == 0 and abs(cost) < PositionAggregate.ZERO_COST_EPSILON:
+                continue
+            db.session.add(PositionAggregate(
+                is_adjustment=is_adjustment,
+                code=code,
+                name=name,
+                total_volume=volume,
+                total_cost=cost
+            ))
+            count += 1
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def check_consistency(tolerance=1e-6):
+        """对比汇总表与持仓明细重新计算的结果
+
+        Returns:
+            list: 不一致的记录，每项包含 is_adjustment、code、expected、actual
+        """
+        expected = PositionAggregate.build_from_strategies()
+        actual = {
+            (row.is_adjustment, row.code): (row.total_volume, row.total_cost)
+            for row in PositionAggregate.query.all()
+        }
+        
+        mismatches = []
+        for key in expected.keys() | actual.keys():
+            expected_volume, expected_cost, _ = expected.get(key, (0, 0, None))
+            actual_volume, actual_cost = actual.get(key, (0, 0))
+            scale = max(1.0, abs(expected_cost))
+            if (abs(expected_volume - actual_volume) > tolerance or
+                    abs(expected_cost - actual_cost) > tolerance * scale):
+                mismatches.append({
+                    'is_adjustment': key[0],
+                    'code': key[1],
+                    'expected': {'total_volume': expected_volume, 'total_cost': expected_cost},
+                    'actual': {'total_volume': actual_volume, 'total_cost': actual_cost}
+                })
+        return mismatches
+
+    @staticmethod
+    def ensure_initialized():
+        """汇总表为空但已有策略持仓时（如首次升级）自动重建"""
+        if PositionAggregate.query.first() is None and StrategyPosition.query.first() is not None:
+            PositionAggregate.rebuild()
+
+
+class AuthNonce(db.Model):
+    """已使用的一次性认证令牌，用于跨进程识别重放"""
+    __tablename__ = 'auth_nonces'
+    
+    token_digest = db.Column(db.String(64), primary_key=True)
+    expire_time = db.Column(db.DateTime, index=True, nullable=False)
+
+    @staticmethod
+    def claim(token_digest, expire_at):
+        """登记令牌，令牌已被登记过时返回False"""
+        try:
+            db.session.execute(
+                db.delete(AuthNonce).where(AuthNonce.expire_time < datetime.now())
+            )
+            db.session.add(AuthNonce(
+                token_digest=token_digest,
+                expire_time=datetime.fromtimestamp(expire_at)
+            ))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
 
 class InternalPassword(db.Model):
     __tablename__ = 'internal_passwords'
     
+    # 密码哈希使用的PBKDF2迭代次数，可由配置覆盖
+    KDF_ITERATIONS = 200000
+    KDF_PREFIX = 'pbkdf2_sha256'
+    DEFAULT_PASSWORD = 'admin123'
+    
     id = db.Column(db.Integer, primary_key=True)
-    password_hash = db.Column(db.String(64), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     created_time = db.Column(db.DateTime, default=datetime.now)
     updated_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
     @staticmethod
-    def hash_password(password):
-        """对密码进行SHA256哈希"""
-        return hashlib.sha256(password.encode('utf-8')).hexdigest()
+    def hash_password(password, iterations=None):
+        """使用PBKDF2-SHA256对密码进行哈希，格式为 pbkdf2_sha256$迭代次数$盐$哈希"""
+        iterations = iterations or InternalPassword.KDF_ITERATIONS
+        salt = secrets.token_hex(16)
+        derived = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+        return f'{InternalPassword.KDF_PREFIX}${iterations}${salt}${derived.hex()}'
+    
+    @staticmethod
+    def check_hash(password, password_hash):
+        """校验密码与哈希是否匹配（常数时间比较），兼容旧版SHA256十六进制哈希"""
+        if password_hash.startswith(InternalPassword.KDF_PREFIX + '$'):
+            try:
+                _, iterations, salt, expected = password_hash.split('$')
+                derived = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'),
+                                              salt.encode('ascii'), int(iterations)).hex()
+            except ValueError:
+                return False
+        else:
+            expected = password_hash
+            derived = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        return hmac.compare_digest(derived, expected.lower())
+    
+    @staticmethod
+    def is_legacy_hash(password_hash):
+        return not password_hash.startswith(InternalPassword.KDF_PREFIX + '$')
     
     @staticmethod
     def set_password(password):
@@ -178,20 +1282,51 @@ class InternalPassword(db.Model):
             new_password = InternalPassword(password_hash=password_hash)
             db.session.add(new_password)
         
+        # 通知所有进程重新加载密码
+        DataVersion.bump(DataVersion.INTERNAL_PASSWORD)
         db.session.commit()
+        password_verifier.invalidate()
     
     @staticmethod
     def verify_password(password):
-        """验证密码"""
-        password_hash = InternalPassword.hash_password(password)
+        """验证密码（使用进程内缓存的校验器）"""
+        return password_verifier.verify(password)
+    
+    @staticmethod
+    def upgrade_legacy_hash(password):
+        """旧版SHA256哈希验证通过后升级为PBKDF2哈希，不改变密码本身，无需通知其他进程"""
         existing = InternalPassword.query.first()
+        if existing and InternalPassword.is_legacy_hash(existing.password_hash) \
+                and InternalPassword.check_hash(password, existing.password_hash):
+            db.session.execute(
+                db.update(InternalPassword)
+                .where(InternalPassword.id == existing.id)
+                .values(password_hash=InternalPassword.hash_password(password),
+                        updated_time=InternalPassword.updated_time)
+            )
+            db.session.commit()
+            db.session.expire(existing)
+    
+    @staticmethod
+    def migrate_schema():
+        """旧版 password_hash 列为 VARCHAR(64)，放宽以容纳PBKDF2哈希"""
+        inspector = db.inspect(db.engine)
+        columns = {column['name']: column for column in inspector.get_columns(InternalPassword.__tablename__)}
+        length = getattr(columns.get('password_hash', {}).get('type'), 'length', None)
+        if length is None or length >= 255:
+            return False
         
-        if not existing:
-            # 如果没有设置密码，使用默认密码 "admin123"
-            default_hash = InternalPassword.hash_password("admin123")
-            return password_hash == default_hash
-        
-        return existing.password_hash == password_hash
+        dialect = db.engine.dialect.name
+        if dialect == 'mysql':
+            statement = 'ALTER TABLE internal_passwords MODIFY password_hash VARCHAR(255) NOT NULL'
+        elif dialect == 'postgresql':
+            statement = 'ALTER TABLE internal_passwords ALTER COLUMN password_hash TYPE VARCHAR(255)'
+        else:
+            # SQLite 不限制 VARCHAR 长度
+            return False
+        with db.engine.begin() as connection:
+            connection.execute(db.text(statement))
+        return True
     
     @staticmethod
     def get_current_password_info():
@@ -209,3 +1344,76 @@ class InternalPassword(db.Model):
                 'default_password': 'admin123',
                 'message': '使用默认密码，建议通过数据库修改'
             }
+
+
+class InternalPasswordVerifier:
+    """进程内缓存的内部密码校验器
+
+    密码哈希只在共享数据版本号变化时从数据库重新加载，版本号最多每 check_interval 秒检查一次。
+    验证通过的密码以进程随机密钥的HMAC形式记住，之后的请求无需再付出PBKDF2的计算成本；
+    错误密码每次都要完整计算哈希。
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._process_key = secrets.token_bytes(32)
+        self._version = None
+        self._password_hash = None
+        self._accepted = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """丢弃缓存，下次验证时重新加载"""
+        with self._lock:
+            self._version = None
+            self._accepted = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+        
+        version = DataVersion.get(DataVersion.INTERNAL_PASSWORD)
+        with self._lock:
+            if version == self._version:
+                self._checked_at = now
+                return
+        
+        existing = InternalPassword.query.first()
+        if existing:
+            password_hash = existing.password_hash
+        else:
+            # 如果没有设置密码，使用默认密码 "admin123"
+            password_hash = InternalPassword.hash_password(InternalPassword.DEFAULT_PASSWORD)
+        with self._lock:
+            self._version = version
+            self._password_hash = password_hash
+            self._accepted = None
+            self._checked_at = now
+
+    def verify(self, password):
+        """验证密码"""
+        self._refresh()
+        with self._lock:
+            version = self._version
+            password_hash = self._password_hash
+            accepted = self._accepted
+        
+        tag = hmac.new(self._process_key, password.encode('utf-8'), hashlib.sha256).digest()
+        if accepted is not None and hmac.compare_digest(tag, accepted):
+            return True
+        
+        if not InternalPassword.check_hash(password, password_hash):
+            return False
+        
+        with self._lock:
+            if self._version == version:
+                self._accepted = tag
+        if InternalPassword.is_legacy_hash(password_hash):
+            InternalPassword.upgrade_legacy_hash(password)
+        return True
+
+
+password_verifier = InternalPasswordVerifier()
@@ -0,0 +1,185 @@
+"""持仓上传数据校验
+
+校验器按策略类型（普通策略/ADJUSTMENT_ 调整策略）和选项预先生成并缓存，每次上传只遍历一次持仓列表，
+收集全部错误（带行号）后一次性抛出 PositionValidationError，而不是遇到第一个错误就停止。
+
+- 普通策略 : 持仓数量为非负数，成本价为正数
+- 调整策略 : 持仓数量和成本价可以为负数
+- 数量和成本价必须是有限的数字（不接受布尔值、NaN、Infinity）
+- 重复代码 : merge 时由写入逻辑合并（数量相加、成本按数量加权），reject 时作为错误返回
+- 数值规范化 : 开启后接受数字字符串（如 "100"），整数值的浮点数量还原为整数
+"""
+ADJUSTMENT_PREFIX = 'ADJUSTMENT_'
+
+# 重复代码的处理方式
+DUPLICATES_MERGE = 'merge'
+DUPLICATES_REJECT = 'reject'
+
+# 默认选项（在app.py中按配置设置）
+default_normalize = False
+default_duplicates = DUPLICATES_MERGE
+
+# 异常信息中最多列出的错误数，完整列表见 PositionValidationError.errors
+MESSAGE_ERROR_LIMIT = 10
+
+_NUMBER_TYPES = frozenset([int, float])
+_MISSING = object()
+
+
+def format_error(error):
+    location = ''
+    if error.get('item') is not None:
+        location += f"第{error['item'] + 1}项"
+        if error.get('strategy_name') is not None:
+            location += f"（{error['strategy_name']}）"
+    if error['index'] is not None:
+        location += f"第{error['index'] + 1}行"
+    return f"{location}: {error['message']}" if location else error['message']
+
+
+class PositionValidationError(ValueError):
+    """持仓数据校验失败
+
+    errors 为全部错误 [{'index': 持仓行号(从0开始，整体错误为None), 'field', 'message'}]，
+    批量更新时还带有 'item'（批量项序号，从0开始）和 'strategy_name'
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        details = '; '.join(format_error(error) for error in errors[:MESSAGE_ERROR_LIMIT])
+        if len(errors) > MESSAGE_ERROR_LIMIT:
+            details += f' ...（共{len(errors)}处错误）'
+        super().__init__(details)
+
+
+def _error(index, field, message):
+    return {'index': index, 'field': field, 'message': message}
+
+
+def _parse_number(value):
+    """规范化模式下把数字字符串转换为数字，无法转换时原样返回"""
+    if type(value) is not str:
+        return value
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            continue
+    return value
+
+
+class PositionValidator:
+    """预先生成的单次遍历校验器，通过 validator_for 获取"""
+
+    def __init__(self, allow_negative=False, normalize=False, duplicates=DUPLICATES_MERGE):
+        if duplicates not in (DUPLICATES_MERGE, DUPLICATES_REJECT):
+            raise ValueError(f"不支持的重复代码处理方式: {duplicates}")
+        self.allow_negative = allow_negative
+        self.normalize = normalize
+        self.duplicates = duplicates
+        if allow_negative:
+            self.volume_message = "持仓数量必须为数字"
+            self.cost_message = "成本价必须为数字"
+        else:
+            self.volume_message = "持仓数量必须为非负数"
+            self.cost_message = "成本价必须为正数"
+
+    def validate(self, positions):
+        """校验持仓列表
+
+        Returns:
+            list: 校验通过的持仓列表，开启规范化时为规范化后的副本，否则为原列表
+
+        Raises:
+            PositionValidationError: 包含全部错误
+        """
+        if type(positions) is not list:
+            raise PositionValidationError([_error(None, None, "持仓数据必须为列表类型")])
+
+        # 热路径只使用局部变量
+        allow_negative = self.allow_negative
+        normalize = self.normalize
+        reject_duplicates = self.duplicates == DUPLICATES_REJECT
+        number_types = _NUMBER_TYPES
+        missing = _MISSING
+        volume_message = self.volume_message
+        cost_message = self.cost_message
+        first_rows = {}
+        errors = []
+        normalized = [] if normalize else None
+
+        for index, pos in enumerate(positions):
+            if type(pos) is not dict:
+                errors.append(_error(index, None, "持仓数据的每个元素必须为字典类型"))
+                continue
+            code = pos.get('code', missing)
+            volume = pos.get('volume', missing)
+            cost = pos.get('cost', missing)
+            if code is missing or volume is missing or cost is missing:
+                absent = [field for field, value in (('code', code), ('volume', volume), ('cost', cost))
+                          if value is missing]
+                errors.append(_error(index, ','.join(absent), f"持仓数据缺少必需字段: {','.join(absent)}"))
+                continue
+            if normalize:
+                volume = _parse_number(volume)
+                cost = _parse_number(cost)
+
+            if type(code) is not str or not code:
+                errors.append(_error(index, 'code', "股票代码必须为非空字符串"))
+            elif code in first_rows:
+                if reject_duplicates:
+                    errors.append(_error(index, 'code', f"股票代码 {code} 与第{first_rows[code] + 1}行重复"))
+            else:
+                first_rows[code] = index
+
+            # x - x 对有限数字为0，对NaN和Infinity为NaN，比 math.isfinite 更快且不会因超大整数溢出
+            if type(volume) not in number_types or volume - volume != 0 or (not allow_negative and volume < 0):
+                errors.append(_error(index, 'volume', volume_message))
+            if type(cost) not in number_types or cost - cost != 0 or (not allow_negative and cost <= 0):
+                errors.append(_error(index, 'cost', cost_message))
+
+            name = pos.get('name', missing)
+            if name is not missing and type(name) is not str:
+                errors.append(_error(index, 'name', "股票名称必须为字符串类型"))
+
+            if normalize:
+                if type(volume) is float and volume.is_integer():
+                    volume = int(volume)
+                item = {'code': code, 'volume': volume, 'cost': cost}
+                if name is not missing:
+                    item['name'] = name
+                normalized.append(item)
+
+        if errors:
+            raise PositionValidationError(errors)
+        return normalized if normalize else positions
+
+
+_validators = {}
+
+
+def is_adjustment_strategy(strategy_name):
+    return strategy_name.startswith(ADJUSTMENT_PREFIX)
+
+
+def validator_for(strategy_name, normalize=None, duplicates=None):
+    """按策略类型和选项获取缓存的校验器，None 表示使用默认选项"""
+    key = (
+        is_adjustment_strategy(strategy_name),
+        default_normalize if normalize is None else normalize,
+        duplicates or default_duplicates
+    )
+    validator = _validators.get(key)
+    if validator is None:
+        validator = _validators[key] = PositionValidator(*key)
+    return validator
+
+
+def validate_strategy_name(strategy_name):
+    if not strategy_name or type(strategy_name) is not str:
+        raise PositionValidationError([_error(None, 'strategy_name', "策略名称不能为空且必须为字符串类型")])
+
+
+def validate_positions(strategy_name, positions, normalize=None, duplicates=None):
+    """校验策略名称和持仓列表，返回（可能规范化后的）持仓列表，失败时抛出 PositionValidationError"""
+    validate_strategy_name(strategy_name)
+    return validator_for(strategy_name, normalize, duplicates).validate(positions)
@@ -0,0 +1,94 @@
+"""持仓接口的响应格式
+
+- json     : 默认格式，每行持仓是一个对象
+- columnar : 列式JSON，持仓表以 {列名: [值, ...]} 的平行数组表示，不再每行重复键名
+- msgpack  : 与 columnar 结构相同的 MessagePack 二进制编码（需要安装 msgpack）
+
+客户端通过 format 查询参数或 Accept 请求头选择格式。
+"""
+import time
+
+from flask import current_app, request
+
+from middleware.metrics import record_phase
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'json'
+COLUMNAR = 'columnar'
+MSGPACK = 'msgpack'
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.jq2qmt.columnar+json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+TOTAL_POSITION_COLUMNS = ['code', 'name', 'total_volume', 'avg_cost']
+STRATEGY_POSITION_COLUMNS = ['code', 'name', 'volume', 'cost']
+
+
+def available_formats():
+    formats = {JSON_MIMETYPE: JSON, COLUMNAR_MIMETYPE: COLUMNAR}
+    if msgpack is not None:
+        formats[MSGPACK_MIMETYPE] = MSGPACK
+    return formats
+
+
+def negotiate_format():
+    """按 format 参数或 Accept 请求头选择响应格式，不支持的 format 参数返回None"""
+    formats = available_formats()
+    requested = request.args.get('format')
+    if requested:
+        return requested if requested in formats.values() else None
+    mimetype = request.accept_mimetypes.best_match(list(formats), default=JSON_MIMETYPE)
+    return formats[mimetype]
+
+
+def to_columns(rows, columns):
+    """行列表转换为 {列名: [值, ...]}"""
+    return {column: [row.get(column) for row in rows] for column in columns}
+
+
+def mimetype_for(fmt):
+    """格式对应的 Content-Type，客户端和缓存据此区分逐行JSON和列式JSON"""
+    return {JSON: JSON_MIMETYPE, COLUMNAR: COLUMNAR_MIMETYPE, MSGPACK: MSGPACK_MIMETYPE}[fmt]
+
+
+def dumps(payload, fmt):
+    """序列化响应体
+
+    Returns:
+        tuple: (响应体, mimetype)
+    """
+    if fmt == MSGPACK:
+        started = time.perf_counter()
+        body = msgpack.packb(payload, use_bin_type=True)
+        record_phase('serialization', time.perf_counter() - started)
+        return body, MSGPACK_MIMETYPE
+    return current_app.json.dumps(payload) + '\n', mimetype_for(fmt)
+
+
+def iter_json_object(array_key, items, extra=None, chunk_size=64 * 1024):
+    """流式生成JSON对象：array_key 对应的数组由 items 逐项序列化，extra 为其余字段
+
+    输出攒够 chunk_size 个字符后才产出一次，避免大量细小的写入。
+    """
+    encode = current_app.json.dumps
+    buffer = ['{', encode(array_key), ':[']
+    size = 0
+    for index, item in enumerate(items):
+        text = encode(item)
+        if index:
+            buffer.append(',')
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    buffer.append(']')
+    for key, value in (extra or {}).items():
+        buffer.append(f',{encode(key)}:{encode(value)}')
+    buffer.append('}\n')
+    yield ''.join(buffer)
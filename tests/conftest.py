@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+# 服务端代码在 src 下按顶层模块导入（models、auth 等）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.models import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """只初始化数据库的最小应用（不加载 config.py 和密钥），使用内存SQLite"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
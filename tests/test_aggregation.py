@@ -0,0 +1,148 @@
+import pytest
+
+import models.aggregation as aggregation
+from models.models import PositionAggregate, StrategyPosition
+
+# 写入顺序即策略id顺序。构造的数据让“按首次出现排序、取首次出现的名称”
+# 与“按代码排序、取最大名称”得到不同的结果
+STRATEGIES = [
+    ('alpha', [
+        {'code': '600519.XSHG', 'name': '贵州茅台', 'volume': 100, 'cost': 1500.5},
+        {'code': '000001.XSHE', 'volume': 1000, 'cost': 10.25},
+        {'code': '300750.XSHE', 'name': '宁德时代', 'volume': 200, 'cost': 180.0},
+        {'code': '000858.XSHE', 'name': '五粮液', 'volume': 300, 'cost': 150.0},
+    ]),
+    ('beta', [
+        {'code': '000001.XSHE', 'name': '平安银行', 'volume': 500, 'cost': 11.5},
+        {'code': '600519.XSHG', 'name': '茅台', 'volume': 50, 'cost': 1600.0},
+        {'code': '002415.XSHE', 'name': '海康威视', 'volume': 0.5, 'cost': 30.0},
+    ]),
+    ('gamma', [
+        {'code': '002415.XSHE', 'name': '海康威视', 'volume': 0.5, 'cost': 32.0},
+        {'code': '601318.XSHG', 'name': '中国平安', 'volume': 400, 'cost': 45.0},
+    ]),
+    # 调整策略把 000858 和 300750 调为0，这两个分组必须被过滤掉
+    ('ADJUSTMENT_manual', [
+        {'code': '000858.XSHE', 'name': '五粮液', 'volume': -300, 'cost': 150.0},
+        {'code': '300750.XSHE', 'name': '宁德时代', 'volume': -200, 'cost': 175.0},
+        {'code': '601318.XSHG', 'name': '中国平安', 'volume': -100, 'cost': 44.0},
+    ]),
+]
+
+ENGINES = [aggregation.PYTHON, aggregation.NUMPY, aggregation.SQL]
+
+SCOPES = [
+    pytest.param({}, id='all'),
+    pytest.param({'include_adjustments': False}, id='no_adjustments'),
+    pytest.param({'strategy_names': ['beta', 'alpha', 'ADJUSTMENT_manual']}, id='strategies'),
+    pytest.param({'strategy_names': ['alpha', 'ADJUSTMENT_manual']}, id='strategies_net_zero'),
+    pytest.param({'codes': ['000858.XSHE', '600519.XSHG', '601318.XSHG']}, id='codes'),
+    pytest.param({'strategy_names': ['gamma'], 'codes': ['000001.XSHE']}, id='empty'),
+]
+
+
+@pytest.fixture
+def positions(app):
+    for strategy_name, strategy_positions in STRATEGIES:
+        StrategyPosition.update_positions(strategy_name, strategy_positions)
+
+
+def engine_param(engine):
+    if engine == aggregation.NUMPY and aggregation.np is None:
+        return pytest.param(engine, marks=pytest.mark.skip(reason='未安装NumPy'))
+    return engine
+
+
+def compute(engine, scope):
+    return StrategyPosition.compute_total_positions(
+        scope.get('strategy_names'), scope.get('include_adjustments', True), scope.get('codes'), engine=engine
+    )
+
+
+def assert_same_positions(result, expected):
+    assert [pos['code'] for pos in result] == [pos['code'] for pos in expected]
+    for pos, reference in zip(result, expected):
+        assert pos['name'] == reference['name']
+        assert pos['total_volume'] == reference['total_volume']
+        assert pos['avg_cost'] == pytest.approx(reference['avg_cost'])
+
+
+@pytest.mark.parametrize('scope', SCOPES)
+@pytest.mark.parametrize('engine', [engine_param(engine) for engine in ENGINES])
+def test_engines_match_python(positions, engine, scope):
+    expected = compute(aggregation.PYTHON, scope)
+    result = compute(engine, scope)
+    assert_same_positions(result['positions'], expected['positions'])
+    assert result['update_time'] == expected['update_time']
+
+
+@pytest.mark.parametrize('scope', [
+    pytest.param({}, id='all'),
+    pytest.param({'include_adjustments': False}, id='no_adjustments'),
+    pytest.param({'codes': ['000858.XSHE', '600519.XSHG', '601318.XSHG']}, id='codes'),
+])
+def test_aggregate_table_matches_python(positions, scope):
+    """未指定策略时 /total 读取汇总表，代码顺序和名称必须与按明细计算相同"""
+    expected = compute(aggregation.PYTHON, scope)
+    result = PositionAggregate.get_total_positions(scope.get('include_adjustments', True), scope.get('codes'))
+    assert_same_positions(result['positions'], expected['positions'])
+    assert result['update_time'] == expected['update_time']
+
+
+def test_aggregate_table_order_follows_first_strategy(app):
+    # 第一个策略的持仓顺序与代码顺序相反，名称也与后面的策略不同
+    StrategyPosition.update_positions('s1', [
+        {'code': 'B', 'name': 'bb', 'volume': 100, 'cost': 1.0},
+        {'code': 'A', 'name': 'A', 'volume': 100, 'cost': 1.0},
+    ])
+    StrategyPosition.update_positions('s2', [
+        {'code': 'A', 'name': 'aa', 'volume': 100, 'cost': 2.0},
+        {'code': 'C', 'name': 'cc', 'volume': 100, 'cost': 2.0},
+    ])
+    result = StrategyPosition.get_total_positions()['positions']
+    assert [(pos['code'], pos['name']) for pos in result] == [('B', 'bb'), ('A', 'A'), ('C', 'cc')]
+    assert_same_positions(result, compute(aggregation.PYTHON, {'strategy_names': ['s1', 's2']})['positions'])
+
+    # 第一个策略清仓后，名称和顺序改由下一个持有该代码的策略决定
+    StrategyPosition.update_positions('s1', [{'code': 'B', 'name': 'bb', 'volume': 100, 'cost': 1.0}])
+    result = StrategyPosition.get_total_positions()['positions']
+    assert [(pos['code'], pos['name']) for pos in result] == [('B', 'bb'), ('A', 'aa'), ('C', 'cc')]
+
+
+def test_python_semantics(positions):
+    result = compute(aggregation.PYTHON, {})['positions']
+    assert [pos['code'] for pos in result] == ['600519.XSHG', '000001.XSHE', '002415.XSHE', '601318.XSHG']
+    by_code = {pos['code']: pos for pos in result}
+    # 名称取首次出现的值，首次出现没有名称时用代码
+    assert by_code['600519.XSHG']['name'] == '贵州茅台'
+    assert by_code['000001.XSHE']['name'] == '000001.XSHE'
+    assert by_code['000001.XSHE']['total_volume'] == 1500
+    assert by_code['000001.XSHE']['avg_cost'] == pytest.approx((1000 * 10.25 + 500 * 11.5) / 1500)
+    assert by_code['601318.XSHG']['total_volume'] == 300
+
+
+@pytest.mark.parametrize('engine', [engine_param(engine) for engine in ENGINES])
+def test_net_zero_groups_are_dropped(positions, engine):
+    result = compute(engine, {'codes': ['000858.XSHE', '300750.XSHE']})
+    assert result['positions'] == []
+
+
+def test_auto_uses_sql_on_sqlite(app):
+    assert aggregation.resolve_engine(aggregation.AUTO, 'sqlite') == aggregation.SQL
+    assert aggregation.resolve_engine(aggregation.AUTO, 'oracle') in (aggregation.NUMPY, aggregation.PYTHON)
+    with pytest.raises(ValueError):
+        aggregation.resolve_engine(aggregation.SQL, 'oracle')
+
+
+def test_aggregate_positions_columns():
+    codes = ['B', 'A', 'B', 'C', 'C']
+    names = [None, '甲', '乙', '丙', '丁']
+    volumes = [100, 200, 0.5, 10, -10]
+    costs = [1.0, 2.0, 3.0, 4.0, 5.0]
+    expected = [
+        {'code': 'B', 'name': 'B', 'total_volume': 100.5, 'avg_cost': (100 + 1.5) / 100.5},
+        {'code': 'A', 'name': '甲', 'total_volume': 200, 'avg_cost': 2.0},
+    ]
+    assert aggregation.aggregate_python(codes, names, volumes, costs) == expected
+    if aggregation.np is not None:
+        assert aggregation.aggregate_numpy(codes, names, volumes, costs) == expected
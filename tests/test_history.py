@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models.models import db, PositionHistory, StrategyPosition
+
+
+def by_code(positions):
+    return sorted(positions, key=lambda pos: pos['code'])
+
+
+@pytest.fixture
+def history(app, monkeypatch):
+    """多个策略交替修改持仓，检查点间隔设为3，返回每次修改后的时间点和各策略当时的持仓"""
+    monkeypatch.setattr(PositionHistory, 'CHECKPOINT_INTERVAL', 3)
+    snapshots = []
+    current = {}
+    for step in range(8):
+        for index in range(4):
+            name = f'S{index}'
+            if step < index:
+                # 后面的策略较晚创建
+                continue
+            positions = [
+                {'code': f'{code:06d}.XSHE', 'name': f'N{code}', 'volume': 100 * (step + 1), 'cost': 1.0 + code}
+                for code in range(step % 3, step % 3 + index + 2)
+            ]
+            StrategyPosition.update_positions(name, positions)
+            current[name] = positions
+            snapshots.append((datetime.now(), {name: list(value) for name, value in current.items()}))
+    return snapshots
+
+
+def count_queries():
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_positions_as_of_replays_every_snapshot(history):
+    strategies = StrategyPosition.query.order_by(StrategyPosition.id).all()
+    for as_of, expected in history:
+        states = PositionHistory.positions_as_of(strategies, as_of)
+        for strategy in strategies:
+            state = states[strategy.strategy_name]
+            if strategy.strategy_name in expected:
+                assert by_code(state['positions']) == by_code(expected[strategy.strategy_name])
+                assert state['update_time'] <= as_of
+            else:
+                assert state == {'positions': [], 'update_time': None, 'version': 0}
+
+
+def test_positions_as_of_query_count_is_constant(history):
+    strategies = StrategyPosition.query.order_by(StrategyPosition.id).all()
+    as_of = history[-1][0]
+    statements = count_queries()
+    PositionHistory.positions_as_of(strategies[:1], as_of)
+    single = len(statements)
+    del statements[:]
+    PositionHistory.positions_as_of(strategies, as_of)
+    assert len(statements) == single == 1
+
+    # 部分策略在该时间点之前没有记录时，只多一次查询
+    del statements[:]
+    states = PositionHistory.positions_as_of(strategies, history[0][0])
+    assert len(statements) == 2
+    assert [name for name, state in states.items() if state['positions']] == ['S0']
+
+
+def test_positions_as_of_without_history(history):
+    strategies = StrategyPosition.query.order_by(StrategyPosition.id).all()
+    PositionHistory.query.filter_by(strategy_name='S1').delete()
+    db.session.commit()
+    before = history[0][0] - timedelta(days=1)
+    states = PositionHistory.positions_as_of(strategies, before)
+    # 没有历史的策略：最后一次修改晚于该时间点时无法重建
+    assert states['S1'] is None
+    assert states['S0'] == {'positions': [], 'update_time': None, 'version': 0}
+    states = PositionHistory.positions_as_of(strategies, history[-1][0])
+    assert by_code(states['S1']['positions']) == by_code(history[-1][1]['S1'])
@@ -0,0 +1,117 @@
+import pytest
+
+from models.models import PositionAggregate, PositionItem, StaleVersionError, StrategyPosition
+
+
+@pytest.fixture(params=['upsert', 'update_fallback'])
+def store(app, request, monkeypatch):
+    """汇总表分别使用方言 upsert 和通用的 UPDATE + 按行数插入两种写法"""
+    if request.param == 'update_fallback':
+        monkeypatch.setattr(PositionAggregate, 'upsert_statement', staticmethod(lambda: None))
+    return app
+
+
+def pos(code, volume, cost, name=None):
+    position = {'code': code, 'volume': volume, 'cost': cost}
+    if name is not None:
+        position['name'] = name
+    return position
+
+
+def aggregate_rows():
+    return {
+        (row.is_adjustment, row.code): (row.total_volume, row.total_cost)
+        for row in PositionAggregate.query
+    }
+
+
+def strategy_version(strategy_name):
+    return StrategyPosition.query.filter_by(strategy_name=strategy_name).one().version
+
+
+def test_aggregate_consistent_after_mixed_updates(store):
+    StrategyPosition.update_positions('alpha', [
+        pos('000001.XSHE', 1000, 10.0, '平安银行'),
+        pos('600519.XSHG', 100, 1500.0, '贵州茅台'),
+        pos('300750.XSHE', 200, 180.0),
+    ])
+    StrategyPosition.update_positions_batch([
+        {'strategy_name': 'beta', 'positions': [pos('000001.XSHE', 500, 11.0), pos('002415.XSHE', 300, 30.0)]},
+        {'strategy_name': 'ADJUSTMENT_manual', 'positions': [pos('600519.XSHG', -40, 1400.0)]},
+    ])
+    StrategyPosition.patch_positions('alpha', [pos('600519.XSHG', 150, 1550.0)], ['300750.XSHE'])
+    StrategyPosition.patch_positions('beta', [pos('601318.XSHG', 400, 45.0)], ['002415.XSHE'],
+                                     base_version=strategy_version('beta'))
+    StrategyPosition.update_positions('alpha', [pos('000001.XSHE', 800, 10.0), pos('600519.XSHG', 150, 1550.0)])
+    StrategyPosition.update_positions_batch([
+        {'strategy_name': 'beta', 'positions': [pos('000001.XSHE', 500, 11.0), pos('601318.XSHG', 100, 46.0)]},
+        {'strategy_name': 'gamma', 'positions': [pos('300750.XSHE', 50, 175.0)]},
+    ])
+
+    assert PositionAggregate.check_consistency() == []
+    assert aggregate_rows() == {
+        (False, '000001.XSHE'): (1300, 800 * 10.0 + 500 * 11.0),
+        (False, '600519.XSHG'): (150, 150 * 1550.0),
+        (False, '601318.XSHG'): (100, 100 * 46.0),
+        (False, '300750.XSHE'): (50, 50 * 175.0),
+        (True, '600519.XSHG'): (-40, -40 * 1400.0),
+    }
+
+
+def test_stale_delta_leaves_aggregate_unchanged(store):
+    StrategyPosition.update_positions('alpha', [pos('000001.XSHE', 1000, 10.0)])
+    base_version = strategy_version('alpha')
+    StrategyPosition.patch_positions('alpha', [pos('000002.XSHE', 100, 5.0)])
+    before = aggregate_rows()
+    with pytest.raises(StaleVersionError):
+        StrategyPosition.patch_positions('alpha', [pos('000003.XSHE', 100, 5.0)], base_version=base_version)
+    assert aggregate_rows() == before
+    assert PositionAggregate.check_consistency() == []
+
+
+def test_sell_out_deletes_aggregate_row(store):
+    StrategyPosition.update_positions('alpha', [pos('000001.XSHE', 1000, 10.0), pos('600519.XSHG', 100, 1500.0)])
+    StrategyPosition.update_positions('beta', [pos('600519.XSHG', 50, 1600.0)])
+
+    # 一个策略清仓，另一个策略仍持有：汇总行保留
+    StrategyPosition.patch_positions('alpha', [], ['600519.XSHG'])
+    assert aggregate_rows()[(False, '600519.XSHG')] == (50, 50 * 1600.0)
+
+    # 全部清仓：汇总行和持仓行都被删除，不留下数量为0的记录
+    StrategyPosition.update_positions('beta', [])
+    StrategyPosition.update_positions('alpha', [pos('000001.XSHE', 1000, 10.0)])
+    assert set(aggregate_rows()) == {(False, '000001.XSHE')}
+    assert PositionItem.query.filter_by(code='600519.XSHG').count() == 0
+    assert [p['code'] for p in StrategyPosition.get_total_positions()['positions']] == ['000001.XSHE']
+
+    # 清仓后重新买入
+    StrategyPosition.update_positions('beta', [pos('600519.XSHG', 10, 1700.0)])
+    assert aggregate_rows()[(False, '600519.XSHG')] == (10, 10 * 1700.0)
+    assert PositionAggregate.check_consistency() == []
+
+
+def test_adjustment_strategies_sum_negative_volumes(store):
+    StrategyPosition.update_positions('alpha', [pos('000001.XSHE', 1000, 10.0), pos('600519.XSHG', 100, 1500.0)])
+    StrategyPosition.update_positions('ADJUSTMENT_a', [pos('000001.XSHE', -300, 9.0), pos('000858.XSHE', -100, 150.0)])
+    StrategyPosition.update_positions('ADJUSTMENT_b', [pos('000001.XSHE', 100, 12.0), pos('600519.XSHG', -100, 1500.0)])
+
+    assert aggregate_rows() == {
+        (False, '000001.XSHE'): (1000, 10000.0),
+        (False, '600519.XSHG'): (100, 150000.0),
+        (True, '000001.XSHE'): (-200, -300 * 9.0 + 100 * 12.0),
+        (True, '000858.XSHE'): (-100, -15000.0),
+        (True, '600519.XSHG'): (-100, -150000.0),
+    }
+    totals = {p['code']: p for p in StrategyPosition.get_total_positions()['positions']}
+    # 600519 被调整策略抵消为0，不出现在汇总持仓中；只有调整策略持有的代码以负数出现
+    assert set(totals) == {'000001.XSHE', '000858.XSHE'}
+    assert totals['000001.XSHE']['total_volume'] == 800
+    assert totals['000001.XSHE']['avg_cost'] == pytest.approx((10000.0 - 2700.0 + 1200.0) / 800)
+    assert totals['000858.XSHE']['total_volume'] == -100
+    excluded = StrategyPosition.get_total_positions(include_adjustments=False)['positions']
+    assert [(p['code'], p['total_volume']) for p in excluded] == [('000001.XSHE', 1000), ('600519.XSHG', 100)]
+
+    # 调整策略部分撤销后仍一致，撤销为0的代码删除调整汇总行
+    StrategyPosition.patch_positions('ADJUSTMENT_b', [], ['600519.XSHG'])
+    assert (True, '600519.XSHG') not in aggregate_rows()
+    assert PositionAggregate.check_consistency() == []